@@ -0,0 +1,86 @@
+'''
+Benchmark `transforms.aggregate_sub_locations` against the groupby-apply
+implementation it replaced in `load_agg_transform_ilinet`, on synthetic data
+with a configurable number of sub-locations per state.
+
+Run with `code/data-pipeline` as the working directory:
+python benchmarks/bench_aggregate_sub_locations.py --sub_locations 1 2 10
+'''
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_pipeline import transforms
+from data_pipeline.loader import FluDataLoader
+
+
+def legacy_aggregate(df, fips_mappings):
+  return df \
+    .merge(
+      fips_mappings.rename(columns={'location': 'fips'}),
+      left_on='state',
+      right_on='location_name') \
+    .groupby(['state', 'fips', 'season', 'season_week', 'wk_end_date', 'source']) \
+    .apply(lambda x: pd.DataFrame({'inc': [np.mean(x['inc'])]})) \
+    .reset_index() \
+    .drop(columns = ['state', 'level_6']) \
+    .rename(columns = {'fips': 'location'}) \
+    .assign(agg_level = 'state')
+
+
+def make_data(fips_mappings, n_sub_locations, n_weeks, rng):
+  states = fips_mappings.query("location != 'US'")['location_name'].values
+  sub_locations = [f'{s} - site {i}' for s in states for i in range(n_sub_locations)]
+  aliases = {f'{s} - site {i}': s for s in states for i in range(n_sub_locations)}
+  wk_end_date = pd.date_range('2010-10-09', periods=n_weeks, freq='W-SAT')
+  df = pd.DataFrame({
+    'location': np.repeat(sub_locations, n_weeks),
+    'state': np.repeat([aliases[s] for s in sub_locations], n_weeks),
+    'season': '2010/11',
+    'season_week': np.tile(np.arange(n_weeks) + 10, len(sub_locations)),
+    'wk_end_date': np.tile(wk_end_date, len(sub_locations)),
+    'inc': rng.gamma(2.0, size=n_weeks * len(sub_locations)),
+    'source': 'ilinet'
+  })
+  return df, aliases
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark sub-location aggregation')
+  parser.add_argument('--data_raw', default='../../data-raw')
+  parser.add_argument('--sub_locations', type=int, nargs='+', default=[1, 2, 10])
+  parser.add_argument('--n_weeks', type=int, default=700)
+  args = parser.parse_args()
+  
+  fips_mappings = FluDataLoader(args.data_raw).load_fips_mappings()
+  rng = np.random.default_rng(42)
+  results = []
+  for n_sub_locations in args.sub_locations:
+    df, aliases = make_data(fips_mappings, n_sub_locations, args.n_weeks, rng)
+    location_index = transforms.build_location_index(fips_mappings, aliases=aliases)
+    
+    start = time.perf_counter()
+    expected = legacy_aggregate(df, fips_mappings)
+    legacy_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    actual = transforms.aggregate_sub_locations(df, location_index)
+    vectorized_seconds = time.perf_counter() - start
+    
+    pd.testing.assert_frame_equal(
+      actual.sort_values(['location', 'wk_end_date']).reset_index(drop=True),
+      expected[actual.columns].sort_values(['location', 'wk_end_date']).reset_index(drop=True))
+    
+    results.append({'n_rows': len(df), 'n_sub_locations': n_sub_locations,
+                    'legacy_seconds': legacy_seconds, 'vectorized_seconds': vectorized_seconds,
+                    'speedup': legacy_seconds / vectorized_seconds})
+  
+  print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,170 @@
+'''
+Benchmark `FluDataLoader.load_data` for each combination of sources and
+several sets of keyword arguments, on synthetic `data-raw` directories with
+multiples of the real number of locations (see `synthetic_data_raw.py`).
+
+Results are written as json, with one record per case, so that runs on
+different commits can be compared.
+
+Run with `code/data-pipeline` as the working directory:
+python benchmarks/bench_load_data.py --location_multiples 1 10 --output bench-load-data.json
+python benchmarks/bench_load_data.py --compare bench-before.json bench-after.json
+'''
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_pipeline.loader import FluDataLoader
+from synthetic_data_raw import LAST_WK_END_DATE, make_data_raw
+
+
+SOURCES = ['flusurvnet', 'hhs', 'ilinet']
+
+KWARGS_SETS = {
+  'default': {},
+  'fill_missing_weeks': {'fill_missing_weeks': True},
+  'no_reporting_adj': {'ilinet_kwargs': {'scale_to_positive': False},
+                       'flusurvnet_kwargs': {'burden_adj': False}},
+  'hhs_as_of': {'hhs_kwargs': {'as_of': str(LAST_WK_END_DATE - datetime.timedelta(days=24))}},
+  'sqrt_compact': {'power_transform': 'sqrt', 'compact': True}
+}
+
+
+def source_combinations():
+  return [list(c) for n in range(1, len(SOURCES) + 1) for c in combinations(SOURCES, n)]
+
+
+def time_call(fn, repeats):
+  # wall times of `repeats` calls, each with a new loader so that no memoized
+  # tables are reused between calls
+  seconds = []
+  for _ in range(repeats):
+    start = time.perf_counter()
+    result = fn()
+    seconds.append(time.perf_counter() - start)
+  return seconds, result
+
+
+def run_cases(data_raw, location_multiple, n_hhs_vintages, repeats):
+  results = []
+  for kwargs_name, kwargs in KWARGS_SETS.items():
+    for sources in source_combinations():
+      seconds, df = time_call(lambda: FluDataLoader(data_raw).load_data(sources=sources, **kwargs),
+                              repeats)
+      results.append({
+        'case': 'load_data',
+        'sources': '+'.join(sources),
+        'kwargs': kwargs_name,
+        'location_multiple': location_multiple,
+        'n_rows': len(df),
+        'memory_mb': df.memory_usage(deep=True).sum() / 2**20,
+        'min_seconds': min(seconds),
+        'median_seconds': float(np.median(seconds)),
+        'repeats': repeats
+      })
+      print(f'{location_multiple:>4}x {kwargs_name:<20} {"+".join(sources):<24} '
+            f'{min(seconds):8.3f} s')
+
+  # all hhs vintages, as in retrospective experiments
+  as_of_dates = [str(LAST_WK_END_DATE + datetime.timedelta(days=4, weeks=-k))
+                 for k in reversed(range(n_hhs_vintages))]
+  seconds, dfs = time_call(lambda: list(FluDataLoader(data_raw).load_data_many(as_of_dates)), repeats)
+  results.append({
+    'case': 'load_data_many',
+    'sources': '+'.join(SOURCES),
+    'kwargs': f'{n_hhs_vintages}_vintages',
+    'location_multiple': location_multiple,
+    'n_rows': sum(len(df) for _, df in dfs),
+    'memory_mb': sum(df.memory_usage(deep=True).sum() for _, df in dfs) / 2**20,
+    'min_seconds': min(seconds),
+    'median_seconds': float(np.median(seconds)),
+    'repeats': repeats
+  })
+  print(f'{location_multiple:>4}x {"load_data_many":<20} {n_hhs_vintages} vintages {min(seconds):8.3f} s')
+
+  return results
+
+
+def environment():
+  try:
+    commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                            check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    commit = None
+  return {
+    'commit': commit,
+    'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+    'python': platform.python_version(),
+    'pandas': pd.__version__,
+    'numpy': np.__version__,
+    'machine': platform.machine(),
+    'processor': platform.processor()
+  }
+
+
+def compare(before_path, after_path, threshold):
+  '''
+  Print the ratio of the minimum times in two result files for each case,
+  flagging cases that are slower by more than the factor `threshold`
+
+  Returns
+  -------
+  number of cases flagged as regressions
+  '''
+  keys = ['case', 'sources', 'kwargs', 'location_multiple']
+  with open(before_path) as f:
+    before = pd.DataFrame(json.load(f)['results'])
+  with open(after_path) as f:
+    after = pd.DataFrame(json.load(f)['results'])
+
+  merged = before.merge(after, on=keys, suffixes=('_before', '_after'))
+  merged['ratio'] = merged['min_seconds_after'] / merged['min_seconds_before']
+  merged['regression'] = merged['ratio'] > threshold
+  with pd.option_context('display.max_rows', None, 'display.width', 200):
+    print(merged[keys + ['min_seconds_before', 'min_seconds_after', 'ratio', 'regression']]
+          .to_string(index=False))
+  return int(merged['regression'].sum())
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark FluDataLoader.load_data')
+  parser.add_argument('--template', default='../../data-raw',
+                      help='data-raw directory with the fips mappings used to generate data')
+  parser.add_argument('--location_multiples', type=int, nargs='+', default=[1, 10])
+  parser.add_argument('--n_hhs_vintages', type=int, default=30)
+  parser.add_argument('--repeats', type=int, default=3)
+  parser.add_argument('--output', default='bench-load-data.json')
+  parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), default=None,
+                      help='compare two result files instead of running the benchmarks')
+  parser.add_argument('--threshold', type=float, default=1.2,
+                      help='ratio of times above which --compare reports a regression')
+  args = parser.parse_args()
+
+  if args.compare is not None:
+    n_regressions = compare(*args.compare, threshold=args.threshold)
+    raise SystemExit(1 if n_regressions > 0 else 0)
+
+  results = []
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    for location_multiple in args.location_multiples:
+      data_raw = Path(tmp_dir) / f'data-raw-{location_multiple}x'
+      make_data_raw(data_raw, template=args.template, location_multiple=location_multiple,
+                    n_hhs_vintages=args.n_hhs_vintages)
+      results += run_cases(data_raw, location_multiple, args.n_hhs_vintages, args.repeats)
+
+  with open(args.output, 'w') as f:
+    json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,285 @@
+'''
+Generate a synthetic `data-raw` directory with the files read by
+`FluDataLoader`, for benchmarking the loaders at larger scales than the real
+data.
+
+Every file has the columns, formats, and encodings of the real file it stands
+in for (see `data_pipeline.schemas`), with random values. The number of
+locations is a multiple of the real number: each state in
+`fips-mappings/fips_mappings.csv` of a template `data-raw` directory is
+accompanied by `location_multiple - 1` synthetic locations in the same HHS
+region, with their own FIPS-like codes, names, census populations, and ILINet,
+WHO/NREVSS, and HHS data. FluSurv-NET sites are not multiplied. HHS data are
+written as a series of weekly vintages, each revising the latest weeks of the
+previous one.
+
+Run with `code/data-pipeline` as the working directory:
+python benchmarks/synthetic_data_raw.py /tmp/data-raw-10x --location_multiple 10 --n_hhs_vintages 30
+'''
+
+import argparse
+import datetime
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_pipeline import mmwr
+from data_pipeline.loader import FluDataLoader
+
+
+ILINET_COLUMNS = ['region_type', 'region', 'year', 'week', 'weighted_ili', 'unweighted_ili',
+                  'age_0_4', 'age_25_49', 'age_25_64', 'age_5_24', 'age_50_64', 'age_65',
+                  'ilitotal', 'num_of_providers', 'total_patients', 'week_start', 'season_week',
+                  'season']
+
+FLUSURV_SITES = ['California', 'Colorado', 'Connecticut', 'Entire Network', 'Georgia', 'Maryland',
+                 'Michigan', 'Minnesota', 'New Mexico', 'New York - Albany', 'New York - Rochester',
+                 'Ohio', 'Oregon', 'Tennessee', 'Utah', 'Iowa']
+
+FLUSURV_AGE_LABELS = ['0-4 yr', '5-17 yr', '18-49 yr', '50-64 yr', '65+ yr', 'Overall']
+
+# last week with data, and the date of the latest HHS vintage
+LAST_WK_END_DATE = datetime.date(2024, 4, 27)
+
+
+def _weeks(start, end):
+  # week start (Sunday) dates from the week containing start through the week
+  # containing end, with their MMWR year, week, season, and season week
+  start = pd.Timestamp(mmwr.date_to_wk_end_date([start])[0]) - pd.Timedelta(6, 'days')
+  week_start = pd.date_range(start, end, freq='7D')
+  years, weeks = mmwr.date_to_epiweek(week_start)
+  return pd.DataFrame({
+    'year': years,
+    'week': weeks,
+    'week_start': week_start,
+    'season': mmwr.epiweek_to_season(years, weeks),
+    'season_week': mmwr.epiweek_to_season_week(years, weeks)
+  })
+
+
+def _cross(keys, weeks):
+  # all combinations of the rows of two data frames
+  return keys.merge(weeks, how='cross')
+
+
+def make_locations(template, location_multiple):
+  '''
+  Locations for a synthetic `data-raw` directory.
+
+  Parameters
+  ----------
+  template: path to a `data-raw` directory with `fips-mappings/fips_mappings.csv`
+  location_multiple: number of locations per location in the template
+
+  Returns
+  -------
+  Pandas DataFrame in the format of `fips_mappings.csv`
+  '''
+  fips = FluDataLoader(template).load_fips_mappings()
+  states = fips.loc[fips['location'] != 'US']
+  synthetic = [
+    pd.DataFrame({
+      'abbreviation': states['abbreviation'] + str(j),
+      'location': states['location'] + f'{j:03d}',
+      'location_name': states['location_name'] + f' {j}',
+      'hhs_region': states['hhs_region']
+    })
+    for j in range(1, location_multiple)
+  ]
+  return pd.concat([fips] + synthetic, ignore_index=True)
+
+
+def write_census(root, locations, rng):
+  us_census = root / 'us-census'
+  us_census.mkdir(parents=True, exist_ok=True)
+  states = locations.loc[locations['location'] != 'US']
+  base_pop = rng.integers(500_000, 40_000_000, size=len(states))
+
+  for file_name, base_columns, years in [
+      ('nst-est2019-alldata.csv', ['CENSUS2010POP', 'ESTIMATESBASE2010'], range(2010, 2020)),
+      ('NST-EST2022-ALLDATA.csv', ['ESTIMATESBASE2020'], range(2020, 2023))]:
+    dat = pd.DataFrame({
+      'SUMLEV': '040',
+      'REGION': '1',
+      'DIVISION': '1',
+      'STATE': states['location'].values,
+      'NAME': states['location_name'].values
+    })
+    for c in base_columns:
+      dat[c] = base_pop
+    for y in years:
+      dat[f'POPESTIMATE{y}'] = (base_pop * (1 + 0.005 * (y - 2010))).astype(np.int64)
+    for y in years:
+      dat[f'NPOPCHG_{y}'] = (base_pop * 0.005).astype(np.int64)
+
+    us = dat.iloc[:1].copy()
+    us[['SUMLEV', 'REGION', 'DIVISION', 'STATE', 'NAME']] = ['010', '0', '0', '00', 'United States']
+    numeric = [c for c in dat.columns if c not in ['SUMLEV', 'REGION', 'DIVISION', 'STATE', 'NAME']]
+    us[numeric] = dat[numeric].sum().values
+    region = us.copy()
+    region[['SUMLEV', 'REGION', 'NAME']] = ['020', '1', 'Northeast Region']
+    pd.concat([us, region, dat]).to_csv(us_census / file_name, index=False)
+
+
+def write_ilinet_and_who_nrevss(root, locations, rng):
+  ilinet = root / 'influenza-ilinet'
+  ilinet.mkdir(parents=True, exist_ok=True)
+  last = LAST_WK_END_DATE
+
+  state_names = list(locations.loc[locations['location'] != 'US', 'location_name']) + ['New York City']
+  keys = {
+    'ilinet.csv': pd.DataFrame({'region_type': ['National'], 'region': ['National']}),
+    'ilinet_hhs.csv': pd.DataFrame({'region_type': 'HHS Regions',
+                                    'region': [f'Region {i}' for i in range(1, 11)]}),
+    'ilinet_state.csv': pd.DataFrame({'region_type': 'States', 'region': state_names})
+  }
+  first = {'ilinet.csv': datetime.date(1997, 9, 28), 'ilinet_hhs.csv': datetime.date(1997, 9, 28),
+           'ilinet_state.csv': datetime.date(2010, 10, 3)}
+
+  who_nrevss = []
+  for file_name, file_keys in keys.items():
+    dat = _cross(file_keys, _weeks(first[file_name], last))
+    n = len(dat)
+    dat['weighted_ili'] = np.round(rng.gamma(2.0, 1.0, size=n), 5)
+    dat['unweighted_ili'] = np.round(rng.gamma(2.0, 1.0, size=n), 5)
+    for c in ['age_0_4', 'age_25_49', 'age_25_64', 'age_5_24', 'age_50_64', 'age_65']:
+      dat[c] = rng.integers(0, 500, size=n)
+    dat['ilitotal'] = rng.integers(0, 3000, size=n)
+    dat['num_of_providers'] = rng.integers(1, 300, size=n)
+    dat['total_patients'] = rng.integers(1000, 100000, size=n)
+    if file_name == 'ilinet_state.csv':
+      dat['weighted_ili'] = np.nan
+    dat['week_start'] = dat['week_start'].dt.strftime('%Y-%m-%d')
+    dat[ILINET_COLUMNS].to_csv(ilinet / file_name, index=False, na_rep='NA', encoding='ISO-8859-1')
+
+    who = dat[['region_type', 'region', 'year', 'week', 'season', 'season_week']].copy()
+    who['percent_positive'] = np.round(rng.uniform(0, 30, size=n), 3)
+    who['total_specimens'] = rng.integers(0, 5000, size=n)
+    who_nrevss.append(who.loc[rng.uniform(size=n) > 0.03])
+
+  (root / 'influenza-who-nrevss').mkdir(parents=True, exist_ok=True)
+  pd.concat(who_nrevss).to_csv(root / 'influenza-who-nrevss/who-nrevss.csv', index=False,
+                               encoding='ISO-8859-1')
+
+
+def write_flusurv(root, rng):
+  flusurv = root / 'influenza-flusurv/flusurv-rates'
+  flusurv.mkdir(parents=True, exist_ok=True)
+
+  # seasons 2009/10 through 2021/22, MMWR weeks 40 through 17
+  old = []
+  for start_year in range(2009, 2022):
+    weeks = _weeks(datetime.date(start_year, 10, 1), datetime.date(start_year + 1, 4, 30))
+    keys = pd.DataFrame({'region': FLUSURV_SITES}).merge(
+      pd.DataFrame({'age_label': FLUSURV_AGE_LABELS}), how='cross')
+    dat = _cross(keys, weeks)
+    dat['sea_label'] = f'{start_year}-{str(start_year + 1)[-2:]}'
+    dat['wk_end'] = (dat['week_start'] + pd.Timedelta(6, 'days')).dt.strftime('%Y-%m-%d')
+    dat['weeknumber'] = dat['week']
+    dat['weeklyrate'] = np.round(rng.gamma(2.0, 1.5, size=len(dat)), 1)
+    old.append(dat.loc[rng.uniform(size=len(dat)) > 0.03])
+  old = pd.concat(old)[['sea_label', 'region', 'age_label', 'wk_end', 'season_week', 'year',
+                        'weeknumber', 'weeklyrate']]
+  old.sample(frac=1, random_state=1) \
+    .to_csv(flusurv / 'old-flusurv-rates.csv', index=False, encoding='ISO-8859-1')
+
+  weeks = _weeks(datetime.date(2022, 10, 1), datetime.date(2023, 4, 30))
+  keys = pd.DataFrame({'CATCHMENT': [s for s in FLUSURV_SITES if s != 'Iowa']})
+  keys['NETWORK'] = np.where(keys['CATCHMENT'] == 'Entire Network', 'FluSurv-NET', 'EIP')
+  keys = keys.merge(pd.DataFrame({'RACE CATEGORY': ['Overall', 'Black', 'White']}), how='cross')
+  dat = _cross(keys, weeks)
+  dat['YEAR'] = '2022-23'
+  dat['MMWR-YEAR'] = dat['year']
+  dat['MMWR-WEEK'] = dat['week']
+  dat['AGE CATEGORY'] = 'Overall'
+  dat['SEX CATEGORY'] = 'Overall'
+  dat['WEEKLY RATE '] = np.round(rng.gamma(2.0, 1.5, size=len(dat)), 1)
+  dat['CUMULATIVE RATE'] = dat.groupby(['CATCHMENT', 'RACE CATEGORY'])['WEEKLY RATE '].cumsum()
+  dat[['CATCHMENT', 'NETWORK', 'YEAR', 'MMWR-YEAR', 'MMWR-WEEK', 'AGE CATEGORY', 'SEX CATEGORY',
+       'RACE CATEGORY', 'CUMULATIVE RATE', 'WEEKLY RATE ']] \
+    .to_csv(flusurv / 'flusurv-rates-2022-23.csv', index=False, encoding='ISO-8859-1')
+
+  (root / 'burden-estimates').mkdir(parents=True, exist_ok=True)
+  pd.DataFrame({
+    'Season': [f'{y}-{y + 1}' for y in range(2010, 2023)],
+    'Estimate': rng.integers(100_000, 700_000, size=13)
+  }).to_csv(root / 'burden-estimates/burden-estimates.csv', index=False)
+
+
+def write_hhs(root, locations, n_hhs_vintages, rng):
+  hhs = root / 'influenza-hhs'
+  hhs.mkdir(parents=True, exist_ok=True)
+
+  # complete data from 2020, with missing values before reporting began
+  dates = pd.date_range('2020-01-04', LAST_WK_END_DATE, freq='7D')
+  dat = pd.DataFrame({'location': np.repeat(locations['location'].values, len(dates)),
+                      'date': np.tile(dates.strftime('%Y-%m-%d'), len(locations))})
+  dat['inc'] = rng.poisson(50.0, size=len(dat)).astype(float)
+  dat.loc[dat['date'] < '2020-10-01', 'inc'] = np.nan
+  dat.to_csv(hhs / 'hhs_complete.csv', index=False, na_rep='NA', float_format='%.0f')
+
+  # weekly vintages released on Wednesdays, each with data through the
+  # previous Saturday and revisions to the last three weeks of the previous
+  # vintage; data from the 2022/23 season
+  dat = dat.loc[dat['date'] >= '2022-09-03'].reset_index(drop=True)
+  last_as_of = LAST_WK_END_DATE + datetime.timedelta(days=4)
+  for k in reversed(range(n_hhs_vintages)):
+    as_of = last_as_of - datetime.timedelta(weeks=k)
+    vintage = dat.loc[dat['date'] <= str(as_of - datetime.timedelta(days=4))].copy()
+    recent = vintage['date'] >= str(as_of - datetime.timedelta(days=25))
+    vintage.loc[recent, 'inc'] = vintage.loc[recent, 'inc'] + rng.integers(-3, 4, size=recent.sum())
+    vintage['inc'] = vintage['inc'].clip(lower=0).astype(np.int64)
+    vintage.to_csv(hhs / f'hhs-{as_of}.csv', index=False)
+  vintage.to_csv(hhs / 'hhs.csv', index=False)
+
+
+def make_data_raw(root, template='../../data-raw', location_multiple=1, n_hhs_vintages=30, seed=42):
+  '''
+  Write a synthetic `data-raw` directory.
+
+  Parameters
+  ----------
+  root: path to the directory to create
+  template: path to a `data-raw` directory with `fips-mappings/fips_mappings.csv`
+  location_multiple: number of locations per state in the template
+  n_hhs_vintages: number of weekly HHS vintages
+  seed: seed for the random number generator
+
+  Returns
+  -------
+  dictionary describing the generated data
+  '''
+  root = Path(root)
+  rng = np.random.default_rng(seed)
+  locations = make_locations(template, location_multiple)
+
+  (root / 'fips-mappings').mkdir(parents=True, exist_ok=True)
+  locations.to_csv(root / 'fips-mappings/fips_mappings.csv', index=False, na_rep='NA',
+                   float_format='%.0f')
+  write_census(root, locations, rng)
+  write_ilinet_and_who_nrevss(root, locations, rng)
+  write_flusurv(root, rng)
+  write_hhs(root, locations, n_hhs_vintages, rng)
+
+  return {'location_multiple': location_multiple, 'n_locations': len(locations),
+          'n_hhs_vintages': n_hhs_vintages, 'seed': seed}
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Generate a synthetic data-raw directory')
+  parser.add_argument('root', help='path to the directory to create')
+  parser.add_argument('--template', default='../../data-raw')
+  parser.add_argument('--location_multiple', type=int, default=1)
+  parser.add_argument('--n_hhs_vintages', type=int, default=30)
+  parser.add_argument('--seed', type=int, default=42)
+  args = parser.parse_args()
+
+  info = make_data_raw(args.root, template=args.template, location_multiple=args.location_multiple,
+                       n_hhs_vintages=args.n_hhs_vintages, seed=args.seed)
+  print(json.dumps(info, indent=2))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,107 @@
+'''
+Row filters for `FluDataLoader.load_data`, selecting locations, seasons, and a
+range of week end dates. The loader applies a filter to the data of each
+source as early as the semantics of the later loading steps allow, so that
+rows that are not requested are dropped before they are processed.
+'''
+
+import numpy as np
+import pandas as pd
+
+
+def _as_tuple(values):
+  if values is None:
+    return None
+  if isinstance(values, str):
+    values = [values]
+  return tuple(sorted(set(values)))
+
+
+def _as_timestamp(date):
+  return None if date is None else pd.Timestamp(date)
+
+
+class RowFilter():
+  def __init__(self, locations=None, seasons=None, start_date=None, end_date=None) -> None:
+    '''
+    Parameters
+    ----------
+    locations: optional list of locations, as in the `location` column of the
+      result of `load_data` (FIPS codes, 'US', or 'Region N')
+    seasons: optional list of seasons, e.g. ['2022/23', '2023/24']
+    start_date, end_date: optional first and last week end dates to keep;
+      dates or strings in ISO format
+    '''
+    self.locations = _as_tuple(locations)
+    self.seasons = _as_tuple(seasons)
+    self.start_date = _as_timestamp(start_date)
+    self.end_date = _as_timestamp(end_date)
+
+
+  def __repr__(self) -> str:
+    # used in the keys of the on-disk cache, so it must be deterministic
+    return (f'RowFilter(locations={self.locations!r}, seasons={self.seasons!r}, '
+            f'start_date={self.start_date!r}, end_date={self.end_date!r})')
+
+
+  def __eq__(self, other) -> bool:
+    return isinstance(other, RowFilter) and repr(self) == repr(other)
+
+
+  def __hash__(self) -> int:
+    return hash(repr(self))
+
+
+  @property
+  def has_time(self):
+    '''True if the filter restricts seasons or dates'''
+    return self.seasons is not None or self.start_date is not None or self.end_date is not None
+
+
+  def locations_only(self):
+    '''A filter with the locations of this filter and no time restrictions'''
+    return RowFilter(locations=self.locations)
+
+
+  def time_only(self):
+    '''A filter with the seasons and dates of this filter and all locations'''
+    return RowFilter(seasons=self.seasons, start_date=self.start_date, end_date=self.end_date)
+
+
+  def mask(self, df, locations=None, date_col='wk_end_date'):
+    '''
+    Boolean array with True for the rows of `df` to keep.
+
+    Parameters
+    ----------
+    df: data frame with the columns `location`, `season`, and `date_col`, as
+      needed by the restrictions of the filter; `date_col` may hold dates or
+      strings
+    locations: optional values to compare to the filter's locations instead
+      of `df['location']`, e.g. the FIPS codes of raw location names
+    date_col: name of the column of week end dates
+    '''
+    keep = np.ones(len(df), dtype=bool)
+    if self.locations is not None:
+      locations = df['location'] if locations is None else pd.Series(locations)
+      keep &= locations.isin(self.locations).to_numpy()
+    if self.seasons is not None:
+      keep &= df['season'].isin(self.seasons).to_numpy()
+    if self.start_date is not None or self.end_date is not None:
+      # raw files may hold dates as strings
+      dates = df[date_col]
+      if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates)
+      if self.start_date is not None:
+        keep &= (dates >= self.start_date).to_numpy()
+      if self.end_date is not None:
+        keep &= (dates <= self.end_date).to_numpy()
+    return keep
+
+
+  def apply(self, df, locations=None, date_col='wk_end_date'):
+    '''The rows of `df` selected by `mask`'''
+    keep = self.mask(df, locations=locations, date_col=date_col)
+    if keep.all():
+      return df
+    return df.loc[keep]
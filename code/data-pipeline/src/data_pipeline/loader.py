@@ -1,29 +1,289 @@
 from pathlib import Path
+import contextvars
+import functools
 import glob
+import hashlib
+import inspect
+import os
+import tempfile
+import threading
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
 
 from itertools import product
 
 import numpy as np
 import pandas as pd
 
-import pymmwr
-
+from . import filters
+from . import mmwr
+from . import normalization
+from . import panel
+from . import profiling
+from . import schemas
+from . import transforms
 from . import utils
+from . import vintages
+
+
+# bump this whenever a change to the loader alters the data frames stored in the
+# on-disk cache, so that entries written by older code are not reused
+_CACHE_VERSION = 1
+
+
+def _file_digest(path):
+  h = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+      h.update(chunk)
+  return h.hexdigest()
+
+
+def _disk_cached(source_files):
+  '''
+  Decorator for `FluDataLoader` methods that return a data frame parsed from
+  files in `data_raw`.
+
+  If the loader was created with a `cache_dir`, the result of the method is
+  stored there in Parquet format. Entries are keyed by the method name, its
+  arguments, and the path, size and content hash of every source file it reads,
+  so that any change to those files in `data_raw` invalidates the entry.
+  Without a `cache_dir` the method is called as usual.
+
+  Parameters
+  ----------
+  source_files: function taking the loader and the method's keyword arguments
+    (with defaults filled in) and returning the paths, relative to `data_raw`
+    or absolute, of the files read by the method
+  '''
+  def decorator(method):
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+      if self.cache_dir is None:
+        return method(self, *args, **kwargs)
+
+      bound = signature.bind(self, *args, **kwargs)
+      bound.apply_defaults()
+      method_kwargs = {k: v for k, v in bound.arguments.items() if k != 'self'}
+
+      file_paths = [self.data_raw / f for f in source_files(self, **method_kwargs)]
+      if not all(f.exists() for f in file_paths):
+        # let the method raise its usual error about the missing file
+        return method(self, *args, **kwargs)
+
+      args_key = repr((_CACHE_VERSION, method.__name__, sorted(method_kwargs.items())))
+      args_digest = hashlib.sha256(args_key.encode()).hexdigest()[:16]
+      files_key = repr([(os.path.relpath(f, self.data_raw), f.stat().st_size, _file_digest(f))
+                        for f in file_paths])
+      files_digest = hashlib.sha256(files_key.encode()).hexdigest()[:16]
+      cache_path = self.cache_dir / f'{method.__name__}-{args_digest}-{files_digest}.parquet'
+
+      if cache_path.exists():
+        return pd.read_parquet(cache_path)
+
+      dat = method(self, *args, **kwargs)
+
+      # write to a temporary file and move it into place so that concurrent
+      # readers never see a partially written entry; then remove entries for
+      # the same call that were computed from older versions of the files
+      self.cache_dir.mkdir(parents=True, exist_ok=True)
+      fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+      os.close(fd)
+      try:
+        dat.to_parquet(tmp_path)
+        os.replace(tmp_path, cache_path)
+      finally:
+        if os.path.exists(tmp_path):
+          os.remove(tmp_path)
+      for stale_path in self.cache_dir.glob(f'{method.__name__}-{args_digest}-*.parquet'):
+        if stale_path != cache_path:
+          stale_path.unlink(missing_ok=True)
+
+      return dat
+
+    return wrapper
+
+  return decorator
+
+
+def _memoized(method):
+  '''
+  Decorator for `FluDataLoader` methods that return small reference tables
+  shared by several loading steps. The first call with a given set of
+  arguments stores the result on the loader instance; later calls reuse it
+  until `FluDataLoader.clear_cache` is called. Callers always receive a copy
+  of the stored table, so the cached entries cannot be modified in place.
+  '''
+  @functools.wraps(method)
+  def wrapper(self, *args, **kwargs):
+    key = (method.__name__, args, tuple(sorted(kwargs.items())))
+    with self._memo_lock:
+      dat = self._memo.get(key)
+      key_lock = self._memo_key_locks.setdefault(key, threading.Lock())
+    
+    if dat is None:
+      # sources loaded concurrently may ask for the same table at once; it is
+      # computed by the first of them while the others wait for the result
+      with key_lock:
+        with self._memo_lock:
+          dat = self._memo.get(key)
+        if dat is None:
+          dat = method(self, *args, **kwargs)
+          with self._memo_lock:
+            self._memo[key] = dat
+            self._memo_stats[(method.__name__, 'misses')] += 1
+          return dat.copy()
+    
+    with self._memo_lock:
+      self._memo_stats[(method.__name__, 'hits')] += 1
+    
+    return dat.copy()
+
+  return wrapper
+
+
+_ILINET_FILES = ['influenza-ilinet/ilinet.csv',
+                 'influenza-ilinet/ilinet_hhs.csv',
+                 'influenza-ilinet/ilinet_state.csv']
+_WHO_NREVSS_FILE = 'influenza-who-nrevss/who-nrevss.csv'
+_FLUSURV_FILES = ['influenza-flusurv/flusurv-rates/old-flusurv-rates.csv',
+                  'influenza-flusurv/flusurv-rates/flusurv-rates-2022-23.csv']
+_US_CENSUS_FILES = ['us-census/nst-est2019-alldata.csv',
+                    'us-census/NST-EST2022-ALLDATA.csv']
+_FIPS_MAPPINGS_FILE = 'fips-mappings/fips_mappings.csv'
+
+_PARALLEL_MODES = [None, 'threads', 'processes']
+
+_ILINET_NONSTATES = ['National', 'Region 1', 'Region 2', 'Region 3',
+                     'Region 4', 'Region 5', 'Region 6', 'Region 7',
+                     'Region 8', 'Region 9', 'Region 10']
+
+
+class SourceLoadError(RuntimeError):
+  '''
+  Error raised by `FluDataLoader.load_data` when loading a source in a worker
+  thread or process fails. `source` names the source, and the original
+  exception is available as `__cause__`.
+  '''
+  def __init__(self, source, error) -> None:
+    super().__init__(f'Failed to load source "{source}": {type(error).__name__}: {error}')
+    self.source = source
+
 
 class FluDataLoader():
-  def __init__(self, data_raw) -> None:
+  def __init__(self, data_raw, cache_dir=None, hhs_vintages=None) -> None:
+    '''
+    Parameters
+    ----------
+    data_raw: path to the `data-raw` directory
+    cache_dir: optional path to a directory used to cache parsed source data
+        in Parquet format. Defaults to None, in which case nothing is cached.
+        Cached entries are invalidated automatically when the underlying files
+        in `data_raw` change.
+    hhs_vintages: optional path to a store of HHS data vintages built with
+        `vintages.HHSVintageStore`. If provided, `load_hhs` reads data for a
+        given `as_of` date from the store instead of the dated snapshot files
+        in `data_raw/influenza-hhs`. Defaults to None.
+    '''
     self.data_raw = Path(data_raw)
+    self.cache_dir = None if cache_dir is None else Path(cache_dir)
+    self.hhs_vintages = None if hhs_vintages is None else vintages.HHSVintageStore(hhs_vintages)
+    self._init_memo()
+
+
+  def _init_memo(self):
+    self._memo = {}
+    self._memo_stats = Counter()
+    self._memo_lock = threading.Lock()
+    self._memo_key_locks = {}
+
+
+  def __getstate__(self):
+    # loaders are sent to worker processes by `load_data(parallel='processes')`;
+    # memoized tables and locks stay with the original
+    state = self.__dict__.copy()
+    for k in ['_memo', '_memo_stats', '_memo_lock', '_memo_key_locks']:
+      del state[k]
+    return state
+
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._init_memo()
+
+
+  def clear_cache(self):
+    '''
+    Drop the reference tables memoized on this loader (census populations,
+    fips mappings, burden estimates and adjustments, holidays) and reset the
+    hit and miss counts reported by `cache_stats`. The on-disk cache in
+    `cache_dir`, if any, is not affected.
+    '''
+    with self._memo_lock:
+      self._memo.clear()
+      self._memo_stats.clear()
+      self._memo_key_locks.clear()
+
+
+  def cache_stats(self):
+    '''
+    Hit and miss counts for the reference tables memoized on this loader.
+
+    Returns
+    -------
+    Pandas DataFrame with columns `table`, `hits`, and `misses`
+    '''
+    with self._memo_lock:
+      tables = sorted({table for table, _ in self._memo_stats})
+      return pd.DataFrame({
+        'table': tables,
+        'hits': [self._memo_stats[(t, 'hits')] for t in tables],
+        'misses': [self._memo_stats[(t, 'misses')] for t in tables]
+      })
 
 
+  def trace(self):
+    '''
+    Record the time spent in each stage of loading data while the returned
+    tracer is active, e.g.
+    `with fdl.trace() as tracer: fdl.load_data()`, then `tracer.summary()`.
+    See the `profiling` module.
+    
+    Returns
+    -------
+    `profiling.Tracer`, to be used as a context manager
+    '''
+    return profiling.Tracer()
+
+
+  @profiling.traced()
+  @_memoized
   def load_fips_mappings(self):
-    return pd.read_csv(self.data_raw / 'fips-mappings/fips_mappings.csv')
+    return schemas.FIPS_MAPPINGS.read(self.data_raw / _FIPS_MAPPINGS_FILE)
+
+
+  @profiling.traced()
+  @_memoized
+  def load_location_index(self):
+    '''
+    Index mapping location and sub-location names used by the surveillance
+    data sources to FIPS codes; see `transforms.build_location_index`.
+    '''
+    return transforms.build_location_index(self.load_fips_mappings())
+
 
+  @_memoized
+  def load_holidays(self):
+    return utils.get_holidays()
 
+
+  @profiling.traced()
+  @_memoized
   def load_flusurv_rates_2022_23(self):
-    dat = pd.read_csv(self.data_raw / 'influenza-flusurv/flusurv-rates/flusurv-rates-2022-23.csv',
-                      encoding='ISO-8859-1',
-                      engine='python')
-    dat.columns = dat.columns.str.lower()
+    dat = schemas.FLUSURV_RATES_2022_23.read(self.data_raw / _FLUSURV_FILES[1])
     
     dat = dat.loc[(dat['age category'] == 'Overall') &
                   (dat['sex category'] == 'Overall') &
@@ -35,21 +295,22 @@ class FluDataLoader():
     dat['location'] = dat['catchment']
     dat['agg_level'] = np.where(dat['location'] == 'Entire Network', 'national', 'site')
     dat['season'] = dat['year'].str.replace('-', '/')
-    epiweek = dat['mmwr-year'].astype(str) + dat['mmwr-week'].astype(str)
-    dat['season_week'] = utils.convert_epiweek_to_season_week(epiweek)
-    dat['wk_end_date'] = dat.apply(
-      lambda x: pymmwr.epiweek_to_date(pymmwr.Epiweek(year=x['mmwr-year'],
-                                                      week=x['mmwr-week'],
-                                                      day=7))
-                                      .strftime("%Y-%m-%d"),
-        axis=1)
-    dat['wk_end_date'] = pd.to_datetime(dat['wk_end_date'])
+    dat['season_week'] = mmwr.epiweek_to_season_week(dat['mmwr-year'], dat['mmwr-week'])
+    dat['wk_end_date'] = pd.to_datetime(mmwr.epiweek_to_date(dat['mmwr-year'], dat['mmwr-week']))
     dat['inc'] = dat['weekly rate ']
     dat = dat[['agg_level', 'location', 'season', 'season_week', 'wk_end_date', 'inc']]
     
     return dat
 
 
+  @profiling.traced()
+  @_memoized
+  def _read_old_flusurv_rates(self):
+    return schemas.OLD_FLUSURV_RATES.read(self.data_raw / _FLUSURV_FILES[0])
+
+
+  @profiling.traced()
+  @_disk_cached(lambda self, **kwargs: _FLUSURV_FILES)
   def load_flusurv_rates_base(self, 
                               seasons=None,
                               locations=['California', 'Colorado', 'Connecticut', 'Entire Network',
@@ -59,15 +320,12 @@ class FluDataLoader():
                               age_labels=['0-4 yr', '5-17 yr', '18-49 yr', '50-64 yr', '65+ yr', 'Overall']
                               ):
     # read flusurv data and do some minimal preprocessing
-    dat = pd.read_csv(self.data_raw / 'influenza-flusurv/flusurv-rates/old-flusurv-rates.csv',
-                      encoding='ISO-8859-1',
-                      engine='python')
-    dat.columns = dat.columns.str.lower()
+    dat = self._read_old_flusurv_rates()
+    dat = dat[dat.age_label.isin(age_labels) & dat.region.isin(locations)]
     dat['season'] = dat.sea_label.str.replace('-', '/')
     dat['inc'] = dat.weeklyrate
     dat['location'] = dat['region']
     dat['agg_level'] = np.where(dat['location'] == 'Entire Network', 'national', 'site')
-    dat = dat[dat.age_label.isin(age_labels)]
     
     dat = dat.sort_values(by=['wk_end'])
     
@@ -90,7 +348,7 @@ class FluDataLoader():
 
 
   def load_one_us_census_file(self, f):
-    dat = pd.read_csv(f, engine='python', dtype={'STATE': str})
+    dat = schemas.US_CENSUS.read(f)
     dat = dat.loc[(dat['NAME'] == 'United States') | (dat['STATE'] != '00'),
                   (dat.columns == 'STATE') | (dat.columns.str.startswith('POPESTIMATE'))]
     dat = dat.melt(id_vars = 'STATE', var_name='season', value_name='pop')
@@ -102,13 +360,14 @@ class FluDataLoader():
     return dat
 
 
+  @profiling.traced()
+  @_memoized
+  @_disk_cached(lambda self, **kwargs: _US_CENSUS_FILES + [_FIPS_MAPPINGS_FILE])
   def load_us_census(self, fillna = True):
-    files = [
-      self.data_raw / 'us-census/nst-est2019-alldata.csv',
-      self.data_raw / 'us-census/NST-EST2022-ALLDATA.csv']
+    files = [self.data_raw / f for f in _US_CENSUS_FILES]
     us_pops = pd.concat([self.load_one_us_census_file(f) for f in files], axis=0)
     
-    fips_mappings = pd.read_csv(self.data_raw / 'fips-mappings/fips_mappings.csv')
+    fips_mappings = self.load_fips_mappings()
     
     hhs_pops = us_pops.query("location != 'US'") \
       .merge(
@@ -141,10 +400,11 @@ class FluDataLoader():
     return dat
 
 
+  @profiling.traced()
+  @_memoized
   def load_hosp_burden(self):
-    burden_estimates = pd.read_csv(
-      self.data_raw / 'burden-estimates/burden-estimates.csv',
-      engine='python')
+    burden_estimates = schemas.BURDEN_ESTIMATES.read(
+      self.data_raw / 'burden-estimates/burden-estimates.csv')
 
     burden_estimates.columns = ['season', 'hosp_burden']
 
@@ -153,6 +413,8 @@ class FluDataLoader():
     return burden_estimates
 
 
+  @profiling.traced()
+  @_memoized
   def calc_hosp_burden_adj(self):
     dat = self.load_flusurv_rates_base(
       seasons = ['20' + str(yy) + '/' + str(yy+1) for yy in range(10, 23)],
@@ -179,22 +441,25 @@ class FluDataLoader():
 
 
   def fill_missing_flusurv_dates_one_location(self, location_df):
-    df = location_df.set_index('wk_end_date') \
-      .asfreq('W-sat') \
-      .reset_index()
-    fill_cols = ['agg_level', 'location', 'season', 'pop', 'source']
-    fill_cols = [c for c in fill_cols if c in df.columns]
-    df[fill_cols] = df[fill_cols].fillna(axis=0, method='ffill')
-    return df
+    fill_cols = ['agg_level', 'season', 'pop', 'source']
+    fill_cols = [c for c in fill_cols if c in location_df.columns]
+    return transforms.regularize_weekly(location_df, by=['location'], ffill_cols=fill_cols)
 
 
+  @profiling.traced()
   def load_flusurv_rates(self,
                          burden_adj=True,
                          locations=['California', 'Colorado', 'Connecticut', 'Entire Network',
                                     'Georgia', 'Maryland', 'Michigan', 'Minnesota', 'New Mexico',
                                     'New York - Albany', 'New York - Rochester', 'Ohio', 'Oregon',
-                                    'Tennessee', 'Utah']
+                                    'Tennessee', 'Utah'],
+                         row_filter=None
                         ):
+    # only read the sites that make up the requested locations
+    if row_filter is not None and row_filter.locations is not None:
+      codes = self._flusurv_location_codes(pd.Series(locations))
+      locations = [l for l, c in zip(locations, codes) if c in row_filter.locations]
+    
     # read flusurv data and do some minimal preprocessing
     dat = self.load_flusurv_rates_base(
       seasons = ['20' + str(yy) + '/' + str(yy+1) for yy in range(10, 23)],
@@ -208,21 +473,20 @@ class FluDataLoader():
       dat = pd.merge(dat, hosp_burden_adj, on='season')
       dat['inc'] = dat['inc'] * dat['adj_factor']
     
-    # fill in missing dates
-    gd = dat.groupby('location')
-    
-    dat = pd.concat(
-      [self.fill_missing_flusurv_dates_one_location(df) for _, df in gd],
-      axis = 0)
+    # fill in missing dates; seasons and dates are filtered after the weeks
+    # between reports are filled in, so that the filled weeks are the same
+    dat = transforms.regularize_weekly(dat, by=['location'],
+                                       ffill_cols=['agg_level', 'season', 'source'])
+    if row_filter is not None:
+      dat = row_filter.time_only().apply(dat)
     dat = dat[['agg_level', 'location', 'season', 'season_week', 'wk_end_date', 'inc', 'source']]
     
     return dat
 
 
+  @profiling.traced()
   def load_who_nrevss_positive(self):
-    dat = pd.read_csv(self.data_raw / 'influenza-who-nrevss/who-nrevss.csv',
-                      encoding='ISO-8859-1',
-                      engine='python')
+    dat = schemas.WHO_NREVSS.read(self.data_raw / _WHO_NREVSS_FILE)
     dat = dat[['region_type', 'region', 'year', 'week', 'season', 'season_week', 'percent_positive']]
     
     dat.rename(columns={'region_type': 'agg_level', 'region': 'location'},
@@ -233,17 +497,19 @@ class FluDataLoader():
     return dat
 
 
+  @profiling.traced()
+  @_disk_cached(lambda self, scale_to_positive, **kwargs:
+                  _ILINET_FILES + ([_WHO_NREVSS_FILE] if scale_to_positive else []))
   def load_ilinet(self,
                   response_type='rate',
                   scale_to_positive=True,
                   drop_pandemic_seasons=True,
-                  burden_adj=False):
+                  burden_adj=False,
+                  row_filter=None):
     # read ilinet data and do some minimal preprocessing
-    files = [self.data_raw / 'influenza-ilinet/ilinet.csv',
-             self.data_raw / 'influenza-ilinet/ilinet_hhs.csv',
-             self.data_raw / 'influenza-ilinet/ilinet_state.csv']
+    files = [self.data_raw / f for f in _ILINET_FILES]
     dat = pd.concat(
-      [ pd.read_csv(f, encoding='ISO-8859-1', engine='python') for f in files ],
+      [ schemas.ILINET.read(f) for f in files ],
       axis = 0)
     
     if response_type == 'rate':
@@ -261,6 +527,8 @@ class FluDataLoader():
     dat['agg_level'] = np.where(dat['agg_level'] == 'National',
                                 'national',
                                 dat['agg_level'].str[:-1].str.lower())
+    if row_filter is not None:
+      dat = row_filter.apply(dat, locations=self._ilinet_location_codes(dat['location']))
     dat = dat.sort_values(by=['season', 'season_week'])
     
     # for early seasons, drop out-of-season weeks with no reporting
@@ -301,7 +569,11 @@ class FluDataLoader():
     return dat
 
 
-  def load_hhs(self, rates=True, drop_pandemic_seasons=True, as_of=None):
+  def hhs_file_path(self, drop_pandemic_seasons=True, as_of=None):
+    '''
+    Path, relative to `data_raw`, of the HHS data file to load for the given
+    settings of the arguments to `load_hhs`.
+    '''
     if drop_pandemic_seasons:
       if as_of is None:
         file_path = 'influenza-hhs/hhs.csv'
@@ -316,12 +588,31 @@ class FluDataLoader():
         raise NotImplementedError('Functionality for loading all seasons of HHS data with specified as_of date is not implemented.')
       file_path = 'influenza-hhs/hhs_complete.csv'
     
-    dat = pd.read_csv(self.data_raw / file_path)
+    return file_path
+
+
+  def _use_hhs_vintages(self, drop_pandemic_seasons, as_of):
+    return self.hhs_vintages is not None and drop_pandemic_seasons and as_of is not None
+
+
+  @profiling.traced()
+  @_disk_cached(lambda self, rates, drop_pandemic_seasons, as_of, **kwargs:
+                  (self.hhs_vintages.files(as_of) if self._use_hhs_vintages(drop_pandemic_seasons, as_of)
+                   else [self.hhs_file_path(drop_pandemic_seasons, as_of)]) +
+                  (_US_CENSUS_FILES + [_FIPS_MAPPINGS_FILE] if rates else []))
+  def load_hhs(self, rates=True, drop_pandemic_seasons=True, as_of=None, row_filter=None):
+    if self._use_hhs_vintages(drop_pandemic_seasons, as_of):
+      dat = self.hhs_vintages.load(as_of)
+    else:
+      file_path = self.hhs_file_path(drop_pandemic_seasons, as_of)
+      dat = schemas.HHS.read(self.data_raw / file_path)
     dat.rename(columns={'date': 'wk_end_date'}, inplace=True)
 
-    ew_str = dat.apply(utils.date_to_ew_str, axis=1)
-    dat['season'] = utils.convert_epiweek_to_season(ew_str)
-    dat['season_week'] = utils.convert_epiweek_to_season_week(ew_str)
+    ew_year, ew_week = mmwr.date_to_epiweek(dat['wk_end_date'])
+    dat['season'] = mmwr.epiweek_to_season(ew_year, ew_week)
+    dat['season_week'] = mmwr.epiweek_to_season_week(ew_year, ew_week)
+    if row_filter is not None:
+      dat = row_filter.apply(dat)
     dat = dat.sort_values(by=['season', 'season_week'])
     
     if rates:
@@ -337,37 +628,40 @@ class FluDataLoader():
     return dat
 
 
-  def load_agg_transform_ilinet(self, fips_mappings, **ilinet_kwargs):
+  def _location_index(self, fips_mappings):
+    if fips_mappings is None:
+      return self.load_location_index()
+    return transforms.build_location_index(fips_mappings)
+
+
+  def _ilinet_location_codes(self, names):
+    # locations in the result of `load_agg_transform_ilinet` for raw ILINet
+    # location names
+    codes = names.map(self.load_location_index())
+    codes = codes.where(~names.isin(_ILINET_NONSTATES), names)
+    return codes.where(names != 'National', 'US')
+
+
+  def _flusurv_location_codes(self, names):
+    # locations in the result of `load_agg_transform_flusurv` for FluSurv-NET
+    # site names
+    return names.map(self.load_location_index()).where(names != 'Entire Network', 'US')
+
+
+  @profiling.traced()
+  def load_agg_transform_ilinet(self, fips_mappings=None, **ilinet_kwargs):
     df_ilinet_full = self.load_ilinet(**ilinet_kwargs)
     # df_ilinet_full.loc[df_ilinet_full['inc'] < np.exp(-7), 'inc'] = np.exp(-7)
     df_ilinet_full['inc'] = (df_ilinet_full['inc'] + np.exp(-7)) * 4
     
     # aggregate ilinet sites in New York to state level,
     # mainly to facilitate adding populations
-    ilinet_nonstates = ['National', 'Region 1', 'Region 2', 'Region 3',
-                        'Region 4', 'Region 5', 'Region 6', 'Region 7',
-                        'Region 8', 'Region 9', 'Region 10']
-    df_ilinet_by_state = df_ilinet_full \
-      .loc[(~df_ilinet_full['location'].isin(ilinet_nonstates)) &
-          (df_ilinet_full['location'] != '78')] \
-      .assign(state = lambda x: np.where(x['location'].isin(['New York', 'New York City']),
-                                        'New York',
-                                        x['location'])) \
-      .assign(state = lambda x: np.where(x['state'] == 'Commonwealth of the Northern Mariana Islands',
-                                        'Northern Mariana Islands',
-                                        x['state'])) \
-      .merge(
-        fips_mappings.rename(columns={'location': 'fips'}),
-        left_on='state',
-        right_on='location_name') \
-      .groupby(['state', 'fips', 'season', 'season_week', 'wk_end_date', 'source']) \
-      .apply(lambda x: pd.DataFrame({'inc': [np.mean(x['inc'])]})) \
-      .reset_index() \
-      .drop(columns = ['state', 'level_6']) \
-      .rename(columns = {'fips': 'location'}) \
-      .assign(agg_level = 'state')
+    df_ilinet_by_state = transforms.aggregate_sub_locations(
+      df_ilinet_full.loc[(~df_ilinet_full['location'].isin(_ILINET_NONSTATES)) &
+                         (df_ilinet_full['location'] != '78')],
+      location_index=self._location_index(fips_mappings))
     
-    df_ilinet_nonstates = df_ilinet_full.loc[df_ilinet_full['location'].isin(ilinet_nonstates)].copy()
+    df_ilinet_nonstates = df_ilinet_full.loc[df_ilinet_full['location'].isin(_ILINET_NONSTATES)].copy()
     df_ilinet_nonstates['location'] = np.where(df_ilinet_nonstates['location'] == 'National',
                                               'US',
                                               df_ilinet_nonstates['location'])
@@ -378,28 +672,17 @@ class FluDataLoader():
     return df_ilinet
 
 
-  def load_agg_transform_flusurv(self, fips_mappings, **flusurvnet_kwargs):
+  @profiling.traced()
+  def load_agg_transform_flusurv(self, fips_mappings=None, **flusurvnet_kwargs):
     df_flusurv_by_site = self.load_flusurv_rates(**flusurvnet_kwargs)
     # df_flusurv_by_site.loc[df_flusurv_by_site['inc'] < np.exp(-3), 'inc'] = np.exp(-3)
     df_flusurv_by_site['inc'] = (df_flusurv_by_site['inc'] + np.exp(-3)) / 2.5
     
     # aggregate flusurv sites in New York to state level,
     # mainly to facilitate adding populations
-    df_flusurv_by_state = df_flusurv_by_site \
-      .loc[df_flusurv_by_site['location'] != 'Entire Network'] \
-      .assign(state = lambda x: np.where(x['location'].isin(['New York - Albany', 'New York - Rochester']),
-                                        'New York',
-                                        x['location'])) \
-      .merge(
-        fips_mappings.rename(columns={'location': 'fips'}),
-        left_on='state',
-        right_on='location_name') \
-      .groupby(['fips', 'season', 'season_week', 'wk_end_date', 'source']) \
-      .apply(lambda x: pd.DataFrame({'inc': [np.mean(x['inc'])]})) \
-      .reset_index() \
-      .drop(columns = ['level_5']) \
-      .rename(columns = {'fips': 'location'}) \
-      .assign(agg_level = 'state')
+    df_flusurv_by_state = transforms.aggregate_sub_locations(
+      df_flusurv_by_site.loc[df_flusurv_by_site['location'] != 'Entire Network'],
+      location_index=self._location_index(fips_mappings))
     
     df_flusurv_us = df_flusurv_by_site.loc[df_flusurv_by_site['location'] == 'Entire Network'].copy()
     df_flusurv_us['location'] = 'US'
@@ -410,8 +693,11 @@ class FluDataLoader():
     return df_flusurv
 
 
+  @profiling.traced()
   def load_data(self, sources=None, flusurvnet_kwargs=None, hhs_kwargs=None, ilinet_kwargs=None,
-                power_transform='4rt'):
+                power_transform='4rt', fill_missing_weeks=False, compact=False,
+                return_normalization=False, parallel=None, locations=None, seasons=None,
+                start_date=None, end_date=None, normalize_on='full'):
     '''
     Load influenza data and transform to a scale suitable for input to models.
 
@@ -423,80 +709,475 @@ class FluDataLoader():
     flusurvnet_kwargs: dictionary of keyword arguments to pass on to `load_flusurv_rates`
     hhs_kwargs: dictionary of keyword arguments to pass on to `load_hhs`
     ilinet_kwargs: dictionary of keyword arguments to pass on to `load_ilinet`
-    power_transform: string specifying power transform to use: '4rt' or `None`
+    power_transform: string specifying power transform to use: '4rt', 'sqrt',
+        or `None`
+    fill_missing_weeks: boolean; if True, every combination of source and
+        location is reindexed onto a complete weekly calendar from its first to
+        its last observation, with missing `inc` in the inserted weeks
+    compact: boolean; if True, the result uses compact dtypes as described in
+        `transforms.compact_dtypes`: categoricals for `source`, `agg_level`,
+        `location`, and `season`, `Int16` for `season_week`, and float32 for
+        `inc` and the other numeric columns, which are computed in float64
+        before conversion
+    return_normalization: boolean; if True, the scale and center factors are
+        returned in a side table rather than as the `inc_trans_scale_factor`
+        and `inc_trans_center_factor` columns of the result
+    parallel: None, 'threads', or 'processes'; if not None, the sources are
+        loaded concurrently, each in its own worker thread or process. The
+        result is the same as with the default of None, which loads them one
+        after another. Memoized reference tables are shared between threads
+        and computed once; worker processes compute their own and do not add
+        them to this loader, and their stages are not recorded by an active
+        tracer. If loading a source fails, a `SourceLoadError` naming the
+        first failed source (in the order hhs, ilinet, flusurvnet) is raised
+        after all of the workers have finished.
+    locations: optional list of locations to load, as in the `location`
+        column of the result, e.g. ['US', '25']. Each source loader drops
+        other locations right after reading its files.
+    seasons: optional list of seasons to keep, e.g. ['2022/23', '2023/24']
+    start_date, end_date: optional first and last week end dates to keep
+    normalize_on: 'full' or 'filtered'; which rows the scale and center
+        factors are computed from when `seasons`, `start_date`, or `end_date`
+        are given. Factors are computed separately for each source and
+        location, so `locations` does not affect them.
+        - 'full' (default): factors use the full history of each location.
+          The result is the rows of the unfiltered result in the requested
+          seasons and dates. Only the location filter is applied during
+          loading; the others are applied to the result.
+        - 'filtered': factors use only the requested seasons and dates.
+          These filters are also applied during loading, so
+          `fill_missing_weeks` only fills weeks between the first and last
+          weeks with data in the requested seasons and dates.
+
+    Returns
+    -------
+    Pandas DataFrame, or if `return_normalization` is True, a tuple of the
+    data frame and a `normalization.Normalization` with the scale and center
+    factors for each source and location
+    '''
+    if sources is None:
+        sources = ['flusurvnet', 'hhs', 'ilinet']
+    
+    if power_transform not in normalization.POWER_TRANSFORMS:
+        raise ValueError('Only None, "4rt", and "sqrt" are supported for the power_transform argument.')
+    
+    if normalize_on not in ['full', 'filtered']:
+        raise ValueError('normalize_on must be "full" or "filtered".')
+    
+    row_filter = filters.RowFilter(locations=locations, seasons=seasons,
+                                   start_date=start_date, end_date=end_date)
+    # seasons and dates can only be filtered while loading if the factors are
+    # computed from the filtered rows
+    load_filter = row_filter if normalize_on == 'filtered' else row_filter.locations_only()
+    
+    df_by_source = self._load_source_data(sources, flusurvnet_kwargs, hhs_kwargs, ilinet_kwargs,
+                                          parallel=parallel,
+                                          row_filter=load_filter if load_filter != filters.RowFilter() else None)
+    df, norm = self._process_data(list(df_by_source.values()), power_transform, fill_missing_weeks,
+                                  factor_columns=not return_normalization)
+    
+    # in 'filtered' mode, this drops weeks inserted by fill_missing_weeks
+    # between requested seasons
+    if row_filter.has_time:
+        df = row_filter.time_only().apply(df).reset_index(drop=True)
+    
+    if compact:
+        df = transforms.compact_dtypes(df)
+    
+    if return_normalization:
+        return df, norm
+    
+    return df
+
+
+  def load_panel(self, features=None, **load_data_kwargs):
+    '''
+    Load influenza data as a dense `panel.Panel` with axes (source, location,
+    time, feature).
+
+    Parameters
+    ----------
+    features: optional list of numeric columns of the `load_data` result to
+        hold in the panel's values; see `panel.Panel.from_frame`
+    load_data_kwargs: keyword arguments to pass on to `load_data`
+
+    Returns
+    -------
+    `panel.Panel`, or if `return_normalization` is True, a tuple of the panel
+    and a `normalization.Normalization`
+    '''
+    result = self.load_data(**load_data_kwargs)
+    if load_data_kwargs.get('return_normalization', False):
+        df, norm = result
+        return panel.Panel.from_frame(df, features=features), norm
+    
+    return panel.Panel.from_frame(result, features=features)
+
+
+  def load_data_many(self, as_of_dates, sources=None, flusurvnet_kwargs=None, hhs_kwargs=None,
+                     ilinet_kwargs=None, power_transform='4rt', fill_missing_weeks=False,
+                     compact=False, return_normalization=False, parallel=None):
+    '''
+    Load influenza data as of each of several dates, as returned by
+    `load_data` with `hhs_kwargs={'as_of': as_of, ...}` for each date.
+
+    Only the HHS data depend on the `as_of` date, and the transformations
+    applied by `load_data` are computed separately for each combination of
+    source and location. The other sources are therefore loaded and
+    transformed once, and only the HHS data are loaded and transformed for
+    each date.
+
+    Parameters
+    ----------
+    as_of_dates: iterable of `as_of` dates to pass on to `load_hhs`
+    sources, flusurvnet_kwargs, hhs_kwargs, ilinet_kwargs, power_transform,
+        fill_missing_weeks, compact, return_normalization, parallel: as for
+        `load_data`. `hhs_kwargs` must not include `as_of`. `parallel` applies
+        to the sources other than hhs, which are loaded once.
 
     Returns
     -------
-    Pandas DataFrame
+    generator of tuples `(as_of, result)`, where `result` is the value
+    returned by `load_data` for that `as_of` date
     '''
     if sources is None:
         sources = ['flusurvnet', 'hhs', 'ilinet']
     
-    if flusurvnet_kwargs is None:
-        flusurvnet_kwargs = {}
+    if hhs_kwargs is None:
+        hhs_kwargs = {}
+    
+    if 'as_of' in hhs_kwargs:
+        raise ValueError('hhs_kwargs must not include as_of; the dates are given by as_of_dates.')
+    
+    if power_transform not in normalization.POWER_TRANSFORMS:
+        raise ValueError('Only None, "4rt", and "sqrt" are supported for the power_transform argument.')
+    
+    if parallel not in _PARALLEL_MODES:
+        raise ValueError('parallel must be None, "threads", or "processes".')
+    
+    # the arguments are checked above, when this method is called; the data
+    # are loaded by the generator, as the results are iterated over
+    return self._iter_data_many(as_of_dates, sources, flusurvnet_kwargs, hhs_kwargs, ilinet_kwargs,
+                                power_transform, fill_missing_weeks, compact, return_normalization,
+                                parallel)
+
+
+  def _iter_data_many(self, as_of_dates, sources, flusurvnet_kwargs, hhs_kwargs, ilinet_kwargs,
+                      power_transform, fill_missing_weeks, compact, return_normalization, parallel):
+    # process the sources other than hhs once; they sort before and after hhs
+    df_by_source = self._load_source_data([s for s in sources if s != 'hhs'],
+                                          flusurvnet_kwargs, None, ilinet_kwargs,
+                                          parallel=parallel)
+    df_before, norm_before = self._process_data(
+        [df for s, df in df_by_source.items() if s < 'hhs'],
+        power_transform, fill_missing_weeks, factor_columns=not return_normalization)
+    df_after, norm_after = self._process_data(
+        [df for s, df in df_by_source.items() if s > 'hhs'],
+        power_transform, fill_missing_weeks, factor_columns=not return_normalization)
+    
+    for as_of in as_of_dates:
+        if 'hhs' in sources:
+            df_hhs = self._load_source_data(['hhs'], None, {**hhs_kwargs, 'as_of': as_of}, None)['hhs']
+            df_hhs, norm_hhs = self._process_data([df_hhs], power_transform, fill_missing_weeks,
+                                                  factor_columns=not return_normalization)
+        else:
+            df_hhs, norm_hhs = None, None
+        
+        df = pd.concat([df_before, df_hhs, df_after], axis=0, ignore_index=True)
+        if compact:
+            df = transforms.compact_dtypes(df)
+        
+        if return_normalization:
+            norm = normalization.Normalization.concat(
+                [n for n in [norm_before, norm_hhs, norm_after] if n is not None])
+            yield as_of, (df, norm)
+        else:
+            yield as_of, df
+
+
+  def iter_data_blocks(self, sources=None, flusurvnet_kwargs=None, hhs_kwargs=None,
+                       ilinet_kwargs=None, power_transform='4rt', fill_missing_weeks=False,
+                       compact=False, return_normalization=False):
+    '''
+    Load influenza data as `load_data` does, one block of rows for a
+    combination of source and location at a time.
+    
+    Sources are loaded one at a time, and each block is transformed when it is
+    reached, so that memory use is bounded by the raw data for one source and
+    the rows of one block rather than by the full result of `load_data`.
+    Blocks are yielded in the order of the rows of `load_data`: sorted by
+    source, then by location. Concatenating the blocks, e.g. with
+    `pd.concat(blocks, ignore_index=True)`, gives the result of `load_data`.
+    
+    Parameters
+    ----------
+    sources, flusurvnet_kwargs, hhs_kwargs, ilinet_kwargs, power_transform,
+        fill_missing_weeks, compact, return_normalization: as for `load_data`.
+        With `compact`, the categorical columns of each block only have the
+        categories of the block's own values, so that concatenating the blocks
+        gives object columns for them; `transforms.compact_dtypes` converts
+        the concatenated blocks to the result of `load_data(compact=True)`.
+        The other arguments of `load_data` are not supported: sources are
+        loaded one after another, and locations, seasons, and dates are not
+        filtered.
+    
+    Returns
+    -------
+    generator of tuples `(source, location, result)`, where `result` is a data
+    frame with the rows of `load_data` for that source and location, with a
+    RangeIndex, or if `return_normalization` is True, a tuple of that data frame
+    and a `normalization.Normalization` for that source and location
+    '''
+    if sources is None:
+        sources = ['flusurvnet', 'hhs', 'ilinet']
+    
+    if power_transform not in normalization.POWER_TRANSFORMS:
+        raise ValueError('Only None, "4rt", and "sqrt" are supported for the power_transform argument.')
+    
+    # as in `load_data_many`, the arguments are checked when this method is
+    # called, and the data are loaded by the generator
+    return self._iter_data_blocks(sources, flusurvnet_kwargs, hhs_kwargs, ilinet_kwargs,
+                                  power_transform, fill_missing_weeks, compact,
+                                  return_normalization)
+
+
+  def _iter_data_blocks(self, sources, flusurvnet_kwargs, hhs_kwargs, ilinet_kwargs,
+                        power_transform, fill_missing_weeks, compact, return_normalization):
+    for source in sorted(sources):
+        df_source = self._load_source_data([source], flusurvnet_kwargs, hhs_kwargs, ilinet_kwargs)[source]
+        df_source = df_source.sort_values('location', kind='stable')
+        locations, starts = np.unique(df_source['location'].values, return_index=True)
+        ends = np.append(starts[1:], len(df_source))
+    
+        for location, start, end in zip(locations, starts, ends):
+            df, norm = self._process_data([df_source.iloc[start:end]], power_transform, fill_missing_weeks,
+                                          factor_columns=not return_normalization)
+            if compact:
+                df = transforms.compact_dtypes(df)
+            if return_normalization:
+                yield source, location, (df, norm)
+            else:
+                yield source, location, df
+    
+        del df_source
+
+
+  @profiling.traced()
+  def update_data(self, df, as_of, hhs_kwargs=None, power_transform='4rt',
+                  fill_missing_weeks=False, norm=None):
+    '''
+    Update a data frame returned by `load_data` to a new HHS data vintage,
+    recomputing only the HHS locations whose data were added to or revised.
+    
+    The transformations applied by `load_data` are computed separately for
+    each combination of source and location, so the rows for other sources
+    and for HHS locations with unchanged data are reused as they are. The
+    result is identical to the result of `load_data` with
+    `hhs_kwargs={'as_of': as_of, ...}`.
+    
+    Parameters
+    ----------
+    df: data frame returned by `load_data` with `compact=False`, or the data
+        frame in the result of `load_data` with `return_normalization=True`
+    as_of: `as_of` date of the new HHS data, passed on to `load_hhs`
+    hhs_kwargs, power_transform, fill_missing_weeks: as for `load_data`; must
+        match the arguments used to create `df`. `hhs_kwargs` must not include
+        `as_of`.
+    norm: `normalization.Normalization` returned with `df` by `load_data`
+        with `return_normalization=True`, or None
     
+    Returns
+    -------
+    tuple `(result, changes)`. `result` is the updated data frame or, if
+    `norm` is provided, a tuple of the updated data frame and normalization.
+    `changes` is a data frame with one row per HHS location whose data
+    changed, sorted by location, with columns:
+    - `location`
+    - `n_added`: number of weeks in the new data that were not in `df`
+    - `n_revised`: number of weeks whose value of `inc` changed
+    - `n_removed`: number of weeks in `df` that are not in the new data
+    - `max_abs_revision`: largest absolute change in `inc` among revised
+        weeks, on the scale of `inc`; NaN if no weeks were revised
+    - `total_revision`: sum of the changes in `inc` among revised weeks
+    '''
     if hhs_kwargs is None:
         hhs_kwargs = {}
     
-    if ilinet_kwargs is None:
-        ilinet_kwargs = {}
+    if 'as_of' in hhs_kwargs:
+        raise ValueError('hhs_kwargs must not include as_of; the date is given by as_of.')
     
-    if power_transform not in ['4rt', None]:
-        raise ValueError('Only None and "4rt" are supported for the power_transform argument.')
+    if power_transform not in normalization.POWER_TRANSFORMS:
+        raise ValueError('Only None, "4rt", and "sqrt" are supported for the power_transform argument.')
     
-    us_census = self.load_us_census()
-    fips_mappings = pd.read_csv(self.data_raw / 'fips-mappings/fips_mappings.csv')
+    if isinstance(df['source'].dtype, pd.CategoricalDtype):
+        raise ValueError('df must be loaded with compact=False.')
     
-    if 'hhs' in sources:
-        df_hhs = self.load_hhs(**hhs_kwargs)
-        df_hhs['inc'] = df_hhs['inc'] + 0.75**4
-    else:
-        df_hhs = None
+    if norm is not None and norm.power_transform != power_transform:
+        raise ValueError('norm must use the power transform given by power_transform.')
     
-    if 'ilinet' in sources:
-        df_ilinet = self.load_agg_transform_ilinet(fips_mappings=fips_mappings, **ilinet_kwargs)
+    factor_columns = 'inc_trans_scale_factor' in df.columns
+    
+    # new hhs data, with the weeks inserted by fill_missing_weeks
+    df_hhs_new = self._load_source_data(['hhs'], None, {**hhs_kwargs, 'as_of': as_of}, None)['hhs']
+    if fill_missing_weeks:
+        df_hhs_cmp = transforms.regularize_weekly(df_hhs_new, by=['source', 'location'],
+                                                  ffill_cols=['agg_level'], calendar_cols=True)
     else:
-        df_ilinet = None
+        df_hhs_cmp = df_hhs_new
+    
+    is_hhs = (df['source'] == 'hhs').values
+    df_hhs_old = df.loc[is_hhs]
+    merged = df_hhs_old[['location', 'wk_end_date', 'inc']].merge(
+        df_hhs_cmp[['location', 'wk_end_date', 'inc']],
+        on=['location', 'wk_end_date'], how='outer', suffixes=('_old', '_new'), indicator=True)
+    revision = merged['inc_new'].values - merged['inc_old'].values
+    revised = (merged['_merge'] == 'both').values & \
+        ~((merged['inc_old'].values == merged['inc_new'].values) |
+          (np.isnan(merged['inc_old'].values) & np.isnan(merged['inc_new'].values)))
+    changes = pd.DataFrame({
+            'location': merged['location'],
+            'n_added': (merged['_merge'] == 'right_only').values,
+            'n_revised': revised,
+            'n_removed': (merged['_merge'] == 'left_only').values,
+            'abs_revision': np.where(revised, np.abs(revision), np.nan),
+            'revision': np.where(revised, revision, 0.0)
+        }) \
+        .groupby('location', sort=True) \
+        .agg(n_added=('n_added', 'sum'), n_revised=('n_revised', 'sum'),
+             n_removed=('n_removed', 'sum'), max_abs_revision=('abs_revision', 'max'),
+             total_revision=('revision', 'sum')) \
+        .query('n_added > 0 or n_revised > 0 or n_removed > 0') \
+        .reset_index()
     
-    if 'flusurvnet' in sources:
-        df_flusurv = self.load_agg_transform_flusurv(fips_mappings=fips_mappings, **flusurvnet_kwargs)
+    # recompute the locations with changes; locations that are no longer in
+    # the hhs data are dropped
+    changed = changes['location'].values
+    df_hhs_changed = df_hhs_new.loc[df_hhs_new['location'].isin(changed).values]
+    if len(df_hhs_changed) > 0:
+        df_hhs_changed, norm_changed = self._process_data([df_hhs_changed], power_transform,
+                                                          fill_missing_weeks, factor_columns=factor_columns)
     else:
-        df_flusurv = None
+        df_hhs_changed, norm_changed = None, None
+    df_hhs = pd.concat([df_hhs_old.loc[~df_hhs_old['location'].isin(changed).values], df_hhs_changed],
+                       axis=0, ignore_index=True) \
+        .sort_values('location', kind='stable')
+    
+    df = pd.concat([df.loc[(df['source'] < 'hhs').values], df_hhs, df.loc[(df['source'] > 'hhs').values]],
+                   axis=0, ignore_index=True)
+    
+    if norm is None:
+        return df, changes
+    
+    unchanged = ~((norm.factors['source'] == 'hhs') & norm.factors['location'].isin(changed)).values
+    norm = normalization.Normalization.concat(
+        [normalization.Normalization(norm.factors.loc[unchanged], power_transform=power_transform, by=norm.by)] +
+        ([norm_changed] if norm_changed is not None else []))
+    return (df, norm), changes
+
+
+  @profiling.traced()
+  def _load_source_data(self, sources, flusurvnet_kwargs, hhs_kwargs, ilinet_kwargs, parallel=None,
+                        row_filter=None):
+    '''
+    Load and standardize data for each of the given sources, before the
+    transformations applied in `_process_data`.
+
+    Parameters
+    ----------
+    parallel: None, 'threads', or 'processes'; see `load_data`
+    row_filter: optional `filters.RowFilter` passed on to the loader of each
+        source, which applies it as early as possible
+
+    Returns
+    -------
+    dictionary mapping source names to data frames, in the order hhs, ilinet,
+    flusurvnet regardless of `parallel`
+    '''
+    if parallel not in _PARALLEL_MODES:
+        raise ValueError('parallel must be None, "threads", or "processes".')
+    
+    kwargs_by_source = {
+        'hhs': hhs_kwargs,
+        'ilinet': ilinet_kwargs,
+        'flusurvnet': flusurvnet_kwargs
+    }
+    kwargs_by_source = {s: {} if kwargs is None else kwargs
+                        for s, kwargs in kwargs_by_source.items() if s in sources}
+    if row_filter is not None:
+        kwargs_by_source = {s: {**kwargs, 'row_filter': row_filter}
+                            for s, kwargs in kwargs_by_source.items()}
+    
+    if parallel is None or len(kwargs_by_source) < 2:
+        return {s: self._load_one_source(s, kwargs) for s, kwargs in kwargs_by_source.items()}
+    
+    executor_class = ThreadPoolExecutor if parallel == 'threads' else ProcessPoolExecutor
+    with executor_class(max_workers=len(kwargs_by_source)) as executor:
+        if parallel == 'threads':
+            # worker threads start with an empty context; copy ours so that an
+            # active tracer records the stages they run
+            futures = {s: executor.submit(contextvars.copy_context().run, self._load_one_source, s, kwargs)
+                       for s, kwargs in kwargs_by_source.items()}
+        else:
+            futures = {s: executor.submit(self._load_one_source, s, kwargs)
+                       for s, kwargs in kwargs_by_source.items()}
+        
+        # wait for every source, so that no worker is left running on error
+        wait(futures.values())
+    
+    for s, future in futures.items():
+        if future.exception() is not None:
+            raise SourceLoadError(s, future.exception()) from future.exception()
+    
+    return {s: future.result() for s, future in futures.items()}
+
+
+  def _load_one_source(self, source, kwargs):
+    if source == 'hhs':
+        df_hhs = self.load_hhs(**kwargs)
+        df_hhs['inc'] = df_hhs['inc'] + 0.75**4
+        return df_hhs
+    
+    if source == 'ilinet':
+        return self.load_agg_transform_ilinet(**kwargs)
+    
+    return self.load_agg_transform_flusurv(**kwargs)
+
+
+  @profiling.traced()
+  def _process_data(self, dfs, power_transform, fill_missing_weeks, factor_columns=True):
+    '''
+    Combine data frames returned by `_load_source_data`, add populations, and
+    transform `inc` to the modeling scale. Every step is computed separately
+    for each combination of source and location.
+
+    Returns
+    -------
+    tuple of the combined data frame and the `normalization.Normalization`
+    fitted to it; both are None if `dfs` is empty
+    '''
+    if len(dfs) == 0:
+        return None, None
+    
+    us_census = self.load_us_census()
     
     df = pd.concat(
-        [df_hhs, df_ilinet, df_flusurv],
+        dfs,
         axis=0).sort_values(['source', 'location', 'wk_end_date'])
     
+    if fill_missing_weeks:
+        df = transforms.regularize_weekly(df, by=['source', 'location'],
+                                          ffill_cols=['agg_level'], calendar_cols=True)
+    
     # log population
-    df = df.merge(us_census, how='left', on=['location', 'season'])
-    df['log_pop'] = np.log(df['pop'])
-    
-    # process response variable:
-    # - fourth root transform to stabilize variability
-    # - divide by location- and source- specific 95th percentile
-    # - center relative to location- and source- specific mean
-    #   (note non-standard order of center/scale)
-    if power_transform is None:
-        df['inc_trans'] = df['inc'] + 0.01
-    elif power_transform == '4rt':
-        df['inc_trans'] = (df['inc'] + 0.01)**0.25
-    
-    df['inc_trans_scale_factor'] = df \
-        .assign(
-            inc_trans_in_season = lambda x: np.where((x['season_week'] < 10) | (x['season_week'] > 45),
-                                                     np.nan,
-                                                     x['inc_trans'])) \
-        .groupby(['source', 'location'])['inc_trans_in_season'] \
-        .transform(lambda x: x.quantile(0.95))
-    
-    df['inc_trans_cs'] = df['inc_trans'] / (df['inc_trans_scale_factor'] + 0.01)
-    df['inc_trans_center_factor'] = df \
-        .assign(
-            inc_trans_cs_in_season = lambda x: np.where((x['season_week'] < 10) | (x['season_week'] > 45),
-                                                        np.nan,
-                                                        x['inc_trans_cs'])) \
-        .groupby(['source', 'location'])['inc_trans_cs_in_season'] \
-        .transform(lambda x: x.mean())
-    df['inc_trans_cs'] = df['inc_trans_cs'] - df['inc_trans_center_factor']
-    
-    return(df)
\ No newline at end of file
+    with profiling.stage('merge_us_census', rows_in=len(df)) as stage:
+        df = df.merge(us_census, how='left', on=['location', 'season'])
+        df['log_pop'] = np.log(df['pop'])
+        stage.rows_out = len(df)
+    
+    # process response variable; see the normalization module
+    norm = normalization.Normalization.fit(df, power_transform=power_transform)
+    df_trans = norm.transform(df, factor_columns=factor_columns)
+    for c in df_trans.columns:
+        df[c] = df_trans[c].values
+    
+    return df, norm
@@ -0,0 +1,155 @@
+'''
+Vectorized conversions between dates, MMWR epidemiological weeks, and
+influenza seasons.
+
+All functions accept array-likes (NumPy arrays, pandas Series, or lists) and
+operate on the whole input at once, using a lookup table of the start dates of
+MMWR years 1990 through 2100. Results agree with the corresponding functions in
+`pymmwr`. A season starts in MMWR week 31 and is labeled by the years it spans,
+e.g. '2022/23'.
+'''
+
+import numpy as np
+import pandas as pd
+
+
+MIN_YEAR = 1990
+MAX_YEAR = 2100
+
+
+def _start_days_of_years(years):
+  # start date of each MMWR year, in days since 1970-01-01: the Sunday of the
+  # first week with at least four days in the calendar year
+  jan_one = (years - 1970).astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64)
+  # isoweekday: Monday is 1, Sunday is 7; 1970-01-01 was a Thursday
+  jan_one_isoweekday = (jan_one + 3) % 7 + 1
+  return jan_one + 7 * (jan_one_isoweekday > 3) - jan_one_isoweekday
+
+
+# start dates of MMWR years MIN_YEAR - 1 through MAX_YEAR + 1, so that the
+# number of weeks in the years before and after any supported year can be
+# looked up, e.g. to find the season week of a date early in MIN_YEAR
+_YEARS = np.arange(MIN_YEAR - 1, MAX_YEAR + 2)
+_YEAR_START_DAYS = _start_days_of_years(_YEARS)
+_WEEKS_IN_YEAR = np.diff(_YEAR_START_DAYS) // 7
+_SEASON_LABELS = np.array([f'{y}/{str(y + 1)[-2:]}' for y in _YEARS], dtype=object)
+
+
+def _to_days(dates):
+  days = np.asarray(pd.to_datetime(np.asarray(dates))).astype('datetime64[D]')
+  if np.isnat(days).any():
+    raise ValueError('dates must not be missing')
+  days = days.astype(np.int64)
+  if np.any(days < _YEAR_START_DAYS[1]) or np.any(days >= _YEAR_START_DAYS[-1]):
+    raise ValueError(f'dates must fall in MMWR years {MIN_YEAR} through {MAX_YEAR}')
+  return days
+
+
+def _year_index(years, min_year=MIN_YEAR):
+  years = np.asarray(years, dtype=np.int64)
+  if np.any(years < min_year) or np.any(years > MAX_YEAR):
+    raise ValueError(f'years must be between {MIN_YEAR} and {MAX_YEAR}')
+  return years - _YEARS[0]
+
+
+def epiweeks_in_year(years):
+  '''
+  Number of MMWR weeks (52 or 53) in each of the given years
+  '''
+  return _WEEKS_IN_YEAR[_year_index(years)]
+
+
+def date_to_epiweek(dates):
+  '''
+  MMWR year and week containing each of the given dates
+
+  Parameters
+  ----------
+  dates: array-like of dates, datetimes, or strings in format 'YYYY-MM-DD'
+
+  Returns
+  -------
+  tuple of integer arrays `(years, weeks)`
+  '''
+  days = _to_days(dates)
+  year_ind = np.searchsorted(_YEAR_START_DAYS, days, side='right') - 1
+  weeks = (days - _YEAR_START_DAYS[year_ind]) // 7 + 1
+  return _YEARS[year_ind], weeks
+
+
+def epiweek_to_date(years, weeks, day=7):
+  '''
+  Date of the given day in each MMWR week
+
+  Parameters
+  ----------
+  years: array-like of integer MMWR years
+  weeks: array-like of integer MMWR weeks
+  day: day of the week, from 1 (Sunday) to 7 (Saturday, the default: the
+    week ending date)
+
+  Returns
+  -------
+  NumPy array of datetime64[D] values
+  '''
+  start_days = _YEAR_START_DAYS[_year_index(years)]
+  days = start_days + 7 * (np.asarray(weeks, dtype=np.int64) - 1) + (day - 1)
+  return days.astype('datetime64[D]')
+
+
+def epiweek_to_season(years, weeks):
+  '''
+  Season label, e.g. '2022/23', for each MMWR week
+
+  Returns
+  -------
+  NumPy object array of strings
+  '''
+  years = np.asarray(years, dtype=np.int64)
+  _year_index(years)
+  season_start_years = years - (np.asarray(weeks, dtype=np.int64) <= 30)
+  return _SEASON_LABELS[_year_index(season_start_years, min_year=MIN_YEAR - 1)]
+
+
+def epiweek_to_season_week(years, weeks):
+  '''
+  Week of the season, starting from 1 at MMWR week 31, for each MMWR week
+
+  Returns
+  -------
+  NumPy integer array
+  '''
+  years = np.asarray(years, dtype=np.int64)
+  weeks = np.asarray(weeks, dtype=np.int64)
+  _year_index(years)
+  season_weeks = weeks - 30
+  prev_year_weeks = _WEEKS_IN_YEAR[_year_index(years - 1, min_year=MIN_YEAR - 1)]
+  return np.where(season_weeks <= 0, season_weeks + prev_year_weeks, season_weeks)
+
+
+def date_to_season(dates):
+  '''
+  Season label, e.g. '2022/23', for each of the given dates
+  '''
+  return epiweek_to_season(*date_to_epiweek(dates))
+
+
+def date_to_season_week(dates):
+  '''
+  Week of the season for each of the given dates
+  '''
+  return epiweek_to_season_week(*date_to_epiweek(dates))
+
+
+def date_to_wk_end_date(dates):
+  '''
+  Saturday ending the MMWR week that contains each of the given dates
+
+  Returns
+  -------
+  NumPy array of datetime64[D] values
+  '''
+  days = _to_days(dates)
+  # days since the most recent Sunday; 1970-01-04 was a Sunday
+  days_since_sunday = (days + 4) % 7
+  return (days + 6 - days_since_sunday).astype('datetime64[D]')
@@ -0,0 +1,306 @@
+'''
+Power transform, scaling, and centering of surveillance signals.
+
+Signals are transformed to a scale suitable for input to models by:
+- a power transform of `inc + 0.01` (fourth root, square root, or identity)
+  to stabilize variability
+- division by a source- and location-specific scale factor, the 95th
+  percentile of the transformed in-season values, plus 0.01
+- subtraction of a source- and location-specific center factor, the mean of
+  the scaled in-season values (note the non-standard order of center/scale)
+
+`Normalization` keeps the scale and center factors in a side table with one
+row per combination of source and location, and provides the exact inverse of
+the transformation for post-processing predictions. Group statistics are
+computed with NumPy kernels over rows sorted by group; they reproduce the
+results of `Series.quantile` and `Series.mean` applied to each group exactly.
+'''
+
+import numpy as np
+import pandas as pd
+
+from . import profiling
+
+
+POWER_TRANSFORMS = {'4rt': 4, 'sqrt': 2, None: 1}
+
+# season weeks included when computing scale and center factors
+IN_SEASON_WEEKS = (10, 45)
+
+
+def apply_power_transform(values, transform):
+  '''
+  Apply a power transform to `values + 0.01`
+
+  Parameters
+  ----------
+  values: array-like of non-negative values
+  transform: '4rt', 'sqrt', or None
+
+  Returns
+  -------
+  NumPy array of transformed values
+  '''
+  values = np.asarray(values, dtype=np.float64)
+  if transform == '4rt':
+    return (values + 0.01)**0.25
+  elif transform == 'sqrt':
+    return np.sqrt(values + 0.01)
+  elif transform is None:
+    return values + 0.01
+  else:
+    raise ValueError('transform must be "4rt", "sqrt", or None.')
+
+
+def invert_power_transform(values, transform):
+  '''
+  Inverse of `apply_power_transform`. Negative values, which can arise in
+  predictions on the transformed scale, are truncated at 0 first.
+  '''
+  if transform not in POWER_TRANSFORMS:
+    raise ValueError('transform must be "4rt", "sqrt", or None.')
+  values = np.asarray(values, dtype=np.float64)
+  return np.maximum(values, 0.0) ** POWER_TRANSFORMS[transform] - 0.01
+
+
+def _sort_by_group(group_codes, n_groups):
+  # stable order of rows by group, and the offsets of each group in that order
+  order = np.argsort(group_codes, kind='stable')
+  counts = np.bincount(group_codes, minlength=n_groups)
+  offsets = np.concatenate([[0], np.cumsum(counts)])
+  return order, counts, offsets
+
+
+def group_quantile(values, group_codes, n_groups, q):
+  '''
+  Quantile of the non-missing values in each group, using linear
+  interpolation between order statistics as in `np.percentile`
+
+  Parameters
+  ----------
+  values: NumPy float array
+  group_codes: NumPy integer array of the same length as `values`, with codes
+    from 0 to `n_groups - 1`
+  n_groups: number of groups
+  q: quantile level, between 0 and 1
+
+  Returns
+  -------
+  NumPy array with one value per group; NaN for groups with no non-missing
+  values
+  '''
+  keep = ~np.isnan(values)
+  values, group_codes = values[keep], group_codes[keep]
+  order = np.lexsort((values, group_codes))
+  sorted_values = values[order]
+  counts = np.bincount(group_codes, minlength=n_groups)
+  offsets = np.concatenate([[0], np.cumsum(counts)])[:-1]
+
+  result = np.full(n_groups, np.nan)
+  nonempty = counts > 0
+  n = counts[nonempty]
+  start = offsets[nonempty]
+
+  # same arithmetic as np.percentile with method='linear'
+  virtual = (n - 1) * q
+  prev_ind = np.floor(virtual).astype(np.int64)
+  above = virtual >= n - 1
+  prev_ind[above] = n[above] - 1
+  next_ind = np.where(above, prev_ind, prev_ind + 1)
+  gamma = np.where(above, virtual + 1.0, virtual - prev_ind)
+
+  a = sorted_values[start + prev_ind]
+  b = sorted_values[start + next_ind]
+  diff_b_a = b - a
+  lerp = a + diff_b_a * gamma
+  lerp = np.where(gamma >= 0.5, b - diff_b_a * (1 - gamma), lerp)
+  result[nonempty] = lerp
+
+  return result
+
+
+def group_mean(values, group_codes, n_groups):
+  '''
+  Mean of the non-missing values in each group, summing in the same order as
+  `Series.mean` applied to each group, which uses NumPy's pairwise summation
+  over the group with missing values replaced by 0.
+
+  Parameters
+  ----------
+  values: NumPy float array
+  group_codes: NumPy integer array of the same length as `values`, with codes
+    from 0 to `n_groups - 1`; within each group, values are summed in the
+    order they appear
+  n_groups: number of groups
+
+  Returns
+  -------
+  NumPy array with one value per group; NaN for groups with no non-missing
+  values
+  '''
+  order, counts, offsets = _sort_by_group(group_codes, n_groups)
+  sorted_values = values[order]
+  n_valid = np.bincount(group_codes, weights=~np.isnan(values), minlength=n_groups)
+  sorted_values = np.where(np.isnan(sorted_values), 0.0, sorted_values)
+
+  # groups with the same number of rows are summed together as rows of a
+  # matrix, one row per group
+  sums = np.zeros(n_groups)
+  for length in np.unique(counts[counts > 0]):
+    groups = np.flatnonzero(counts == length)
+    rows = offsets[groups][:, None] + np.arange(length)
+    sums[groups] = sorted_values[rows].sum(axis=1)
+
+  with np.errstate(invalid='ignore', divide='ignore'):
+    return np.where(n_valid > 0, sums / n_valid, np.nan)
+
+
+class Normalization():
+  def __init__(self, factors, power_transform='4rt', by=['source', 'location']) -> None:
+    '''
+    Parameters
+    ----------
+    factors: data frame with the columns in `by` and columns `scale_factor`
+      and `center_factor`, with one row per group
+    power_transform: '4rt', 'sqrt', or None
+    by: columns identifying a group
+    '''
+    if power_transform not in POWER_TRANSFORMS:
+      raise ValueError('power_transform must be "4rt", "sqrt", or None.')
+    self.factors = factors.reset_index(drop=True)
+    self.power_transform = power_transform
+    self.by = by
+    self._index = pd.MultiIndex.from_frame(self.factors[by].astype(object))
+
+
+  @classmethod
+  @profiling.traced()
+  def fit(cls, df, power_transform='4rt', by=['source', 'location'], value_col='inc',
+          season_week_col='season_week'):
+    '''
+    Compute scale and center factors for each group in a data frame.
+
+    Parameters
+    ----------
+    df: data frame with the columns in `by`, `value_col`, and
+      `season_week_col`. Center factors are computed by summing over the rows
+      of each group in the order they appear in `df`.
+    power_transform: '4rt', 'sqrt', or None
+    by: columns identifying a group
+    value_col: name of the column with values to transform
+    season_week_col: name of the column with the season week; only rows with
+      season weeks from 10 through 45 are used to compute the factors
+
+    Returns
+    -------
+    Normalization
+    '''
+    grouped = df.groupby(by, sort=True, observed=True)
+    group_codes = grouped.ngroup().fillna(-1).values.astype(np.int64)
+    factors = grouped.size().reset_index()[by]
+    n_groups = len(factors)
+
+    # rows with missing keys are not part of any group
+    in_group = group_codes >= 0
+    group_codes = group_codes[in_group]
+
+    season_week = df[season_week_col].to_numpy(dtype=np.float64, na_value=np.nan)[in_group]
+    out_of_season = (season_week < IN_SEASON_WEEKS[0]) | (season_week > IN_SEASON_WEEKS[1])
+
+    inc_trans = apply_power_transform(
+      df[value_col].to_numpy(dtype=np.float64, na_value=np.nan)[in_group],
+      power_transform)
+    scale_factor = group_quantile(np.where(out_of_season, np.nan, inc_trans),
+                                  group_codes, n_groups, 0.95)
+
+    inc_trans_cs = inc_trans / (scale_factor[group_codes] + 0.01)
+    center_factor = group_mean(np.where(out_of_season, np.nan, inc_trans_cs),
+                               group_codes, n_groups)
+
+    factors['scale_factor'] = scale_factor
+    factors['center_factor'] = center_factor
+    return cls(factors, power_transform=power_transform, by=by)
+
+
+  @classmethod
+  def concat(cls, normalizations):
+    '''
+    Combine normalizations fitted to disjoint sets of groups with the same
+    power transform
+    '''
+    power_transforms = {n.power_transform for n in normalizations}
+    if len(power_transforms) != 1:
+      raise ValueError('normalizations must use the same power transform.')
+    by = normalizations[0].by
+    factors = pd.concat([n.factors for n in normalizations], axis=0) \
+      .sort_values(by) \
+      .reset_index(drop=True)
+    return cls(factors, power_transform=power_transforms.pop(), by=by)
+
+
+  def _group_factors(self, df):
+    # scale and center factors for each row of df; NaN for unknown groups
+    keys = pd.MultiIndex.from_arrays([df[c].astype(object) for c in self.by])
+    ind = self._index.get_indexer(keys)
+    scale_factor = np.where(ind >= 0, self.factors['scale_factor'].values[ind], np.nan)
+    center_factor = np.where(ind >= 0, self.factors['center_factor'].values[ind], np.nan)
+    return scale_factor, center_factor
+
+
+  @profiling.traced()
+  def transform(self, df, value_col='inc', prefix='inc_trans', factor_columns=False):
+    '''
+    Transform values to the modeling scale.
+
+    Parameters
+    ----------
+    df: data frame with the columns in `by` and `value_col`
+    value_col: name of the column with values to transform
+    prefix: prefix for the names of the result columns
+    factor_columns: if True, the result also has the scale and center
+      factors for each row
+
+    Returns
+    -------
+    Pandas DataFrame with the index of `df` and columns `{prefix}` (power
+    transformed values) and `{prefix}_cs` (scaled and centered values). If
+    `factor_columns` is True, columns `{prefix}_scale_factor` and
+    `{prefix}_center_factor` are included before and after `{prefix}_cs`.
+    '''
+    scale_factor, center_factor = self._group_factors(df)
+    inc_trans = apply_power_transform(
+      df[value_col].to_numpy(dtype=np.float64, na_value=np.nan),
+      self.power_transform)
+    inc_trans_cs = inc_trans / (scale_factor + 0.01)
+
+    result = {prefix: inc_trans}
+    if factor_columns:
+      result[f'{prefix}_scale_factor'] = scale_factor
+    result[f'{prefix}_cs'] = inc_trans_cs - center_factor
+    if factor_columns:
+      result[f'{prefix}_center_factor'] = center_factor
+
+    return pd.DataFrame(result, index=df.index)
+
+
+  @profiling.traced()
+  def inverse(self, df, values):
+    '''
+    Map values on the modeling scale back to the original scale: the exact
+    inverse of `transform` for the `{prefix}_cs` column. Negative values on
+    the power transformed scale are truncated at 0.
+
+    Parameters
+    ----------
+    df: data frame with the columns in `by`, identifying the group of each
+      value
+    values: array-like of values on the scaled and centered scale, with one
+      entry per row of `df`, e.g. predictions
+
+    Returns
+    -------
+    NumPy array of values on the original scale
+    '''
+    scale_factor, center_factor = self._group_factors(df)
+    inc_trans = (np.asarray(values, dtype=np.float64) + center_factor) * (scale_factor + 0.01)
+    return invert_power_transform(inc_trans, self.power_transform)
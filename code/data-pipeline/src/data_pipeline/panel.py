@@ -0,0 +1,217 @@
+'''
+Dense panel representation of data frames in the long format returned by
+`FluDataLoader.load_data`.
+
+A `Panel` holds the numeric columns of the frame in one array with axes
+(source, location, time, feature), with NaN in cells that have no row in the
+frame, and the string columns (e.g. `agg_level`, `season`) as integer codes
+with axes (source, location, time). The axes are labelled by sorted indexes of
+the sources, locations, and week end dates in the frame, so models that
+work with one array per location (SARIX) or with integer season and week
+indexes (GLG) can index into the panel directly instead of pivoting the frame.
+
+Example:
+panel = fdl.load_panel()
+inc = panel.sel(source='hhs', feature='inc_trans_cs')  # (location, time) view
+season_codes, seasons = panel.codes('season')
+df = panel.to_frame()  # the frame returned by `load_data`
+'''
+
+import numpy as np
+import pandas as pd
+
+
+KEY_COLUMNS = ['source', 'location', 'wk_end_date']
+
+
+class Panel():
+  def __init__(self, values, observed, sources, locations, dates, features,
+               labels=None, columns=None, dtypes=None) -> None:
+    '''
+    Parameters
+    ----------
+    values: array of shape (source, location, time, feature) with the
+      numeric columns, NaN where there is no row
+    observed: boolean array of shape (source, location, time), True where
+      the frame has a row
+    sources, locations, dates, features: labels of the axes of `values`
+    labels: optional dictionary mapping names of non-numeric columns to tuples
+      `(codes, categories)`, where `codes` is an integer array of shape
+      (source, location, time) indexing `categories`, with -1 for missing
+    columns: optional order of the columns of `to_frame`; defaults to the
+      keys, then `labels`, then `features`
+    dtypes: optional dictionary of dtypes for the columns of `to_frame`
+    '''
+    self.values = values
+    self.observed = observed
+    self.sources = pd.Index(sources)
+    self.locations = pd.Index(locations)
+    self.dates = pd.DatetimeIndex(dates)
+    self.features = pd.Index(features)
+    self.labels = {} if labels is None else labels
+    self.columns = KEY_COLUMNS + list(self.labels) + list(self.features) if columns is None \
+      else list(columns)
+    self.dtypes = {} if dtypes is None else dtypes
+
+
+  @classmethod
+  def from_frame(cls, df, features=None, dtype=None):
+    '''
+    Build a panel from a data frame with one row per combination of
+    `source`, `location`, and `wk_end_date`.
+
+    Parameters
+    ----------
+    df: data frame in the format returned by `FluDataLoader.load_data`
+    features: optional list of numeric columns to hold in `values`; defaults
+      to all numeric columns other than the keys. Other non-key columns are
+      held as label codes.
+    dtype: optional dtype of `values`; defaults to the common dtype of the
+      features, at least float32 so that missing cells can be NaN
+
+    Returns
+    -------
+    Panel
+    '''
+    missing = [c for c in KEY_COLUMNS if c not in df.columns]
+    if len(missing) > 0:
+      raise ValueError(f'df must have the columns {KEY_COLUMNS}; missing {missing}')
+
+    if df.duplicated(KEY_COLUMNS).any():
+      raise ValueError('df has more than one row for some combinations of source, location, and wk_end_date.')
+
+    other_columns = [c for c in df.columns if c not in KEY_COLUMNS]
+    if features is None:
+      features = [c for c in other_columns
+                  if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+    label_columns = [c for c in other_columns if c not in features]
+
+    sources = pd.Index(np.sort(df['source'].astype(str).unique()))
+    locations = pd.Index(np.sort(df['location'].astype(str).unique()))
+    dates = pd.DatetimeIndex(np.sort(df['wk_end_date'].unique()))
+    s = sources.get_indexer(df['source'].astype(str))
+    l = locations.get_indexer(df['location'].astype(str))
+    t = dates.get_indexer(df['wk_end_date'])
+    shape = (len(sources), len(locations), len(dates))
+
+    if dtype is None:
+      dtype = np.result_type(np.float32, *[df[c].dtype.numpy_dtype if hasattr(df[c].dtype, 'numpy_dtype')
+                                           else df[c].dtype for c in features])
+    values = np.full(shape + (len(features),), np.nan, dtype=dtype)
+    values[s, l, t, :] = df[features].to_numpy(dtype=dtype, na_value=np.nan)
+
+    observed = np.zeros(shape, dtype=bool)
+    observed[s, l, t] = True
+
+    labels = {}
+    for c in label_columns:
+      if isinstance(df[c].dtype, pd.CategoricalDtype):
+        codes, categories = df[c].cat.codes.to_numpy(), df[c].cat.categories
+      else:
+        codes, categories = pd.factorize(df[c], sort=True)
+      label_codes = np.full(shape, -1, dtype=np.min_scalar_type(-max(len(categories), 1)))
+      label_codes[s, l, t] = codes
+      labels[c] = (label_codes, pd.Index(categories))
+
+    return cls(values, observed, sources, locations, dates, features, labels=labels,
+               columns=list(df.columns), dtypes=df.dtypes.to_dict())
+
+
+  @property
+  def shape(self):
+    return self.values.shape
+
+
+  def _axis_index(self, axis_labels, key, name):
+    # an integer for a single label, so that indexing returns a view; an
+    # array of integers for a list of labels
+    if key is None:
+      return slice(None)
+    if pd.api.types.is_list_like(key):
+      indexer = axis_labels.get_indexer(key)
+      if (indexer < 0).any():
+        raise KeyError(f'{name} not in panel: {list(pd.Index(key)[indexer < 0])}')
+      return indexer
+    return axis_labels.get_loc(key)
+
+
+  def sel(self, source=None, location=None, feature=None):
+    '''
+    Select from `values` by label. Each argument may be None (all), a single
+    label, which drops that axis, or a list of labels. Selections using only
+    None and single labels are views of `values`; lists of labels copy.
+    '''
+    indexers = (self._axis_index(self.sources, source, 'source'),
+                self._axis_index(self.locations, location, 'location'),
+                slice(None),
+                self._axis_index(self.features, feature, 'feature'))
+    if sum(isinstance(i, np.ndarray) for i in indexers) <= 1:
+      return self.values[indexers]
+
+    # numpy pairs up several index arrays; take one axis at a time instead so
+    # that lists of labels on several axes select their cross product
+    result = self.values
+    for axis, i in reversed(list(enumerate(indexers))):
+      if not isinstance(i, slice):
+        result = np.take(result, i, axis=axis)
+    return result
+
+
+  def check_complete(self):
+    '''
+    Raise a ValueError if any combination of source, location, and week has
+    no row in the frame, for models that need every location observed in
+    every week rather than NaN in the missing cells
+    '''
+    s, l, t = np.nonzero(~self.observed)
+    if len(s) > 0:
+      missing = pd.DataFrame({
+        'source': self.sources.to_numpy()[s],
+        'location': self.locations.to_numpy()[l],
+        'wk_end_date': self.dates.to_numpy()[t]
+      })
+      raise ValueError(f'The panel has no data for {len(missing)} combinations of source, location, '
+                       f'and wk_end_date, e.g.:\n{missing.head().to_string(index=False)}')
+
+
+  def codes(self, column):
+    '''
+    Integer codes of a label column, with shape (source, location, time) and
+    -1 where there is no row or the value is missing, and the labels they
+    index
+
+    Returns
+    -------
+    tuple `(codes, categories)`
+    '''
+    return self.labels[column]
+
+
+  def to_frame(self):
+    '''
+    Long data frame with one row per observed cell, sorted by source,
+    location, and wk_end_date. For a panel built by `from_frame` from a
+    frame sorted in that order with a default index, this is equal to that
+    frame.
+    '''
+    s, l, t = np.nonzero(self.observed)
+    data = {
+      'source': self.sources.to_numpy()[s],
+      'location': self.locations.to_numpy()[l],
+      'wk_end_date': self.dates.to_numpy()[t]
+    }
+    for c, (label_codes, categories) in self.labels.items():
+      if isinstance(self.dtypes.get(c), pd.CategoricalDtype):
+        data[c] = pd.Categorical.from_codes(label_codes[s, l, t], dtype=self.dtypes[c])
+      else:
+        row_codes = label_codes[s, l, t]
+        data[c] = np.where(row_codes >= 0, categories.to_numpy(dtype=object)[row_codes], np.nan)
+    values = self.values[s, l, t]
+    for i, c in enumerate(self.features):
+      data[c] = values[:, i]
+
+    df = pd.DataFrame(data)[self.columns]
+    for c, dtype in self.dtypes.items():
+      if c in df.columns and df[c].dtype != dtype:
+        df[c] = df[c].astype(dtype)
+    return df
@@ -0,0 +1,296 @@
+'''
+Opt-in stage-level profiling of the data pipeline.
+
+Loading steps of `FluDataLoader` (and the schema reads and normalization
+they use) are marked as stages with the `traced` decorator or the `stage`
+context manager. While a `Tracer` is active, each call to a stage records its
+wall time, CPU time, the number of rows in its data frame inputs and output,
+and the peak resident set size of the process. When no tracer is active, a
+stage costs one context variable lookup.
+
+Example:
+fdl = FluDataLoader('../../data-raw')
+with fdl.trace() as tracer:
+  df = fdl.load_data()
+tracer.summary()
+tracer.to_csv('profile.csv')
+tracer.to_chrome_trace('profile.json')
+'''
+
+import contextvars
+import functools
+import json
+import sys
+import threading
+import time
+
+import pandas as pd
+
+try:
+  import resource
+except ImportError:
+  # not available on Windows
+  resource = None
+
+
+_ACTIVE_TRACER = contextvars.ContextVar('data_pipeline_tracer', default=None)
+
+_REPORT_COLUMNS = ['stage', 'path', 'depth', 'thread', 'start', 'wall_time', 'cpu_time',
+                   'rows_in', 'rows_out', 'peak_rss_mb', 'error']
+
+
+def _peak_rss_mb():
+  if resource is None:
+    return None
+  max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # kilobytes on Linux, bytes on macOS
+  return max_rss / 2**20 if sys.platform == 'darwin' else max_rss / 2**10
+
+
+def _count_rows(values):
+  # total number of rows in the data frames among values, which may be nested
+  # in lists, tuples, or dictionaries; None if there are none
+  n_rows = None
+  for v in values:
+    if isinstance(v, pd.DataFrame):
+      n = len(v)
+    elif isinstance(v, (list, tuple)):
+      n = _count_rows(v)
+    elif isinstance(v, dict):
+      n = _count_rows(list(v.values()))
+    else:
+      n = None
+    if n is not None:
+      n_rows = n if n_rows is None else n_rows + n
+  return n_rows
+
+
+class Stage():
+  '''
+  A stage being recorded; `rows_in` and `rows_out` may be set inside the
+  `with` block of `stage`
+  '''
+  def __init__(self, name, rows_in=None) -> None:
+    self.name = name
+    self.rows_in = rows_in
+    self.rows_out = None
+
+
+class Tracer():
+  def __init__(self) -> None:
+    '''
+    Collects timings of the stages called while it is active. Use as a
+    context manager; tracers can be nested, and the innermost one is active.
+    '''
+    self.records = []
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    self._origin = None
+    self._token = None
+
+
+  def __enter__(self):
+    if self._origin is None:
+      self._origin = time.perf_counter()
+    self._token = _ACTIVE_TRACER.set(self)
+    return self
+
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    _ACTIVE_TRACER.reset(self._token)
+    self._token = None
+    return False
+
+
+  def activate(self, fn, *args, **kwargs):
+    '''
+    Call `fn(*args, **kwargs)` with this tracer active, e.g. in a worker
+    thread, which does not inherit the tracer of the thread that started it
+    '''
+    token = _ACTIVE_TRACER.set(self)
+    try:
+      return fn(*args, **kwargs)
+    finally:
+      _ACTIVE_TRACER.reset(token)
+
+
+  def _record(self, stage, path, start_wall, end_wall, start_cpu, end_cpu, error):
+    record = {
+      'stage': stage.name,
+      'path': path,
+      'depth': path.count(';'),
+      'thread': threading.get_ident(),
+      'start': start_wall - self._origin,
+      'wall_time': end_wall - start_wall,
+      'cpu_time': end_cpu - start_cpu,
+      'rows_in': stage.rows_in,
+      'rows_out': stage.rows_out,
+      'peak_rss_mb': _peak_rss_mb(),
+      'error': error
+    }
+    with self._lock:
+      self.records.append(record)
+
+
+  def report(self):
+    '''
+    Data frame with one row per completed stage call, in order of completion,
+    with columns:
+    - `stage`: name of the stage
+    - `path`: names of the enclosing stages and the stage, separated by ';'
+    - `depth`: number of enclosing stages
+    - `thread`: identifier of the thread that ran the stage
+    - `start`: start time in seconds since the tracer was first entered
+    - `wall_time`, `cpu_time`: elapsed wall time and process CPU time, in
+      seconds, including enclosed stages
+    - `rows_in`: rows in the data frame arguments of the stage, if any
+    - `rows_out`: rows in the data frame returned by the stage, if any
+    - `peak_rss_mb`: peak resident set size of the process when the stage
+      ended, in MiB
+    - `error`: name of the exception raised by the stage, if any
+    '''
+    with self._lock:
+      records = list(self.records)
+    report = pd.DataFrame(records, columns=_REPORT_COLUMNS)
+    report['rows_in'] = report['rows_in'].astype('Int64')
+    report['rows_out'] = report['rows_out'].astype('Int64')
+    return report
+
+
+  def summary(self):
+    '''
+    Totals of `report` by stage: number of calls, wall time, CPU time, and
+    rows, sorted by decreasing wall time
+    '''
+    return self.report() \
+      .groupby('stage', sort=False) \
+      .agg(calls=('stage', 'size'), wall_time=('wall_time', 'sum'), cpu_time=('cpu_time', 'sum'),
+           rows_in=('rows_in', lambda x: x.sum(min_count=1)),
+           rows_out=('rows_out', lambda x: x.sum(min_count=1)),
+           peak_rss_mb=('peak_rss_mb', 'max')) \
+      .sort_values('wall_time', ascending=False) \
+      .reset_index()
+
+
+  def to_csv(self, path):
+    '''Write `report` to a csv file'''
+    self.report().to_csv(path, index=False)
+
+
+  def to_json(self, path):
+    '''Write `report` to a json file as a list of records'''
+    self.report().to_json(path, orient='records', indent=2)
+
+
+  def to_chrome_trace(self, path):
+    '''
+    Write the stages as complete events in the Trace Event Format, which is
+    displayed as a flame chart by chrome://tracing, Perfetto, and speedscope
+    '''
+    events = [
+      {'name': r['stage'], 'cat': 'data_pipeline', 'ph': 'X', 'pid': 0, 'tid': r['thread'],
+       'ts': r['start'] * 1e6, 'dur': r['wall_time'] * 1e6,
+       'args': {k: r[k] for k in ['rows_in', 'rows_out', 'peak_rss_mb', 'error'] if r[k] is not None}}
+      for r in self.records
+    ]
+    with open(path, 'w') as f:
+      json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+  def to_folded_stacks(self, path):
+    '''
+    Write the self time of each stack of stages, in microseconds, in the
+    folded stack format read by flamegraph.pl and speedscope
+    '''
+    report = self.report()
+    self_time = report.groupby('path', sort=False)['wall_time'].sum()
+    parents = report['path'].str.rsplit(';', n=1).str[0].where(report['depth'] > 0)
+    child_time = report.loc[parents.notna()].groupby(parents[parents.notna()])['wall_time'].sum()
+    self_time = self_time.sub(child_time, fill_value=0).clip(lower=0)
+    with open(path, 'w') as f:
+      for stack, t in self_time.items():
+        f.write(f'{stack} {int(round(t * 1e6))}\n')
+
+
+class _StageContext():
+  def __init__(self, tracer, stage) -> None:
+    self.tracer = tracer
+    self.stage = stage
+
+
+  def __enter__(self):
+    stack = getattr(self.tracer._local, 'stack', None)
+    if stack is None:
+      stack = self.tracer._local.stack = []
+    stack.append(self.stage.name)
+    self.path = ';'.join(stack)
+    self.start_cpu = time.process_time()
+    self.start_wall = time.perf_counter()
+    return self.stage
+
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    end_wall = time.perf_counter()
+    end_cpu = time.process_time()
+    self.tracer._local.stack.pop()
+    self.tracer._record(self.stage, self.path, self.start_wall, end_wall, self.start_cpu, end_cpu,
+                        None if exc_type is None else exc_type.__name__)
+    return False
+
+
+class _NullStageContext():
+  def __init__(self, stage) -> None:
+    self.stage = stage
+
+
+  def __enter__(self):
+    return self.stage
+
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    return False
+
+
+def active_tracer():
+  '''The active `Tracer`, or None if no tracer is active'''
+  return _ACTIVE_TRACER.get()
+
+
+def stage(name, rows_in=None):
+  '''
+  Context manager marking a block of code as a stage named `name`. The
+  `Stage` it returns can be used to set `rows_in` and `rows_out`.
+  '''
+  tracer = _ACTIVE_TRACER.get()
+  if tracer is None:
+    return _NullStageContext(Stage(name, rows_in))
+  return _StageContext(tracer, Stage(name, rows_in))
+
+
+def traced(name=None):
+  '''
+  Decorator marking a function or method as a stage. Rows in are counted in
+  data frame arguments (including lists of data frames), and rows out in the
+  returned data frame or the data frames in a returned tuple.
+
+  Parameters
+  ----------
+  name: name of the stage; defaults to the qualified name of the function
+  '''
+  def decorator(fn):
+    stage_name = fn.__qualname__ if name is None else name
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+      tracer = _ACTIVE_TRACER.get()
+      if tracer is None:
+        return fn(*args, **kwargs)
+
+      with _StageContext(tracer, Stage(stage_name, _count_rows(list(args) + list(kwargs.values())))) as s:
+        result = fn(*args, **kwargs)
+        s.rows_out = _count_rows([result])
+      return result
+
+    return wrapper
+
+  return decorator
@@ -0,0 +1,233 @@
+'''
+Declared layouts of the raw csv files in `data-raw`.
+
+Each `SourceSchema` lists the columns that the loaders use from a file, with
+their types, so that files are parsed by the pandas C parser reading only
+those columns, rather than by inferring types for every column in the file.
+'''
+
+import numpy as np
+import pandas as pd
+
+from . import profiling
+
+
+class SchemaError(ValueError):
+  '''
+  Error raised when a raw data file does not match its declared schema. The
+  message names the schema and the field that failed.
+  '''
+  pass
+
+
+class SourceSchema():
+  def __init__(self, name, columns, column_prefixes=None, date_columns=None,
+               encoding='utf-8', lower_case_columns=False) -> None:
+    '''
+    Parameters
+    ----------
+    name: name of the schema, used in error messages
+    columns: dictionary mapping names of the columns to read to their dtypes.
+      A dtype of None leaves the type to be inferred by the parser, e.g. for
+      counts that are integers unless some values are missing.
+    column_prefixes: optional dictionary mapping prefixes to dtypes; every
+      column whose name starts with one of the prefixes is also read, e.g. the
+      yearly population estimates in the wide census files
+    date_columns: optional list of names of columns in `columns` holding dates
+      in format 'YYYY-MM-DD', which are converted to datetime64
+    encoding: encoding of the file
+    lower_case_columns: if True, names of columns in the file are matched to
+      the (lower case) names in `columns` ignoring case, and the result has
+      lower case column names
+    '''
+    self.name = name
+    self.columns = columns
+    self.column_prefixes = {} if column_prefixes is None else column_prefixes
+    self.date_columns = [] if date_columns is None else date_columns
+    self.encoding = encoding
+    self.lower_case_columns = lower_case_columns
+
+
+  def _key(self, column):
+    return column.lower() if self.lower_case_columns else column
+
+
+  def _dtype(self, column):
+    key = self._key(column)
+    if key in self.columns:
+      return self.columns[key]
+    for prefix, dtype in self.column_prefixes.items():
+      if key.startswith(prefix):
+        return dtype
+    raise KeyError(column)
+
+
+  def _is_selected(self, column):
+    key = self._key(column)
+    return key in self.columns or any(key.startswith(p) for p in self.column_prefixes)
+
+
+  def read(self, path):
+    '''
+    Read the columns declared in the schema from a csv file.
+
+    Parameters
+    ----------
+    path: path to the csv file
+
+    Returns
+    -------
+    Pandas DataFrame with the declared columns, in the order they appear in
+    the file
+
+    Raises
+    ------
+    SchemaError if a declared column is missing from the file or some values
+    cannot be converted to the declared type
+    '''
+    with profiling.stage(f'SourceSchema.read[{self.name}]') as stage:
+      dat = self._read(path)
+      stage.rows_out = len(dat)
+    return dat
+
+
+  def _read(self, path):
+    header = pd.read_csv(path, nrows=0, encoding=self.encoding).columns
+    file_keys = {self._key(c) for c in header}
+    missing = [c for c in self.columns if c not in file_keys]
+    if len(missing) > 0:
+      raise SchemaError(f'{path}: column "{missing[0]}" declared in schema "{self.name}" is not in the file')
+
+    usecols = [c for c in header if self._is_selected(c)]
+    dtype = {c: self._dtype(c) for c in usecols
+             if self._dtype(c) is not None and self._key(c) not in self.date_columns}
+    dtype.update({c: str for c in usecols if self._key(c) in self.date_columns})
+    try:
+      dat = pd.read_csv(path, usecols=usecols, dtype=dtype, encoding=self.encoding, engine='c')
+    except (ValueError, TypeError, OverflowError) as e:
+      raise SchemaError(self._describe_failure(path, usecols, dtype, e)) from e
+
+    if self.lower_case_columns:
+      dat.columns = dat.columns.str.lower()
+
+    for c in self.date_columns:
+      try:
+        dat[c] = pd.to_datetime(dat[c], format='%Y-%m-%d')
+      except (ValueError, TypeError) as e:
+        raise SchemaError(f'{path}: values of field "{c}" in schema "{self.name}" '
+                          f'could not be parsed as dates: {e}') from e
+
+    return dat
+
+
+  def _describe_failure(self, path, usecols, dtype, error):
+    # find the first field that cannot be parsed with its declared type
+    raw = pd.read_csv(path, usecols=usecols, dtype=str, encoding=self.encoding, engine='c')
+    for c, t in dtype.items():
+      try:
+        values = raw[c].dropna()
+        if np.dtype(t).kind in 'iu':
+          if raw[c].isna().any():
+            raise ValueError('missing values in an integer column')
+          values.astype(np.float64).astype(t)
+          if not np.all(values.astype(np.float64) == values.astype(np.float64).round()):
+            raise ValueError('non-integer values in an integer column')
+        else:
+          values.astype(t)
+      except (ValueError, TypeError, OverflowError) as e:
+        return f'{path}: values of field "{self._key(c)}" in schema "{self.name}" could not be parsed as {np.dtype(t)}: {e}'
+
+    return f'{path}: could not be read with schema "{self.name}": {error}'
+
+
+ILINET = SourceSchema(
+  'ilinet',
+  columns={
+    'region_type': str,
+    'region': str,
+    'year': np.int64,
+    'week': np.int64,
+    'weighted_ili': np.float64,
+    'unweighted_ili': np.float64,
+    'ilitotal': np.float64,
+    'week_start': 'datetime64[ns]',
+    'season_week': np.int64,
+    'season': str
+  },
+  date_columns=['week_start'],
+  encoding='ISO-8859-1')
+
+WHO_NREVSS = SourceSchema(
+  'who-nrevss',
+  columns={
+    'region_type': str,
+    'region': str,
+    'year': np.int64,
+    'week': np.int64,
+    'season': str,
+    'season_week': np.int64,
+    'percent_positive': np.float64
+  },
+  encoding='ISO-8859-1')
+
+OLD_FLUSURV_RATES = SourceSchema(
+  'old-flusurv-rates',
+  columns={
+    'sea_label': str,
+    'region': str,
+    'age_label': str,
+    'wk_end': str,
+    'season_week': np.int64,
+    'weeklyrate': np.float64
+  },
+  encoding='ISO-8859-1',
+  lower_case_columns=True)
+
+FLUSURV_RATES_2022_23 = SourceSchema(
+  'flusurv-rates-2022-23',
+  columns={
+    'catchment': str,
+    'network': str,
+    'year': str,
+    'mmwr-year': np.int64,
+    'mmwr-week': np.int64,
+    'age category': str,
+    'sex category': str,
+    'race category': str,
+    'weekly rate ': np.float64
+  },
+  encoding='ISO-8859-1',
+  lower_case_columns=True)
+
+HHS = SourceSchema(
+  'hhs',
+  columns={
+    'location': str,
+    'date': str,
+    # counts; missing values in hhs_complete.csv
+    'inc': None
+  })
+
+US_CENSUS = SourceSchema(
+  'us-census',
+  columns={
+    'STATE': str,
+    'NAME': str
+  },
+  column_prefixes={'POPESTIMATE': np.int64})
+
+FIPS_MAPPINGS = SourceSchema(
+  'fips-mappings',
+  columns={
+    'abbreviation': str,
+    'location': str,
+    'location_name': str,
+    'hhs_region': np.float64
+  })
+
+BURDEN_ESTIMATES = SourceSchema(
+  'burden-estimates',
+  columns={
+    'Season': str,
+    'Estimate': np.float64
+  })
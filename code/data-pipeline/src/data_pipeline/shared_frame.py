@@ -0,0 +1,240 @@
+'''
+Share a data frame with worker processes without copying or parsing it again.
+
+`SharedFrame.publish` writes a data frame once, as an Arrow IPC file in shared
+memory (`/dev/shm` where available). Processes that `attach` to it memory-map
+the file, and the numeric and date columns of the frames they build are
+read-only views of the mapped pages, so the data are held in memory once no
+matter how many workers use them. String columns are stored with dictionary
+encoding and are returned as categoricals, unless requested as strings.
+
+A `SharedFrame` passed to a worker process (e.g. as an argument to a function
+run by `multiprocessing.Pool` or `concurrent.futures.ProcessPoolExecutor`) is
+sent as its path and attaches on arrival. The file is removed when the
+publishing `SharedFrame` is closed, garbage collected, or when the publishing
+process exits.
+
+Example:
+with SharedFrame.publish(df) as shared:
+  with ProcessPoolExecutor() as executor:
+    results = list(executor.map(fit_one, repeat(shared), locations))
+
+def fit_one(shared, location):
+  df = shared.to_frame()
+  ...
+'''
+
+import json
+import os
+import tempfile
+import uuid
+import weakref
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+_METADATA_KEY = b'data_pipeline.shared_frame'
+
+_INDEX_COLUMN = '__index__'
+
+
+def _default_root():
+  # /dev/shm is a memory-backed file system on Linux; elsewhere the files
+  # are in the page cache of a regular temporary directory
+  shm = Path('/dev/shm')
+  if shm.is_dir() and os.access(shm, os.W_OK):
+    return shm
+  return Path(tempfile.gettempdir())
+
+
+def _to_arrow(series):
+  # NaN in float columns stays NaN rather than becoming an Arrow null, so that
+  # those columns can be read back without copying
+  if isinstance(series.dtype, pd.CategoricalDtype):
+    codes, categories = series.cat.codes.to_numpy(), series.cat.categories
+  elif series.dtype == object:
+    codes, categories = pd.factorize(series)
+  else:
+    codes = None
+  if codes is not None:
+    return pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0),
+                                          pa.array(categories.to_numpy()))
+  if isinstance(series.dtype, np.dtype):
+    return pa.array(series.to_numpy())
+  return pa.array(series)
+
+
+def _remove(path, pid):
+  # processes forked from the publisher inherit its finalizer; only the
+  # publisher removes the file
+  if os.getpid() != pid:
+    return
+  try:
+    os.remove(path)
+  except FileNotFoundError:
+    pass
+
+
+class SharedFrame():
+  def __init__(self, path, owner=False) -> None:
+    '''
+    Use `SharedFrame.publish` or `SharedFrame.attach` rather than calling
+    this directly.
+
+    Parameters
+    ----------
+    path: path to the Arrow IPC file holding the frame
+    owner: boolean; if True, the file is removed when this object is closed
+      or garbage collected, or the process exits
+    '''
+    self.path = Path(path)
+    self.owner = owner
+    self._table = None
+    self._metadata = None
+    self._finalizer = weakref.finalize(self, _remove, str(self.path), os.getpid()) if owner else None
+
+
+  @classmethod
+  def publish(cls, df, root=None):
+    '''
+    Write a data frame to shared memory.
+
+    Parameters
+    ----------
+    df: data frame; its columns must have string names
+    root: optional directory for the file; defaults to `/dev/shm` if it is
+      writable and the system temporary directory otherwise
+
+    Returns
+    -------
+    SharedFrame owning the file
+    '''
+    root = _default_root() if root is None else Path(root)
+    path = root / f'data_pipeline-{os.getpid()}-{uuid.uuid4().hex}.arrow'
+
+    arrays = [_to_arrow(df[c]) for c in df.columns]
+    names = list(df.columns)
+    if not (isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1):
+      arrays.append(_to_arrow(df.index.to_series()))
+      names.append(_INDEX_COLUMN)
+
+    metadata = {
+      'columns': list(df.columns),
+      'strings': [c for c in df.columns if df[c].dtype == object],
+      # nullable dtypes such as Int16, which Arrow returns as numpy dtypes
+      # when there are no missing values
+      'extension_dtypes': {c: str(df[c].dtype) for c in df.columns
+                           if not isinstance(df[c].dtype, (np.dtype, pd.CategoricalDtype))},
+      'ordered': [c for c in df.columns
+                  if isinstance(df[c].dtype, pd.CategoricalDtype) and df[c].dtype.ordered],
+      'index_name': df.index.name
+    }
+    table = pa.Table.from_arrays(arrays, names=names) \
+      .replace_schema_metadata({_METADATA_KEY: json.dumps(metadata)})
+
+    shared = cls(path, owner=True)
+    with pa.OSFile(str(path), 'wb') as f:
+      with pa.ipc.new_file(f, table.schema) as writer:
+        writer.write_table(table)
+    return shared
+
+
+  @classmethod
+  def attach(cls, path):
+    '''
+    Attach to a frame published by `publish`, possibly in another process
+
+    Returns
+    -------
+    SharedFrame that does not own the file
+    '''
+    return cls(path, owner=False)
+
+
+  def __reduce__(self):
+    # send only the path to other processes
+    return (SharedFrame.attach, (str(self.path),))
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+    return False
+
+
+  def close(self):
+    '''
+    Release the memory map; if this object published the frame, also remove
+    the file. Frames returned by `to_frame` remain valid, since they keep the
+    pages they use mapped.
+    '''
+    self._table = None
+    if self._finalizer is not None:
+      self._finalizer()
+
+
+  @property
+  def table(self):
+    '''The memory-mapped `pyarrow.Table`'''
+    if self._table is None:
+      source = pa.memory_map(str(self.path), 'r')
+      self._table = pa.ipc.open_file(source).read_all()
+      self._metadata = json.loads(self._table.schema.metadata[_METADATA_KEY])
+    return self._table
+
+
+  @property
+  def columns(self):
+    '''Names of the columns of the published frame'''
+    self.table
+    return list(self._metadata['columns'])
+
+
+  def to_frame(self, columns=None, strings_as_categories=True):
+    '''
+    Build the published data frame, or some of its columns. Numeric and date
+    columns are read-only views of the shared memory, so modifying them in
+    place raises an error. Columns with nullable dtypes such as `Int16` are
+    the exception, and are copied.
+
+    Parameters
+    ----------
+    columns: optional list of columns to include
+    strings_as_categories: boolean; if True (default), string columns are
+      returned as categoricals, which needs little memory in each process.
+      If False, they are converted back to strings.
+
+    Returns
+    -------
+    Pandas DataFrame
+    '''
+    table = self.table
+    columns = self.columns if columns is None else list(columns)
+    has_index = _INDEX_COLUMN in table.column_names
+
+    df = table.select(columns).to_pandas(split_blocks=True, ignore_metadata=True)
+    if has_index:
+      # assigned rather than set with `set_index`, which would copy the frame
+      index = table.column(_INDEX_COLUMN).to_pandas()
+      if isinstance(index.dtype, pd.CategoricalDtype):
+        index = index.astype(object)
+      df.index = pd.Index(index)
+      df.index.name = self._metadata['index_name']
+
+    for c, dtype in self._metadata['extension_dtypes'].items():
+      if c in df.columns and str(df[c].dtype) != dtype:
+        df[c] = df[c].astype(dtype)
+    for c in self._metadata['ordered']:
+      if c in df.columns:
+        df[c] = df[c].cat.as_ordered()
+    if not strings_as_categories:
+      for c in self._metadata['strings']:
+        if c in df.columns:
+          df[c] = df[c].astype(object)
+    return df
@@ -0,0 +1,183 @@
+'''
+Vectorized transformation stages shared by the loaders for different data
+sources.
+'''
+
+import numpy as np
+import pandas as pd
+
+from . import mmwr
+from . import profiling
+
+
+# names used for sub-locations in the surveillance data, mapped to the name of
+# the location they are a part of in `fips_mappings.csv`
+LOCATION_ALIASES = {
+  'New York City': 'New York',
+  'New York - Albany': 'New York',
+  'New York - Rochester': 'New York',
+  'Commonwealth of the Northern Mariana Islands': 'Northern Mariana Islands'
+}
+
+
+def build_location_index(fips_mappings, aliases=LOCATION_ALIASES):
+  '''
+  Build an index mapping location names to FIPS codes.
+
+  Parameters
+  ----------
+  fips_mappings: data frame with columns `location` (FIPS code) and
+    `location_name`, as returned by `FluDataLoader.load_fips_mappings`
+  aliases: dictionary mapping names of sub-locations to the `location_name`
+    of the location they belong to
+
+  Returns
+  -------
+  Pandas Series of FIPS codes indexed by location name
+  '''
+  index = pd.Series(fips_mappings['location'].values,
+                    index=fips_mappings['location_name'].values)
+  alias_index = pd.Series(index.reindex(list(aliases.values())).values,
+                          index=list(aliases.keys()))
+  index = pd.concat([index, alias_index.dropna()])
+  index.index.name = 'location_name'
+  index.name = 'location'
+  return index
+
+
+@profiling.traced()
+def aggregate_sub_locations(df, location_index,
+                            by=['season', 'season_week', 'wk_end_date', 'source'],
+                            value_col='inc', agg_level='state'):
+  '''
+  Aggregate sub-location data to the FIPS locations they belong to by taking
+  the mean of `value_col` across sub-locations, ignoring missing values.
+
+  Parameters
+  ----------
+  df: data frame with a `location` column of location names, the columns in
+    `by`, and `value_col`
+  location_index: Pandas Series mapping location names to FIPS codes, as
+    returned by `build_location_index`. Rows of `df` with a location that is
+    not in the index are dropped.
+  by: columns other than the location that identify an observation
+  value_col: name of the column to aggregate
+  agg_level: value for the `agg_level` column of the result
+
+  Returns
+  -------
+  Pandas DataFrame with columns `location` (FIPS code), the columns in `by`,
+  `value_col`, and `agg_level`, with one row per combination of FIPS code and
+  values of `by`
+  '''
+  fips = df['location'].map(location_index)
+  keep = fips.notna().values
+
+  dat = df.loc[keep, by + [value_col]]
+  dat.insert(0, 'location', fips.values[keep])
+  dat = dat.groupby(['location'] + by, sort=True)[value_col] \
+    .mean() \
+    .reset_index()
+  dat['agg_level'] = agg_level
+
+  return dat
+
+
+@profiling.traced()
+def regularize_weekly(df, by=['source', 'location'], date_col='wk_end_date',
+                      ffill_cols=[], calendar_cols=False):
+  '''
+  Reindex each series in `df` onto a complete weekly calendar, from the first
+  to the last date observed for that series, in a single pass over all series.
+
+  Parameters
+  ----------
+  df: data frame with the columns in `by` and `date_col`. Within each series,
+    dates must be unique and a whole number of weeks apart.
+  by: columns identifying a series, e.g. a combination of source and location
+  date_col: name of the column with the dates of observations
+  ffill_cols: columns that are filled in for inserted rows by carrying forward
+    the last observed value in the same series. Other columns are missing in
+    inserted rows.
+  calendar_cols: if True, the `season` and `season_week` columns of inserted
+    rows are computed from their dates using the MMWR calendar rather than
+    being left missing or carried forward
+
+  Returns
+  -------
+  Pandas DataFrame with the same columns as `df`, sorted by the columns in `by`
+  and `date_col`, with a RangeIndex
+  '''
+  df = df.reset_index(drop=True)
+  if df.duplicated(by + [date_col]).any():
+    raise ValueError(f'values of {date_col} must be unique within each series')
+  
+  group_codes = df.groupby(by, sort=True).ngroup().values
+  n_groups = group_codes.max() + 1 if len(df) > 0 else 0
+  days = df[date_col].values.astype('datetime64[D]').astype(np.int64)
+  start_days = np.full(n_groups, np.iinfo(np.int64).max)
+  end_days = np.full(n_groups, np.iinfo(np.int64).min)
+  np.minimum.at(start_days, group_codes, days)
+  np.maximum.at(end_days, group_codes, days)
+  if np.any((days - start_days[group_codes]) % 7 != 0):
+    raise ValueError(f'values of {date_col} must be a whole number of weeks apart within each series')
+  
+  # position of each row of the complete calendar, and of each observed row
+  # within it
+  n_weeks = (end_days - start_days) // 7 + 1
+  group_offsets = np.concatenate([[0], np.cumsum(n_weeks)])
+  full_group_codes = np.repeat(np.arange(n_groups), n_weeks)
+  week_ind = np.arange(group_offsets[-1]) - group_offsets[full_group_codes]
+  full_days = start_days[full_group_codes] + 7 * week_ind
+  obs_pos = group_offsets[group_codes] + (days - start_days[group_codes]) // 7
+  
+  # build the result by placing observed rows at their calendar positions;
+  # inserted rows take group keys from the first row of their series
+  take = np.full(group_offsets[-1], -1)
+  take[obs_pos] = np.arange(len(df))
+  observed = take >= 0
+  # the first calendar week of each series is always observed
+  first_row = take[group_offsets[:-1]]
+  
+  result = df.iloc[np.where(observed, take, first_row[full_group_codes])].reset_index(drop=True)
+  result[date_col] = pd.to_datetime(full_days.astype('datetime64[D]')).values.astype(df[date_col].dtype)
+  other_cols = [c for c in df.columns if c not in by + [date_col]]
+  if len(other_cols) > 0:
+    inserted = pd.Series(~observed)
+    result[other_cols] = result[other_cols].mask(inserted, axis=0)
+  
+  if len(ffill_cols) > 0:
+    result[ffill_cols] = result[ffill_cols].groupby(full_group_codes).ffill()
+  
+  if calendar_cols and (~observed).any():
+    inserted_dates = result.loc[~observed, date_col]
+    result.loc[~observed, 'season'] = mmwr.date_to_season(inserted_dates)
+    result.loc[~observed, 'season_week'] = mmwr.date_to_season_week(inserted_dates)
+  
+  return result
+
+
+@profiling.traced()
+def compact_dtypes(df, category_cols=['source', 'agg_level', 'location', 'season'],
+                   int_cols=['season_week']):
+  '''
+  Convert a data frame to compact dtypes: categoricals for string keys,
+  nullable 16-bit integers for small integer columns, and float32 for all
+  float64 columns.
+
+  Parameters
+  ----------
+  df: data frame, e.g. as returned by `FluDataLoader.load_data`
+  category_cols: columns converted to categoricals, if present
+  int_cols: columns converted to `Int16`, if present
+
+  Returns
+  -------
+  Pandas DataFrame with the same columns, index, and values as `df`, up to
+  the precision of float32
+  '''
+  dtypes = {c: 'category' for c in category_cols if c in df.columns}
+  dtypes.update({c: 'Int16' for c in int_cols if c in df.columns})
+  dtypes.update({c: np.float32 for c in df.columns
+                 if c not in dtypes and df[c].dtype == np.float64})
+  return df.astype(dtypes)
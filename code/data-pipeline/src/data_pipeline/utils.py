@@ -1,11 +1,13 @@
 import datetime
+import functools
 
 import numpy as np
 import pandas as pd
-from pandas.tseries.holiday import USFederalHolidayCalendar
 
 import pymmwr
 
+from . import mmwr
+
 
 def date_to_ew_str(row, date_col_name='wk_end_date'):
     ew = pymmwr.date_to_epiweek(datetime.date.fromisoformat(row[date_col_name]))
@@ -25,13 +27,9 @@ def convert_epiweek_to_season_week(epiweek):
   epiweek_year = epiweek.str[:4].astype(int)
   epiweek_week = epiweek.str[4:].astype(int)
   
-  season_week = epiweek_week - 30
-
-  update_inds = (season_week <= 0)
-  season_week[update_inds] = season_week[update_inds] + \
-    [pymmwr.epiweeks_in_year(int(epiweek_year[update_inds].values[i]) - 1) for i in range(np.sum(update_inds))]
+  season_week = mmwr.epiweek_to_season_week(epiweek_year, epiweek_week)
   
-  return season_week
+  return pd.Series(season_week, index=epiweek.index)
 
 
 def convert_epiweek_to_season(epiweek):
@@ -44,39 +42,128 @@ def convert_epiweek_to_season(epiweek):
   epiweek_year = epiweek.str[:4].astype(int)
   epiweek_week = epiweek.str[4:].astype(int)
   
-  update_inds = (epiweek_week <= 30)
-  epiweek_year = epiweek_year - update_inds
-  season = epiweek_year.astype(str)
-  season = season + '/' + (season.str[-2:].astype(int) + 1).astype(str)
+  season = mmwr.epiweek_to_season(epiweek_year, epiweek_week)
   
-  return season
+  return pd.Series(season, index=epiweek.index)
 
 
 def convert_datetime_to_season_week(row, date_col_name):
-  ew = pymmwr.date_to_epiweek(row[date_col_name].date())
-  ew_str = pd.Series(str(ew.year) + str(ew.week))
-  return convert_epiweek_to_season_week(ew_str)
+  return mmwr.date_to_season_week([row[date_col_name]])[0]
 
 
-def get_season_hol(start_year):
-  holiday_cal = USFederalHolidayCalendar()
-  hol = holiday_cal.holidays(
-    start=datetime.datetime(year=start_year, month=7, day=1),
-    end=datetime.datetime(year=start_year+1, month=6, day=1),
-    return_name=True)
-    
-  hol = hol.reset_index()
-  hol.columns = ['date', 'holiday']
-  hol = hol.loc[hol['holiday'].isin(['Thanksgiving Day', 'Christmas Day'])]
+# rules of the US federal holidays observed by `USFederalHolidayCalendar`:
+# name, month, day, weekday offset as a tuple `(weekday, n)` for the n-th such
+# weekday (Monday is 0) on or after (n > 0) or on or before (n < 0) the month
+# and day, whether the holiday is observed on the nearest workday when it falls
+# on a weekend, and the first date on which it is observed
+_FEDERAL_HOLIDAY_RULES = [
+  ("New Year's Day", 1, 1, None, True, None),
+  ('Birthday of Martin Luther King, Jr.', 1, 1, (0, 3), False, '1986-01-01'),
+  ('Washington’s Birthday', 2, 1, (0, 3), False, None),
+  ('Memorial Day', 5, 31, (0, -1), False, None),
+  ('Juneteenth National Independence Day', 6, 19, None, True, '2021-06-18'),
+  ('Independence Day', 7, 4, None, True, None),
+  ('Labor Day', 9, 1, (0, 1), False, None),
+  ('Columbus Day', 10, 1, (0, 2), False, None),
+  ('Veterans Day', 11, 11, None, True, None),
+  ('Thanksgiving Day', 11, 1, (3, 4), False, None),
+  ('Christmas Day', 12, 25, None, True, None)
+]
+
+HOLIDAYS = [rule[0] for rule in _FEDERAL_HOLIDAY_RULES]
+
+# first season in the result of `get_holidays` by default; the last is the
+# latest season supported by the `mmwr` calendar
+FIRST_SEASON_START_YEAR = 1997
+
+
+def _days(years, month, day):
+  # days since 1970-01-01 of the given month and day in each year
+  months = (years - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (month - 1)
+  return months.astype('datetime64[D]').astype(np.int64) + (day - 1)
+
+
+def _weekday(days):
+  # Monday is 0; 1970-01-01 was a Thursday
+  return (days + 3) % 7
+
+
+@functools.lru_cache(maxsize=32)
+def _holiday_table(start_years, holidays):
+  # holidays observed from July 1 of each start year through June 1 of the
+  # next year, the window used by `get_season_hol` with the pandas calendar
+  start_years = np.array(start_years, dtype=np.int64)
+  window_start = _days(start_years, 7, 1)
+  window_end = _days(start_years + 1, 6, 1)
+  
+  parts = []
+  for name, month, day, offset, nearest_workday, first_date in _FEDERAL_HOLIDAY_RULES:
+    if name not in holidays:
+      continue
+    for year_offset in [0, 1]:
+      days = _days(start_years + year_offset, month, day)
+      if offset is not None:
+        weekday, n = offset
+        if n > 0:
+          days = days + (weekday - _weekday(days)) % 7 + 7 * (n - 1)
+        else:
+          days = days - (_weekday(days) - weekday) % 7 + 7 * (n + 1)
+      if nearest_workday:
+        days = days - (_weekday(days) == 5) + (_weekday(days) == 6)
+      
+      keep = (days >= window_start) & (days <= window_end)
+      if first_date is not None:
+        keep &= days >= np.datetime64(first_date, 'D').astype(np.int64)
+      parts.append(pd.DataFrame({'start_year': start_years[keep], 'holiday': name, 'days': days[keep]}))
   
-  hol['season'] = str(start_year) + '/' + str(start_year + 1)[-2:]
+  hol = pd.concat(parts, ignore_index=True) \
+    .sort_values(['start_year', 'days'], kind='stable') \
+    .reset_index(drop=True)
+  hol['season'] = [f'{y}/{str(y + 1)[-2:]}' for y in hol['start_year']]
+  hol['date'] = hol['days'].values.astype('datetime64[D]').astype('datetime64[ns]')
+  hol['season_week'] = mmwr.date_to_season_week(hol['date'])
   
-  return hol
+  return hol[['season', 'holiday', 'date', 'season_week']]
+
+
+def get_season_hol(start_year):
+  '''
+  Thanksgiving and Christmas in the season starting in `start_year`, with
+  columns `date`, `holiday`, and `season`
+  '''
+  return _holiday_table((start_year,), ('Thanksgiving Day', 'Christmas Day')) \
+    [['date', 'holiday', 'season']] \
+    .copy()
 
 
-def get_holidays():
-  hol = pd.concat([get_season_hol(sy) for sy in range(1997, 2024)],
-                  ignore_index=True)
-  hol['season_week'] = hol.apply(convert_datetime_to_season_week, axis=1, date_col_name='date')
+def get_holidays(seasons=None, holidays=['Thanksgiving Day', 'Christmas Day']):
+  '''
+  Dates and season weeks of US federal holidays, computed in closed form from
+  the rules of `pandas.tseries.holiday.USFederalHolidayCalendar`, with the
+  date on which each holiday is observed. Results are cached, so repeated
+  calls are cheap.
   
-  return hol[['season', 'holiday', 'date', 'season_week']]
+  Parameters
+  ----------
+  seasons: None or list of seasons, as labels in format '2023/24' or as
+    integer start years. Defaults to None, which includes every season from
+    1997/98 through the last season supported by the `mmwr` calendar.
+  holidays: list of names of holidays to include; see `HOLIDAYS`. Defaults
+    to Thanksgiving and Christmas.
+  
+  Returns
+  -------
+  Pandas DataFrame with columns `season`, `holiday`, `date`, and
+  `season_week`, sorted by season and date. Each season includes holidays
+  observed from July 1 through June 1 of the next year.
+  '''
+  unknown = [h for h in holidays if h not in HOLIDAYS]
+  if len(unknown) > 0:
+    raise ValueError(f'unknown holiday "{unknown[0]}"; holidays must be in {HOLIDAYS}')
+  
+  if seasons is None:
+    start_years = range(FIRST_SEASON_START_YEAR, mmwr.MAX_YEAR)
+  else:
+    start_years = sorted({int(str(s)[:4]) for s in seasons})
+  
+  return _holiday_table(tuple(start_years), tuple(holidays)).copy()
@@ -0,0 +1,340 @@
+'''
+Append-only store of HHS data vintages.
+
+Each weekly snapshot `influenza-hhs/hhs-YYYY-MM-DD.csv` repeats the full
+history of the data. The store keeps, for each vintage, only the
+(location, date, value) rows that are new or revised relative to the previous
+vintage. Each of these rows is also stored with the range of `as_of` dates it
+is valid for, so that the data as known on any date are read with one filtered
+scan of one file, without re-reading the full history stored in every snapshot
+or combining the rows of earlier vintages.
+
+Layout of a store directory:
+- `index.csv`: one row per vintage, in the order they were appended, with
+  columns `as_of` (date of the vintage, as in the snapshot file name),
+  `revision` (draft number, or `FINAL_REVISION` for a final release),
+  `part` (name of the file with the rows for that vintage), `source_file`
+  (name of the csv file the vintage was imported from), and `n_rows`
+- one Parquet file per vintage with columns `location`, `date`, `value`,
+  `as_of`, and `deleted`. Rows with `deleted` set record a (location, date)
+  that was present in the previous vintage but is absent from this one.
+  Parts are never modified once written.
+- `ranges.parquet`: the rows of all parts that hold a value, with columns
+  `location`, `date`, `value`, `valid_from`, and `valid_to`. A row is in the
+  data as of the dates from `valid_from`, its vintage, up to but not including
+  `valid_to`, the vintage that revised or deleted it, or `VALID_TO_LATEST` if
+  none has. It is rewritten by every append.
+
+The store can be built or updated from the command line, with
+`code/data-pipeline` as the working directory:
+python -m data_pipeline.vintages build ../../data-raw ../../data-raw/influenza-hhs/vintage-store
+python -m data_pipeline.vintages append ../../data-raw/influenza-hhs/vintage-store ../../data-raw/influenza-hhs/hhs-2024-05-08.csv
+'''
+
+import argparse
+import os
+import re
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import schemas
+
+
+FINAL_REVISION = 999
+
+# `valid_to` of the rows of `ranges.parquet` that are in the latest vintage
+VALID_TO_LATEST = '9999-12-31'
+
+_FILE_NAME_PATTERN = re.compile(r'hhs-(\d{4}-\d{2}-\d{2})(?:-draft(\d+))?\.csv$')
+
+_INDEX_COLUMNS = ['as_of', 'revision', 'part', 'source_file', 'n_rows']
+
+
+def parse_vintage_file_name(file_name):
+  '''
+  Parse the name of an HHS snapshot file.
+
+  Returns
+  -------
+  tuple `(as_of, revision)` with the date string in the file name and the draft
+  number, or `FINAL_REVISION` for a file that is not a draft; None if the name
+  does not match the format `hhs-YYYY-MM-DD.csv` or `hhs-YYYY-MM-DD-draftN.csv`
+  '''
+  m = _FILE_NAME_PATTERN.match(Path(file_name).name)
+  if m is None:
+    return None
+  revision = FINAL_REVISION if m.group(2) is None else int(m.group(2))
+  return m.group(1), revision
+
+
+class HHSVintageStore():
+  def __init__(self, root) -> None:
+    '''
+    Parameters
+    ----------
+    root: path to the directory holding the store; it is created by `build` or
+      by the first call to `append`
+    '''
+    self.root = Path(root)
+
+
+  @classmethod
+  def build(cls, data_raw, root, drafts='ignore'):
+    '''
+    Create a store from the HHS snapshot files in `data_raw/influenza-hhs`.
+
+    Parameters
+    ----------
+    data_raw: path to the `data-raw` directory
+    root: path to a directory for the store; must not contain a store already
+    drafts: policy for the `hhs-YYYY-MM-DD-draftN.csv` files:
+      - 'ignore' (default): only final snapshots are imported. This matches the
+        files considered by `FluDataLoader.load_hhs`.
+      - 'include': drafts are imported as vintages dated on the date in their
+        file name, ordered before the final snapshot of the same date if there
+        is one. Data as of that date then reflect the final snapshot if it
+        exists, and otherwise the latest draft.
+
+    Returns
+    -------
+    HHSVintageStore
+    '''
+    if drafts not in ['ignore', 'include']:
+      raise ValueError('drafts must be "ignore" or "include".')
+
+    store = cls(root)
+    if (store.root / 'index.csv').exists():
+      raise FileExistsError(f'A vintage store already exists in {store.root}')
+
+    files = []
+    for f in (Path(data_raw) / 'influenza-hhs').glob('hhs-*.csv'):
+      parsed = parse_vintage_file_name(f)
+      if parsed is not None and (drafts == 'include' or parsed[1] == FINAL_REVISION):
+        files.append((parsed, f))
+
+    for (as_of, revision), f in sorted(files):
+      store.append(f, as_of=as_of, revision=revision)
+
+    return store
+
+
+  def vintages(self):
+    '''
+    Data frame describing the vintages in the store, one row per vintage in
+    the order they were appended
+    '''
+    index_path = self.root / 'index.csv'
+    if not index_path.exists():
+      return pd.DataFrame({c: pd.Series(dtype=np.int64 if c in ['revision', 'n_rows'] else object)
+                           for c in _INDEX_COLUMNS})
+    return pd.read_csv(index_path, dtype={'as_of': str, 'revision': np.int64, 'part': str,
+                                          'source_file': str, 'n_rows': np.int64})
+
+
+  def append(self, csv_path, as_of=None, revision=None):
+    '''
+    Append a new vintage to the store.
+
+    Parameters
+    ----------
+    csv_path: path to an HHS snapshot csv file with columns `location`,
+      `date`, and `inc`
+    as_of: date of the vintage as a string in format 'YYYY-MM-DD' or a
+      `datetime.date`; defaults to the date in the file name
+    revision: draft number of the vintage; defaults to the value implied by the
+      file name, or `FINAL_REVISION` if the name has no draft number
+
+    Returns
+    -------
+    Pandas DataFrame with the rows added to the store
+    '''
+    parsed = parse_vintage_file_name(csv_path)
+    if as_of is None:
+      if parsed is None:
+        raise ValueError(f'as_of must be provided for file {csv_path}')
+      as_of = parsed[0]
+    if revision is None:
+      revision = FINAL_REVISION if parsed is None else parsed[1]
+    as_of = str(as_of)
+
+    index = self.vintages()
+    if len(index) > 0:
+      last = index.iloc[-1]
+      if (as_of, revision) <= (last['as_of'], last['revision']):
+        raise ValueError(f'Vintages must be appended in order; the latest vintage in the store is '
+                         f'{last["as_of"]} (revision {last["revision"]}).')
+
+    new = schemas.HHS.read(csv_path)
+    new = pd.DataFrame({'location': new['location'],
+                        'date': new['date'],
+                        'value': new['inc'].astype(np.float64)})
+    if new.duplicated(['location', 'date']).any():
+      raise ValueError(f'{csv_path} has more than one row for some combinations of location and date.')
+
+    # rows that are new or revised relative to the latest vintage, and rows
+    # that are no longer present
+    ranges = self._read_ranges(index)
+    prev = ranges.loc[ranges['valid_to'].values == VALID_TO_LATEST, ['location', 'date', 'value']]
+    merged = new.merge(prev, on=['location', 'date'], how='outer',
+                       suffixes=('', '_prev'), indicator=True)
+    deleted = (merged['_merge'] == 'right_only').values
+    changed = (merged['_merge'] == 'left_only').values | \
+      ((merged['_merge'] == 'both').values &
+       ~((merged['value'] == merged['value_prev']).values |
+         (merged['value'].isna() & merged['value_prev'].isna()).values))
+    delta = merged.loc[changed | deleted, ['location', 'date', 'value']].reset_index(drop=True)
+    delta['as_of'] = as_of
+    delta['deleted'] = deleted[changed | deleted]
+
+    self.root.mkdir(parents=True, exist_ok=True)
+    part = f'part-{len(index):05d}.parquet'
+    delta.to_parquet(self.root / part, index=False)
+    self._write_ranges(_update_ranges(ranges, delta, as_of))
+
+    index = pd.concat([
+      index,
+      pd.DataFrame({'as_of': [as_of], 'revision': [revision], 'part': [part],
+                    'source_file': [Path(csv_path).name], 'n_rows': [len(delta)]})
+    ], ignore_index=True)
+    index.to_csv(self.root / 'index.csv', index=False)
+
+    return delta
+
+
+  def _read_ranges(self, index, filters=None):
+    # rows of `ranges.parquet`, all of them or those matching `filters`
+    if len(index) == 0:
+      return _empty_ranges()
+
+    path = self.root / 'ranges.parquet'
+    if not path.exists():
+      # a store written before the ranges were stored; compute them once
+      ranges = _empty_ranges()
+      for p in index['part']:
+        part = pd.read_parquet(self.root / p)
+        ranges = _update_ranges(ranges, part, part['as_of'].iloc[0])
+      self._write_ranges(ranges)
+
+    return pd.read_parquet(path, filters=filters)
+
+
+  def _write_ranges(self, ranges):
+    # write to a temporary file and move it into place, so that readers never
+    # see a partially written file
+    fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+    os.close(fd)
+    try:
+      ranges.to_parquet(tmp_path, index=False)
+      os.replace(tmp_path, self.root / 'ranges.parquet')
+    finally:
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+  def files(self, as_of=None):
+    '''
+    Paths of the parts of the store with the data as of the given date. Parts
+    are never rewritten, so they determine the data; `index.csv` is not
+    included, as every append rewrites it without changing data as of
+    earlier dates.
+    '''
+    index = self.vintages()
+    n_vintages = len(index) if as_of is None else self._n_vintages(index, as_of)
+    return [self.root / p for p in index['part'][:n_vintages]]
+
+
+  def _n_vintages(self, index, as_of):
+    n_vintages = int(np.sum(index['as_of'].values <= str(as_of)))
+    if n_vintages == 0:
+      raise ValueError(f'The vintage store in {self.root} has no data as of {as_of}.')
+    return n_vintages
+
+
+  def load(self, as_of=None):
+    '''
+    Load HHS data as known on a given date.
+
+    Parameters
+    ----------
+    as_of: date as a string in format 'YYYY-MM-DD' or a `datetime.date`. The
+      result reflects the latest vintage dated on or before this date. Defaults
+      to None, which uses the latest vintage in the store.
+
+    Returns
+    -------
+    Pandas DataFrame with columns `location`, `date`, and `inc`, in the format
+    of the HHS snapshot csv files, sorted by location and date
+    '''
+    index = self.vintages()
+    if as_of is None:
+      filters = [('valid_to', '==', VALID_TO_LATEST)]
+    else:
+      self._n_vintages(index, as_of)
+      filters = [('valid_from', '<=', str(as_of)), ('valid_to', '>', str(as_of))]
+    dat = self._read_ranges(index, filters)[['location', 'date', 'value']] \
+      .sort_values(['location', 'date']) \
+      .reset_index(drop=True) \
+      .rename(columns={'value': 'inc'})
+
+    # snapshots record integer counts; match the type pandas infers from the csv files
+    inc = dat['inc'].values
+    if np.all(np.isfinite(inc)) and np.all(inc == np.round(inc)):
+      dat['inc'] = inc.astype(np.int64)
+
+    return dat
+
+
+def _empty_ranges():
+  return pd.DataFrame({'location': pd.Series(dtype=object), 'date': pd.Series(dtype=object),
+                       'value': pd.Series(dtype=np.float64), 'valid_from': pd.Series(dtype=object),
+                       'valid_to': pd.Series(dtype=object)})
+
+
+def _update_ranges(ranges, delta, as_of):
+  # rows of `ranges.parquet` after appending the vintage `as_of` with the
+  # rows `delta`: the latest rows that it revises or deletes end at `as_of`
+  ranges = ranges.copy()
+  latest = ranges['valid_to'].values == VALID_TO_LATEST
+  ended = latest & pd.MultiIndex.from_frame(ranges[['location', 'date']]) \
+    .isin(pd.MultiIndex.from_frame(delta[['location', 'date']]))
+  ranges.loc[ended, 'valid_to'] = as_of
+
+  added = delta.loc[~delta['deleted'].values, ['location', 'date', 'value']] \
+    .assign(valid_from=as_of, valid_to=VALID_TO_LATEST)
+  return pd.concat([ranges, added], ignore_index=True)
+
+
+def _make_parser():
+  parser = argparse.ArgumentParser(description='Build or update a store of HHS data vintages')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+
+  build_parser = subparsers.add_parser('build', help='import all HHS snapshot files into a new store')
+  build_parser.add_argument('data_raw', help='path to the data-raw directory')
+  build_parser.add_argument('root', help='path to a directory for the store')
+  build_parser.add_argument('--drafts', choices=['ignore', 'include'], default='ignore',
+                            help='whether to import hhs-YYYY-MM-DD-draftN.csv files')
+
+  append_parser = subparsers.add_parser('append', help='append one HHS snapshot file to a store')
+  append_parser.add_argument('root', help='path to the store directory')
+  append_parser.add_argument('csv_path', help='path to the HHS snapshot file')
+  append_parser.add_argument('--as_of', default=None,
+                             help='date of the vintage; defaults to the date in the file name')
+
+  return parser
+
+
+def main():
+  args = _make_parser().parse_args()
+  if args.command == 'build':
+    store = HHSVintageStore.build(args.data_raw, args.root, drafts=args.drafts)
+  else:
+    store = HHSVintageStore(args.root)
+    store.append(args.csv_path, as_of=args.as_of)
+  print(store.vintages().to_string(index=False))
+
+
+if __name__ == '__main__':
+  main()
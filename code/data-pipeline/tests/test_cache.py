@@ -0,0 +1,90 @@
+import shutil
+
+import pandas as pd
+import pytest
+from data_pipeline.loader import FluDataLoader
+from data_pipeline.vintages import HHSVintageStore
+
+
+@pytest.fixture
+def data_raw(tmp_path):
+    # copy of the parts of data-raw needed to load hhs data
+    data_raw = tmp_path / 'data-raw'
+    for d in ['fips-mappings', 'us-census']:
+        shutil.copytree(f'../../data-raw/{d}', data_raw / d)
+    (data_raw / 'influenza-hhs').mkdir()
+    shutil.copy('../../data-raw/influenza-hhs/hhs.csv', data_raw / 'influenza-hhs')
+    return data_raw
+
+
+def test_cached_load_matches_uncached(data_raw, tmp_path):
+    expected = FluDataLoader(data_raw).load_data(sources=['hhs'])
+    
+    fdl = FluDataLoader(data_raw, cache_dir=tmp_path / 'cache')
+    cold = fdl.load_data(sources=['hhs'])
+    assert len(list((tmp_path / 'cache').glob('load_hhs-*.parquet'))) == 1
+    warm = fdl.load_data(sources=['hhs'])
+    
+    pd.testing.assert_frame_equal(cold, expected)
+    pd.testing.assert_frame_equal(warm, expected)
+
+
+def test_cache_invalidated_when_source_file_changes(data_raw, tmp_path):
+    fdl = FluDataLoader(data_raw, cache_dir=tmp_path / 'cache')
+    fdl.load_hhs()
+    
+    hhs_path = data_raw / 'influenza-hhs' / 'hhs.csv'
+    hhs = pd.read_csv(hhs_path, dtype={'location': str})
+    hhs.loc[0, 'inc'] = hhs.loc[0, 'inc'] + 1000
+    hhs.to_csv(hhs_path, index=False)
+    
+    expected = FluDataLoader(data_raw).load_hhs()
+    actual = fdl.load_hhs()
+    pd.testing.assert_frame_equal(actual, expected)
+    
+    # the entry computed from the old version of the file was replaced
+    assert len(list((tmp_path / 'cache').glob('load_hhs-*.parquet'))) == 1
+
+
+def test_vintage_cache_kept_when_vintage_appended(data_raw, tmp_path):
+    store = HHSVintageStore(tmp_path / 'store')
+    for as_of in ['2023-10-18', '2023-10-25']:
+        shutil.copy(f'../../data-raw/influenza-hhs/hhs-{as_of}.csv', tmp_path)
+    store.append(tmp_path / 'hhs-2023-10-18.csv')
+    
+    fdl = FluDataLoader(data_raw, cache_dir=tmp_path / 'cache', hhs_vintages=tmp_path / 'store')
+    expected = fdl.load_hhs(as_of='2023-10-20')
+    entry = list((tmp_path / 'cache').glob('load_hhs-*.parquet'))
+    assert len(entry) == 1
+    mtime = entry[0].stat().st_mtime_ns
+    
+    # appending a later vintage rewrites the index of the store, but data as of
+    # earlier dates are unchanged and still read from the cache
+    store.append(tmp_path / 'hhs-2023-10-25.csv')
+    actual = fdl.load_hhs(as_of='2023-10-20')
+    pd.testing.assert_frame_equal(actual, expected)
+    assert list((tmp_path / 'cache').glob('load_hhs-*.parquet')) == entry
+    assert entry[0].stat().st_mtime_ns == mtime
+    
+    # data as of the new vintage are not
+    pd.testing.assert_frame_equal(fdl.load_hhs(as_of='2023-10-25'),
+                                  FluDataLoader(data_raw, hhs_vintages=tmp_path / 'store')
+                                  .load_hhs(as_of='2023-10-25'))
+
+
+def test_reference_tables_memoized(data_raw):
+    fdl = FluDataLoader(data_raw)
+    fdl.load_data(sources=['hhs'])
+    fdl.load_data(sources=['hhs'])
+    
+    stats = fdl.cache_stats().set_index('table')
+    assert stats.loc['load_us_census', 'misses'] == 1
+    assert stats.loc['load_us_census', 'hits'] == 3
+    
+    # callers get copies, so modifying a returned table does not affect the cache
+    us_census = fdl.load_us_census()
+    us_census['pop'] = 0
+    assert (fdl.load_us_census()['pop'] > 0).all()
+    
+    fdl.clear_cache()
+    assert fdl.cache_stats().empty
@@ -1,7 +1,9 @@
 import pytest
-from data_pipeline.loader import FluDataLoader
+from data_pipeline.loader import FluDataLoader, SourceLoadError
+from data_pipeline import normalization, transforms
 import numpy as np
 import datetime
+import pandas as pd
 
 def test_load_data_sources():
     fdl = FluDataLoader('../../data-raw')
@@ -70,3 +72,163 @@ def test_load_data_flusurvnet_kwargs(test_kwargs):
         assert len(df['location'].unique()) > 3
     else:
         assert len(df['location'].unique()) == len(test_kwargs['locations'])
+
+
+def test_load_data_many_matches_load_data():
+    fdl = FluDataLoader('../../data-raw')
+    
+    as_of_dates = ['2023-10-18', '2023-12-30', '2024-02-14']
+    ilinet_kwargs = {'scale_to_positive': False}
+    results = list(fdl.load_data_many(as_of_dates, sources=['hhs', 'ilinet'],
+                                      ilinet_kwargs=ilinet_kwargs, fill_missing_weeks=True))
+    
+    assert [as_of for as_of, _ in results] == as_of_dates
+    for as_of, df in results:
+        expected = fdl.load_data(sources=['hhs', 'ilinet'], hhs_kwargs={'as_of': as_of},
+                                 ilinet_kwargs=ilinet_kwargs, fill_missing_weeks=True)
+        pd.testing.assert_frame_equal(df, expected)
+    
+
+
+def test_load_data_many_checks_arguments_when_called():
+    fdl = FluDataLoader('../../data-raw')
+    
+    # no data are loaded before the arguments are checked
+    for kwargs in [{'hhs_kwargs': {'as_of': '2023-10-18'}}, {'power_transform': 'bogus'},
+                   {'parallel': 'bogus'}]:
+        with pytest.raises(ValueError):
+            fdl.load_data_many(['2023-10-18'], **kwargs)
+
+
+def test_iter_data_blocks_matches_load_data():
+    fdl = FluDataLoader('../../data-raw')
+    
+    kwargs = {'sources': ['hhs', 'ilinet'], 'ilinet_kwargs': {'scale_to_positive': False},
+              'fill_missing_weeks': True}
+    blocks = list(fdl.iter_data_blocks(**kwargs))
+    
+    keys = [(source, location) for source, location, _ in blocks]
+    assert keys == sorted(set(keys))
+    for source, location, df in blocks:
+        assert (df['source'] == source).all() and (df['location'] == location).all()
+    
+    expected = fdl.load_data(**kwargs)
+    pd.testing.assert_frame_equal(pd.concat([df for _, _, df in blocks], ignore_index=True),
+                                  expected, check_exact=True)
+    
+    # compact blocks hold the values of compact results
+    blocks = [df for _, _, df in fdl.iter_data_blocks(compact=True, **kwargs)]
+    assert blocks[0]['location'].dtype == 'category'
+    pd.testing.assert_frame_equal(transforms.compact_dtypes(pd.concat(blocks, ignore_index=True)),
+                                  fdl.load_data(compact=True, **kwargs), check_exact=True)
+    
+    with pytest.raises(ValueError):
+        fdl.iter_data_blocks(power_transform='bogus')
+
+
+@pytest.mark.parametrize("parallel", ['threads', 'processes'])
+def test_load_data_parallel_matches_load_data(parallel):
+    kwargs = {'sources': ['hhs', 'ilinet'], 'ilinet_kwargs': {'scale_to_positive': False}}
+    expected = FluDataLoader('../../data-raw').load_data(**kwargs)
+    
+    fdl = FluDataLoader('../../data-raw')
+    df = fdl.load_data(parallel=parallel, **kwargs)
+    pd.testing.assert_frame_equal(df, expected, check_exact=True)
+    
+    # reference tables used by both sources are computed once
+    stats = fdl.cache_stats().set_index('table')
+    assert (stats['misses'] <= 1).all()
+    
+    with pytest.raises(SourceLoadError) as excinfo:
+        fdl.load_data(parallel=parallel, hhs_kwargs={'drop_pandemic_seasons': False, 'as_of': '2023-12-30'},
+                      **kwargs)
+    assert excinfo.value.source == 'hhs'
+    assert isinstance(excinfo.value.__cause__, NotImplementedError)
+    
+    with pytest.raises(ValueError):
+        fdl.load_data(parallel='gpu', **kwargs)
+
+
+@pytest.mark.parametrize("fill_missing_weeks", [False, True])
+def test_load_data_filters_match_filtered_load_data(fill_missing_weeks):
+    fdl = FluDataLoader('../../data-raw')
+    
+    kwargs = {'sources': ['hhs', 'ilinet'], 'ilinet_kwargs': {'scale_to_positive': False},
+              'fill_missing_weeks': fill_missing_weeks}
+    full = fdl.load_data(**kwargs)
+    
+    locations = ['US', '36', 'Region 2']
+    keep = full['location'].isin(locations) & (full['wk_end_date'] >= '2015-08-01') & \
+        full['season'].isin(['2015/16', '2022/23', '2023/24'])
+    expected = full.loc[keep].reset_index(drop=True)
+    
+    df = fdl.load_data(locations=locations, seasons=['2015/16', '2022/23', '2023/24'],
+                       start_date='2015-08-01', **kwargs)
+    pd.testing.assert_frame_equal(df, expected, check_exact=True)
+    
+    # with factors computed from the filtered history, the rows are the same but
+    # the transformed values differ
+    df, norm = fdl.load_data(locations=locations, seasons=['2015/16', '2022/23', '2023/24'],
+                             start_date='2015-08-01', normalize_on='filtered',
+                             return_normalization=True, **kwargs)
+    pd.testing.assert_frame_equal(df[['source', 'location', 'wk_end_date', 'inc']],
+                                  expected[['source', 'location', 'wk_end_date', 'inc']],
+                                  check_exact=True)
+    expected_norm = normalization.Normalization.fit(expected, power_transform='4rt')
+    pd.testing.assert_frame_equal(norm.factors, expected_norm.factors)
+    
+    with pytest.raises(ValueError):
+        fdl.load_data(locations=locations, normalize_on='partial')
+
+
+@pytest.mark.parametrize("fill_missing_weeks", [False, True])
+def test_update_data_matches_load_data(fill_missing_weeks):
+    fdl = FluDataLoader('../../data-raw')
+    
+    kwargs = {'sources': ['hhs', 'ilinet'], 'ilinet_kwargs': {'scale_to_positive': False},
+              'fill_missing_weeks': fill_missing_weeks}
+    df = fdl.load_data(hhs_kwargs={'as_of': '2023-12-30'}, **kwargs)
+    expected = fdl.load_data(hhs_kwargs={'as_of': '2024-01-10'}, **kwargs)
+    
+    actual, changes = fdl.update_data(df, '2024-01-10', fill_missing_weeks=fill_missing_weeks)
+    pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+    
+    # new weeks for every location, and some revisions
+    assert (changes['n_added'] > 0).all()
+    assert changes['n_revised'].sum() > 0
+    assert (changes['max_abs_revision'].dropna() > 0).all()
+    
+    # unchanged data
+    actual, changes = fdl.update_data(expected, '2024-01-10', fill_missing_weeks=fill_missing_weeks)
+    pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+    assert len(changes) == 0
+
+
+def test_update_data_normalization():
+    fdl = FluDataLoader('../../data-raw')
+    
+    df, norm = fdl.load_data(sources=['hhs'], hhs_kwargs={'as_of': '2023-12-30'},
+                             return_normalization=True)
+    expected_df, expected_norm = fdl.load_data(sources=['hhs'], hhs_kwargs={'as_of': '2024-01-10'},
+                                               return_normalization=True)
+    
+    (actual_df, actual_norm), _ = fdl.update_data(df, '2024-01-10', norm=norm)
+    pd.testing.assert_frame_equal(actual_df, expected_df, check_exact=True)
+    pd.testing.assert_frame_equal(actual_norm.factors, expected_norm.factors, check_exact=True)
+
+
+def test_load_data_compact():
+    fdl = FluDataLoader('../../data-raw')
+    
+    df = fdl.load_data(sources=['hhs'])
+    df_compact = fdl.load_data(sources=['hhs'], compact=True)
+    
+    for c in ['source', 'agg_level', 'location', 'season']:
+        assert isinstance(df_compact[c].dtype, pd.CategoricalDtype)
+        assert (df_compact[c].astype(object) == df[c]).all()
+    assert df_compact['season_week'].dtype == 'Int16'
+    for c in ['inc', 'pop', 'log_pop', 'inc_trans_cs', 'inc_trans_scale_factor', 'inc_trans_center_factor']:
+        assert df_compact[c].dtype == np.float32
+        np.testing.assert_allclose(df_compact[c], df[c], rtol=1e-6)
+    
+    assert df_compact.memory_usage(deep=True).sum() < df.memory_usage(deep=True).sum() / 3
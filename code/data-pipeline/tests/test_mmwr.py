@@ -0,0 +1,34 @@
+import datetime
+
+import numpy as np
+import pymmwr
+from data_pipeline import mmwr
+
+
+def test_date_to_epiweek_matches_pymmwr():
+    days = np.arange(np.datetime64('1990-01-01'), np.datetime64('2100-12-25'), 3)
+    years, weeks = mmwr.date_to_epiweek(days)
+    expected = [pymmwr.date_to_epiweek(d.astype(datetime.date)) for d in days]
+    assert np.array_equal(years, [ew.year for ew in expected])
+    assert np.array_equal(weeks, [ew.week for ew in expected])
+
+
+def test_epiweek_to_date_matches_pymmwr():
+    years = np.arange(1990, 2101)
+    assert np.array_equal(mmwr.epiweeks_in_year(years),
+                          [pymmwr.epiweeks_in_year(int(y)) for y in years])
+    
+    weeks = np.array([1, 17, 30, 31, 52])
+    years, weeks = np.repeat(years, len(weeks)), np.tile(weeks, len(years))
+    expected = [pymmwr.epiweek_to_date(pymmwr.Epiweek(int(y), int(w), 7)) for y, w in zip(years, weeks)]
+    assert np.array_equal(mmwr.epiweek_to_date(years, weeks), np.array(expected, dtype='datetime64[D]'))
+
+
+def test_season_and_season_week():
+    dates = ['2014-08-02', '2015-01-03', '2015-01-10', '2023-07-29', '2023-12-30', '1999-10-09']
+    assert list(mmwr.date_to_season(dates)) == \
+        ['2014/15', '2014/15', '2014/15', '2022/23', '2023/24', '1999/00']
+    # 2014 had 53 MMWR weeks
+    assert list(mmwr.date_to_season_week(dates)) == [1, 23, 24, 52, 22, 10]
+    assert np.array_equal(mmwr.date_to_wk_end_date(['2023-12-24', '2023-12-27', '2023-12-30']),
+                          np.array(['2023-12-30'] * 3, dtype='datetime64[D]'))
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data_pipeline import normalization
+
+
+def _make_data(seed):
+    rng = np.random.default_rng(seed)
+    n = 2000
+    df = pd.DataFrame({
+        'source': rng.choice(['flusurvnet', 'hhs', 'ilinet'], size=n),
+        'location': rng.choice(['01', '02', '06', 'US'], size=n),
+        'season_week': rng.integers(1, 53, size=n),
+        'inc': rng.gamma(2.0, 50.0, size=n)
+    })
+    df.loc[rng.random(n) < 0.05, 'inc'] = np.nan
+    return df
+
+
+def _factors_with_lambdas(df, power_transform):
+    # the group-wise computation used by `load_data` before `Normalization`
+    if power_transform == '4rt':
+        inc_trans = (df['inc'] + 0.01)**0.25
+    elif power_transform == 'sqrt':
+        inc_trans = np.sqrt(df['inc'] + 0.01)
+    else:
+        inc_trans = df['inc'] + 0.01
+    out_of_season = (df['season_week'] < 10) | (df['season_week'] > 45)
+
+    scale_factor = df.assign(x = np.where(out_of_season, np.nan, inc_trans)) \
+        .groupby(['source', 'location'])['x'] \
+        .transform(lambda x: x.quantile(0.95))
+    inc_trans_cs = inc_trans / (scale_factor + 0.01)
+    center_factor = df.assign(x = np.where(out_of_season, np.nan, inc_trans_cs)) \
+        .groupby(['source', 'location'])['x'] \
+        .transform(lambda x: x.mean())
+
+    return pd.DataFrame({'inc_trans': inc_trans,
+                         'inc_trans_scale_factor': scale_factor,
+                         'inc_trans_cs': inc_trans_cs - center_factor,
+                         'inc_trans_center_factor': center_factor})
+
+
+@pytest.mark.parametrize('power_transform', ['4rt', 'sqrt', None])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_normalization_matches_groupby_lambdas(power_transform, seed):
+    df = _make_data(seed)
+
+    norm = normalization.Normalization.fit(df, power_transform=power_transform)
+    actual = norm.transform(df, factor_columns=True)
+    expected = _factors_with_lambdas(df, power_transform)
+
+    pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+    assert len(norm.factors) == 12
+
+
+@pytest.mark.parametrize('power_transform', ['4rt', 'sqrt', None])
+def test_normalization_inverse(power_transform):
+    df = _make_data(2)
+
+    norm = normalization.Normalization.fit(df, power_transform=power_transform)
+    inc_trans_cs = norm.transform(df)['inc_trans_cs']
+
+    np.testing.assert_allclose(norm.inverse(df, inc_trans_cs), df['inc'], rtol=1e-10)
+
+
+def test_normalization_side_table_and_concat():
+    df = _make_data(3)
+    hhs = df['source'] == 'hhs'
+
+    norm = normalization.Normalization.fit(df)
+    combined = normalization.Normalization.concat([
+        normalization.Normalization.fit(df.loc[~hhs]),
+        normalization.Normalization.fit(df.loc[hhs])
+    ])
+
+    assert list(norm.factors.columns) == ['source', 'location', 'scale_factor', 'center_factor']
+    pd.testing.assert_frame_equal(combined.factors, norm.factors)
+
+    with pytest.raises(ValueError):
+        normalization.Normalization.fit(df, power_transform='log')
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data_pipeline.loader import FluDataLoader
+from data_pipeline.panel import Panel
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_panel_round_trip(compact):
+    fdl = FluDataLoader('../../data-raw')
+    df = fdl.load_data(sources=['hhs', 'ilinet'], ilinet_kwargs={'scale_to_positive': False},
+                       compact=compact)
+
+    panel = fdl.load_panel(sources=['hhs', 'ilinet'], ilinet_kwargs={'scale_to_positive': False},
+                           compact=compact)
+
+    assert list(panel.sources) == ['hhs', 'ilinet']
+    assert panel.shape == (2, len(panel.locations), len(panel.dates), len(panel.features))
+    assert panel.observed.sum() == len(df)
+    assert set(panel.labels) == {'agg_level', 'season'}
+    pd.testing.assert_frame_equal(panel.to_frame(), df, check_exact=True)
+
+
+def test_panel_selection():
+    fdl = FluDataLoader('../../data-raw')
+    df = fdl.load_data(sources=['hhs'])
+    panel = Panel.from_frame(df, features=['inc_trans_cs', 'log_pop'])
+
+    # hhs has the same weeks for every location, so the panel matches a reshape
+    # of the long frame
+    inc = panel.sel(source='hhs', feature='inc_trans_cs')
+    assert np.shares_memory(inc, panel.values)
+    np.testing.assert_array_equal(inc, df['inc_trans_cs'].values.reshape(len(panel.locations), -1))
+
+    xy = panel.sel(source='hhs', location=['US', '25'])
+    assert xy.shape == (2, len(panel.dates), 2)
+    np.testing.assert_array_equal(
+        xy[0],
+        df.loc[df['location'] == 'US', ['inc_trans_cs', 'log_pop']].values)
+
+    season_codes, seasons = panel.codes('season')
+    np.testing.assert_array_equal(seasons[season_codes[0, panel.locations.get_loc('US')]],
+                                  df.loc[df['location'] == 'US', 'season'].values)
+
+    with pytest.raises(KeyError):
+        panel.sel(location=['US', 'not a location'])
+
+    # every location has a row in every week, unless one is dropped
+    panel.check_complete()
+    gap = Panel.from_frame(df.drop(index=df.index[df['location'] == '25'][3]))
+    assert np.isnan(gap.sel(source='hhs', location='25', feature='inc_trans_cs')[3])
+    with pytest.raises(ValueError, match='no data for 1 combinations'):
+        gap.check_complete()
+
+    with pytest.raises(ValueError):
+        Panel.from_frame(pd.concat([df, df.head(1)]))
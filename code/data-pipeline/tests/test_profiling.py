@@ -0,0 +1,77 @@
+import json
+
+import pandas as pd
+import pytest
+from data_pipeline import profiling
+from data_pipeline.loader import FluDataLoader
+
+
+def test_tracer_records_loader_stages(tmp_path):
+    fdl = FluDataLoader('../../data-raw')
+    
+    with fdl.trace() as tracer:
+        df = fdl.load_data(sources=['hhs'])
+    
+    report = tracer.report()
+    assert list(report.columns) == ['stage', 'path', 'depth', 'thread', 'start', 'wall_time',
+                                    'cpu_time', 'rows_in', 'rows_out', 'peak_rss_mb', 'error']
+    
+    # the outermost stage completes last
+    last = report.iloc[-1]
+    assert last['stage'] == 'FluDataLoader.load_data'
+    assert last['depth'] == 0
+    assert last['rows_out'] == len(df)
+    
+    stages = set(report['stage'])
+    assert {'FluDataLoader.load_hhs', 'SourceSchema.read[hhs]', 'Normalization.fit',
+            'FluDataLoader._process_data'} <= stages
+    
+    load_hhs = report.loc[report['stage'] == 'FluDataLoader.load_hhs'].iloc[0]
+    assert load_hhs['path'] == 'FluDataLoader.load_data;FluDataLoader._load_source_data;FluDataLoader.load_hhs'
+    assert (report['wall_time'] <= last['wall_time']).all()
+    
+    summary = tracer.summary()
+    assert summary['stage'].iloc[0] == 'FluDataLoader.load_data'
+    
+    tracer.to_csv(tmp_path / 'report.csv')
+    tracer.to_json(tmp_path / 'report.json')
+    tracer.to_chrome_trace(tmp_path / 'trace.json')
+    tracer.to_folded_stacks(tmp_path / 'stacks.txt')
+    
+    assert len(pd.read_csv(tmp_path / 'report.csv')) == len(report)
+    assert len(json.load(open(tmp_path / 'trace.json'))['traceEvents']) == len(report)
+    with open(tmp_path / 'stacks.txt') as f:
+        assert f.readline().startswith('FluDataLoader.load_data ')
+
+
+def test_tracer_records_disk_cache_hits(tmp_path):
+    FluDataLoader('../../data-raw', cache_dir=tmp_path / 'cache').load_hhs()
+    
+    # stages read from the disk cache are recorded like computed ones
+    fdl = FluDataLoader('../../data-raw', cache_dir=tmp_path / 'cache')
+    with fdl.trace() as tracer:
+        hhs = fdl.load_hhs()
+    
+    report = tracer.report()
+    assert list(report['stage']) == ['FluDataLoader.load_hhs']
+    assert report['rows_out'].iloc[0] == len(hhs)
+
+
+def test_tracer_inactive_and_errors():
+    fdl = FluDataLoader('../../data-raw')
+    tracer = fdl.trace()
+    
+    fdl.load_fips_mappings()
+    assert len(tracer.report()) == 0
+    
+    with tracer:
+        with pytest.raises(ValueError):
+            fdl.load_data(sources=['hhs'], power_transform='log')
+        with profiling.stage('outer') as stage:
+            stage.rows_out = 3
+    
+    report = tracer.report()
+    assert list(report['stage']) == ['FluDataLoader.load_data', 'outer']
+    assert report['error'].iloc[0] == 'ValueError'
+    assert report['rows_out'].iloc[1] == 3
+    assert profiling.active_tracer() is None
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data_pipeline import schemas
+
+
+def test_ilinet_schema_reads_declared_columns():
+    dat = schemas.ILINET.read('../../data-raw/influenza-ilinet/ilinet.csv')
+    
+    assert list(dat.columns) == list(schemas.ILINET.columns)
+    assert dat['year'].dtype == np.int64
+    assert dat['ilitotal'].dtype == np.float64
+    assert dat['week_start'].dtype == 'datetime64[ns]'
+
+
+def test_census_schema_reads_population_estimates():
+    dat = schemas.US_CENSUS.read('../../data-raw/us-census/NST-EST2022-ALLDATA.csv')
+    
+    assert list(dat.columns) == ['STATE', 'NAME', 'POPESTIMATE2020', 'POPESTIMATE2021', 'POPESTIMATE2022']
+    assert dat['STATE'].str.len().eq(2).all()
+
+
+@pytest.mark.parametrize("old_value, new_value, field", [
+    ('1997,41,', '1997,4x,', 'week'),
+    ('1997-10-05', '1997-13-05', 'week_start')
+])
+def test_schema_error_names_field(tmp_path, old_value, new_value, field):
+    with open('../../data-raw/influenza-ilinet/ilinet.csv') as f:
+        contents = f.read()
+    path = tmp_path / 'ilinet.csv'
+    with open(path, 'w') as f:
+        f.write(contents.replace(old_value, new_value, 1))
+    
+    with pytest.raises(schemas.SchemaError, match=f'field "{field}"'):
+        schemas.ILINET.read(path)
+
+
+def test_schema_error_for_missing_column(tmp_path):
+    path = tmp_path / 'hhs.csv'
+    pd.DataFrame({'location': ['US'], 'inc': [1]}).to_csv(path, index=False)
+    
+    with pytest.raises(schemas.SchemaError, match='"date"'):
+        schemas.HHS.read(path)
@@ -0,0 +1,43 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+import pytest
+from data_pipeline.loader import FluDataLoader
+from data_pipeline.shared_frame import SharedFrame
+
+
+def _sum_in_worker(shared, column):
+    df = shared.to_frame([column])
+    buffer_address = shared.table.column(column).chunk(0).buffers()[1].address
+    return df[column].sum(), df[column].values.__array_interface__['data'][0] == buffer_address
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_shared_frame_round_trip(compact, tmp_path):
+    df = FluDataLoader('../../data-raw').load_data(sources=['hhs'], compact=compact)
+    df = df.query('season_week >= 5')
+
+    with SharedFrame.publish(df, root=tmp_path) as shared:
+        pd.testing.assert_frame_equal(shared.to_frame(strings_as_categories=False), df,
+                                      check_exact=True)
+        assert shared.to_frame(['location'])['location'].dtype == 'category'
+
+        attached = SharedFrame.attach(shared.path)
+        inc = attached.to_frame(['inc'])['inc']
+        with pytest.raises(ValueError):
+            inc.values[0] = 0.0
+
+    assert not any(tmp_path.iterdir())
+
+
+def test_shared_frame_in_worker_processes(tmp_path):
+    df = FluDataLoader('../../data-raw').load_data(sources=['hhs'])
+
+    with SharedFrame.publish(df, root=tmp_path) as shared:
+        with ProcessPoolExecutor(2) as executor:
+            results = list(executor.map(_sum_in_worker, repeat(shared, 2), ['inc', 'inc_trans_cs']))
+
+    # workers read the columns from the shared pages without copying them
+    assert results == [(df['inc'].sum(), True), (df['inc_trans_cs'].sum(), True)]
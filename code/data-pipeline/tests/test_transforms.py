@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+from data_pipeline import transforms
+
+
+def test_aggregate_sub_locations():
+    fips_mappings = pd.DataFrame({
+        'location': ['US', '36', '69', '06'],
+        'location_name': ['United States', 'New York', 'Northern Mariana Islands', 'California']
+    })
+    location_index = transforms.build_location_index(fips_mappings)
+    assert location_index['New York - Rochester'] == '36'
+    assert location_index['Commonwealth of the Northern Mariana Islands'] == '69'
+    
+    dates = pd.to_datetime(['2023-10-07', '2023-10-14'])
+    df = pd.DataFrame({
+        'location': ['New York', 'New York City', 'New York', 'New York City',
+                     'Commonwealth of the Northern Mariana Islands', 'California', 'Atlantis'],
+        'season': '2023/24',
+        'season_week': [10, 10, 11, 11, 10, 10, 10],
+        'wk_end_date': dates[[0, 0, 1, 1, 0, 0, 0]],
+        'inc': [1.0, 2.0, np.nan, 4.0, 5.0, 6.0, 7.0],
+        'source': 'ilinet'
+    })
+    
+    actual = transforms.aggregate_sub_locations(df, location_index)
+    expected = pd.DataFrame({
+        'location': ['06', '36', '36', '69'],
+        'season': '2023/24',
+        'season_week': [10, 10, 11, 10],
+        'wk_end_date': dates[[0, 0, 1, 0]],
+        'source': 'ilinet',
+        'inc': [6.0, 1.5, 4.0, 5.0],
+        'agg_level': 'state'
+    })
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_regularize_weekly():
+    df = pd.DataFrame({
+        'source': ['b', 'a', 'a', 'a'],
+        'location': ['01', '01', '01', '02'],
+        'agg_level': 'state',
+        'season': ['2023/24', '2022/23', '2022/23', '2022/23'],
+        'season_week': [10, 52, 3, 20],
+        'wk_end_date': pd.to_datetime(['2023-10-07', '2023-07-29', '2023-08-19', '2022-12-17']),
+        'inc': [1.0, 2.0, 3.0, 4.0]
+    })
+    
+    actual = transforms.regularize_weekly(df, ffill_cols=['agg_level', 'season'])
+    assert list(actual['source']) == ['a'] * 5 + ['b']
+    assert list(actual['location']) == ['01'] * 4 + ['02', '01']
+    assert list(actual['wk_end_date'].dt.strftime('%m-%d')) == \
+        ['07-29', '08-05', '08-12', '08-19', '12-17', '10-07']
+    assert list(actual['season']) == ['2022/23'] * 5 + ['2023/24']
+    np.testing.assert_array_equal(actual['inc'], [2.0, np.nan, np.nan, 3.0, 4.0, 1.0])
+    np.testing.assert_array_equal(actual['season_week'], [52, np.nan, np.nan, 3, 20, 10])
+    
+    # season and season week of inserted rows from the calendar
+    actual = transforms.regularize_weekly(df, calendar_cols=True)
+    assert list(actual['season'][:4]) == ['2022/23', '2023/24', '2023/24', '2022/23']
+    assert list(actual['season_week'][:4]) == [52, 1, 2, 3]
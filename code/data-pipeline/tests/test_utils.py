@@ -0,0 +1,40 @@
+import datetime
+
+import pandas as pd
+import pytest
+from pandas.tseries.holiday import USFederalHolidayCalendar
+from data_pipeline import utils
+
+
+@pytest.mark.parametrize("start_year", [1997, 2004, 2021, 2022, 2027, 2050])
+def test_holidays_match_pandas_calendar(start_year):
+    expected = USFederalHolidayCalendar().holidays(
+        start=datetime.datetime(year=start_year, month=7, day=1),
+        end=datetime.datetime(year=start_year+1, month=6, day=1),
+        return_name=True)
+    
+    actual = utils.get_holidays(seasons=[start_year], holidays=utils.HOLIDAYS)
+    
+    assert list(actual['date']) == list(expected.index)
+    assert list(actual['holiday']) == list(expected.values)
+
+
+def test_get_holidays_is_open_ended():
+    hol = utils.get_holidays()
+    
+    assert hol['season'].min() == '1997/98'
+    assert {'2023/24', '2024/25', '2030/31'} <= set(hol['season'])
+    
+    xmas = utils.get_holidays(seasons=['2024/25']).query("holiday == 'Christmas Day'")
+    assert list(xmas['date']) == [pd.Timestamp('2024-12-25')]
+    assert list(xmas['season_week']) == [22]
+    
+    with pytest.raises(ValueError):
+        utils.get_holidays(holidays=['Christmas'])
+
+
+def test_get_holidays_returns_copies():
+    hol = utils.get_holidays()
+    hol['season_week'] = 0
+    
+    assert (utils.get_holidays()['season_week'] > 0).all()
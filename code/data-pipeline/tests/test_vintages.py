@@ -0,0 +1,74 @@
+import datetime
+
+import pandas as pd
+import pytest
+from data_pipeline.loader import FluDataLoader
+from data_pipeline.vintages import HHSVintageStore
+
+
+@pytest.fixture(scope='module')
+def store_path(tmp_path_factory):
+    store_path = tmp_path_factory.mktemp('vintages') / 'hhs'
+    HHSVintageStore.build('../../data-raw', store_path)
+    return store_path
+
+
+@pytest.mark.parametrize('as_of', ['2023-10-18', '2023-12-30', '2024-01-10', datetime.date(2024, 5, 1)])
+def test_load_hhs_from_vintages_matches_csv(store_path, as_of):
+    expected = FluDataLoader('../../data-raw').load_hhs(as_of=as_of)
+    actual = FluDataLoader('../../data-raw', hhs_vintages=store_path).load_hhs(as_of=as_of)
+
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_vintage_store_saves_only_changed_rows(store_path):
+    store = HHSVintageStore(store_path)
+    index = store.vintages()
+
+    assert list(index['as_of']) == sorted(index['as_of'])
+    assert (index['n_rows'][1:] < index['n_rows'][0]).all()
+
+    pd.testing.assert_frame_equal(
+        store.load('2024-04-17'),
+        pd.read_csv('../../data-raw/influenza-hhs/hhs-2024-04-17.csv', dtype={'location': str}))
+
+
+def test_vintage_store_append_and_deletions(tmp_path):
+    v1 = pd.DataFrame({'location': ['01', '01', 'US'],
+                       'date': ['2023-10-07', '2023-10-14', '2023-10-07'],
+                       'inc': [1, 2, 10]})
+    v2 = pd.DataFrame({'location': ['01', '01', '01'],
+                       'date': ['2023-10-07', '2023-10-14', '2023-10-21'],
+                       'inc': [1, 3, 4]})
+    v1.to_csv(tmp_path / 'hhs-2023-10-18.csv', index=False)
+    v2.to_csv(tmp_path / 'hhs-2023-10-25-draft1.csv', index=False)
+
+    store = HHSVintageStore(tmp_path / 'store')
+    store.append(tmp_path / 'hhs-2023-10-18.csv')
+    delta = store.append(tmp_path / 'hhs-2023-10-25-draft1.csv')
+
+    # one revised row, one new row, one deleted row
+    assert len(delta) == 3
+    assert delta['deleted'].sum() == 1
+    assert list(store.vintages()['revision']) == [999, 1]
+
+    pd.testing.assert_frame_equal(store.load('2023-10-24'), v1)
+    pd.testing.assert_frame_equal(store.load('2023-10-25'), v2)
+    pd.testing.assert_frame_equal(store.load(), v2)
+
+    # ranges of a store written without them are computed from its parts
+    (tmp_path / 'store' / 'ranges.parquet').unlink()
+    pd.testing.assert_frame_equal(store.load('2023-10-24'), v1)
+
+    # data as of any date are read from the ranges alone
+    for part in store.vintages()['part']:
+        (tmp_path / 'store' / part).rename(tmp_path / part)
+    pd.testing.assert_frame_equal(HHSVintageStore(tmp_path / 'store').load('2023-10-24'), v1)
+    pd.testing.assert_frame_equal(HHSVintageStore(tmp_path / 'store').load(), v2)
+    for part in store.vintages()['part']:
+        (tmp_path / part).rename(tmp_path / 'store' / part)
+
+    with pytest.raises(ValueError):
+        store.load('2023-10-01')
+    with pytest.raises(ValueError):
+        store.append(tmp_path / 'hhs-2023-10-18.csv')
@@ -0,0 +1,110 @@
+'''
+Compare the one-hot and categorical encodings of data source, agg_level, and
+location (the `categorical_encoding` setting in `configs/base.py`): memory of
+the training features and time to fit the LightGBM quantile models of one bag.
+
+Run with `code/gbq` as the working directory, on the real data or on a
+synthetic data-raw directory with more locations (see
+`code/data-pipeline/benchmarks/synthetic_data_raw.py`):
+python benchmarks/bench_categorical_encoding.py --data_raw ../../data-raw --output bench-encoding.json
+'''
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from data_pipeline.loader import FluDataLoader
+from preprocess import create_features_and_targets
+
+
+ENCODINGS = ['one_hot', 'categorical']
+
+
+def training_data(df, categorical_encoding, max_horizon):
+    # as in `run.run_gbq_flu_model`
+    df, feat_names = create_features_and_targets(
+        df, incl_level_feats=True, max_horizon=max_horizon,
+        curr_feat_names=['inc_trans_cs', 'season_week', 'log_pop'],
+        categorical_encoding=categorical_encoding)
+    df = df.query("season_week >= 5 and season_week <= 45")
+    df_test = df.loc[df.wk_end_date == df.wk_end_date.max()]
+    df_train = df.loc[~df['delta_target'].isna().values]
+    return df_train, df_test, feat_names
+
+
+def run_case(df, categorical_encoding, q_levels, max_horizon, bag_frac_samples, seed):
+    df_train, df_test, feat_names = training_data(df, categorical_encoding, max_horizon)
+    x_train = df_train[feat_names]
+    x_test = df_test[feat_names]
+
+    rng = np.random.default_rng(seed)
+    train_seasons = df_train['season'].unique()
+    bag_seasons = rng.choice(train_seasons, size=int(len(train_seasons) * bag_frac_samples),
+                             replace=False)
+    bag_obs_inds = df_train['season'].isin(bag_seasons)
+
+    fit_seconds = []
+    preds = []
+    for q_level in q_levels:
+        start = time.perf_counter()
+        model = lgb.LGBMRegressor(verbosity=-1, objective='quantile', alpha=q_level, random_state=seed)
+        model.fit(X=x_train.loc[bag_obs_inds, :], y=df_train['delta_target'].loc[bag_obs_inds])
+        fit_seconds.append(time.perf_counter() - start)
+        preds.append(model.predict(X=x_test))
+
+    return {
+        'categorical_encoding': categorical_encoding,
+        'n_train_rows': len(x_train),
+        'n_features': len(feat_names),
+        'x_train_mb': x_train.memory_usage(deep=True, index=False).sum() / 2**20,
+        'fit_seconds': float(np.sum(fit_seconds)),
+        'mean_fit_seconds': float(np.mean(fit_seconds))
+    }, np.stack(preds, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare one-hot and categorical encodings in gbq models')
+    parser.add_argument('--data_raw', default='../../data-raw')
+    parser.add_argument('--q_levels', type=float, nargs='+', default=[0.025, 0.5, 0.975])
+    parser.add_argument('--max_horizon', type=int, default=5)
+    parser.add_argument('--bag_frac_samples', type=float, default=0.7)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help='optional path of a json file with the results')
+    args = parser.parse_args()
+
+    df = FluDataLoader(args.data_raw).load_data()
+    results = []
+    preds = {}
+    for categorical_encoding in ENCODINGS:
+        result, preds[categorical_encoding] = run_case(
+            df, categorical_encoding, args.q_levels, args.max_horizon, args.bag_frac_samples,
+            args.seed)
+        results.append(result)
+
+    results = pd.DataFrame(results)
+    with pd.option_context('display.width', 200):
+        print(results.to_string(index=False))
+    dense, categorical = results.iloc[0], results.iloc[1]
+    print(f'training features: {dense["x_train_mb"]:.1f} MB one-hot, '
+          f'{categorical["x_train_mb"]:.1f} MB categorical '
+          f'({1 - categorical["x_train_mb"] / dense["x_train_mb"]:.0%} less)')
+    print(f'fit time: {dense["fit_seconds"]:.2f} s one-hot, {categorical["fit_seconds"]:.2f} s categorical '
+          f'({1 - categorical["fit_seconds"] / dense["fit_seconds"]:.0%} less)')
+    print('mean absolute difference in test set predictions: ' +
+          f'{np.mean(np.abs(preds["one_hot"] - preds["categorical"])):.4f}')
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'data_raw': args.data_raw, 'results': results.to_dict('records')}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,5 +17,9 @@ base_config = SimpleNamespace(
   fit_locations_separately = False,
 
   # power transform applied to surveillance signals
-  power_transform = '4rt'
+  power_transform = '4rt',
+
+  # representation of data source, agg_level, and location as features:
+  # 'one_hot' (0/1 columns) or 'categorical' (LightGBM categorical features)
+  categorical_encoding = 'one_hot'
 )
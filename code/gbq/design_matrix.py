@@ -0,0 +1,227 @@
+'''
+Training and test data of the gbq models as NumPy arrays.
+
+A `DesignMatrix` holds the features of the featurized data frame in one
+C-contiguous float array, and the target, integer codes of the seasons, and
+a data frame with a few columns of row metadata (e.g. location and horizon)
+aligned with its rows. Model fitting selects rows with integer index arrays,
+e.g. the rows of a bag, rather than slicing the wide data frame for every fit,
+and the data frame can be released once the matrix is built.
+
+If the data frame was featurized without replicating its rows once per
+horizon (`expand_horizons=False` in `preprocess.create_features_and_targets`),
+the rows of the design matrix are pairs of a row of the data frame and a
+horizon. The features of each row of the data frame are then stored once, in
+`x`, and each row of the design matrix is given by its row of `x`, in
+`base_rows`, and its horizon, in `horizon`. The features of selected rows are
+materialized by `take`, or by `lgb_dataset` for a LightGBM dataset, which
+reads large numbers of rows in batches, so that the features of all rows are
+never held at once.
+
+Categorical features (see `categorical_encoding` in `configs/base.py`) are
+held as their integer codes, with NaN for missing values, as LightGBM encodes
+pandas categorical columns; pass `categorical_features` to LightGBM as the
+`categorical_feature` argument. The features are float64 unless all float
+features of the data frame are float32, as with the compact dtypes of
+`load_data(compact=True)`, so that LightGBM sees the same values as when it
+is passed the data frame.
+
+Example:
+dm = DesignMatrix.from_frame(df, feat_names, target='delta_target',
+                             metadata_columns=['location'], horizons=[1, 2, 3])
+rows = np.flatnonzero(~np.isnan(dm.y))
+booster = lgb.train(params, dm.lgb_dataset(rows))
+booster.predict(dm.take(rows[:10]))
+'''
+
+import re
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+
+class DesignMatrix():
+    def __init__(self, x, y, season_codes, seasons, metadata, feat_names,
+                 categorical_features=None, base_rows=None, horizon=None):
+        '''
+        Parameters
+        ----------
+        x: C-contiguous float32 or float64 array of shape (number of base
+          rows, number of features)
+        y: float32 array with the target value of each row, NaN if missing
+        season_codes: integer array with the season of each row as an index
+          into `seasons`, -1 if missing
+        seasons: array of season labels
+        metadata: data frame with one row per row of `x` and a range index
+        feat_names: list of names of the columns of `x`
+        categorical_features: optional list of indices of the columns of `x`
+          holding codes of categorical features
+        base_rows: optional integer array with the row of `x` of each row; by
+          default, the rows are the rows of `x`
+        horizon: optional integer array with the horizon of each row, the
+          value of the feature `horizon`, whose column in `x` is then unused
+        '''
+        self.x = x
+        self.y = y
+        self.season_codes = season_codes
+        self.seasons = seasons
+        self.metadata = metadata
+        self.feat_names = list(feat_names)
+        self.categorical_features = [] if categorical_features is None \
+            else list(categorical_features)
+        self.base_rows = np.arange(len(x)) if base_rows is None else base_rows
+        self.horizon = horizon
+        if horizon is not None:
+            self._horizon_column = self.feat_names.index('horizon')
+
+
+    @classmethod
+    def from_frame(cls, df, feat_names, target, metadata_columns=(), rows=None,
+                   horizons=None):
+        '''
+        Build a design matrix from the rows of a data frame.
+
+        Parameters
+        ----------
+        df: data frame with the columns `feat_names`, `target`, `season`, and
+          `metadata_columns`
+        feat_names: list of names of feature columns; numeric, boolean, or
+          categorical
+        target: name of the target column
+        metadata_columns: names of columns to keep in `metadata`
+        rows: optional integer array with the positions of the rows of `df`
+          to include, in order; by default all rows
+        horizons: optional list of horizons, for a data frame featurized
+          without expanding its rows by horizon. The targets are then in the
+          columns `{target}_h{horizon}`, the feature `horizon` is not a column
+          of `df`, and there is a row for each horizon and each of `rows`,
+          ordered by horizon first, as in a data frame with expanded rows.
+
+        Returns
+        -------
+        DesignMatrix
+        '''
+        if rows is None:
+            rows = np.arange(len(df))
+
+        # the float dtype of the features; integer, boolean, and categorical
+        # features are exact in float32
+        lazy_horizon = horizons is not None and 'horizon' in feat_names
+        dtype = np.result_type(np.float32, *[df[c].dtype for c in feat_names
+                                             if not (lazy_horizon and c == 'horizon')
+                                             and pd.api.types.is_float_dtype(df[c].dtype)])
+
+        # filled one column at a time, so that no copy of all features with
+        # their mixed dtypes is made
+        x = np.empty((len(rows), len(feat_names)), dtype=dtype)
+        categorical_features = []
+        for j, c in enumerate(feat_names):
+            if lazy_horizon and c == 'horizon':
+                x[:, j] = np.nan
+                continue
+            x[:, j] = _column_values(df[c], dtype)[rows]
+            if isinstance(df[c].dtype, pd.CategoricalDtype):
+                categorical_features.append(j)
+
+        season_codes, seasons = pd.factorize(df['season'].iloc[rows], sort=True)
+        # also one column at a time: selecting a list of columns of a wide
+        # frame can copy the whole block of the columns
+        metadata = pd.DataFrame({c: df[c].iloc[rows].reset_index(drop=True)
+                                 for c in metadata_columns},
+                                index=pd.RangeIndex(len(rows)))
+
+        if horizons is None:
+            y = _column_values(df[target], np.float32)[rows]
+            return cls(x, y, season_codes, np.asarray(seasons), metadata, feat_names,
+                       categorical_features)
+
+        y = np.concatenate([_column_values(df[f'{target}_h{h}'], np.float32)[rows]
+                            for h in horizons])
+        return cls(x, y, np.tile(season_codes, len(horizons)), np.asarray(seasons), metadata,
+                   feat_names, categorical_features,
+                   base_rows=np.tile(np.arange(len(rows)), len(horizons)),
+                   horizon=np.repeat(np.array(horizons, dtype=np.int64), len(rows)))
+
+
+    def __len__(self):
+        return len(self.base_rows)
+
+
+    def take(self, rows):
+        '''C-contiguous array with the features of the rows `rows`'''
+        x = self.x[self.base_rows[rows]]
+        if self.horizon is not None:
+            x[:, self._horizon_column] = self.horizon[rows]
+        return x
+
+
+    def row_metadata(self, rows):
+        '''Data frame with the metadata, and horizon if set, of the rows `rows`'''
+        metadata = self.metadata.iloc[self.base_rows[rows]].reset_index(drop=True)
+        if self.horizon is not None:
+            metadata['horizon'] = self.horizon[rows]
+        return metadata
+
+
+    def lgb_dataset(self, rows, params=None, batch_size=4096):
+        '''
+        LightGBM dataset with the features and targets of the rows `rows`.
+        The dataset can be used to train several boosters, e.g. one per
+        quantile level; `params` are its parameters, such as `max_bin`.
+
+        LightGBM finds the bins of each feature from a sample of at most
+        `bin_construct_sample_cnt` rows (200000 by default); from data read in
+        batches, it reads the sample one row at a time and holds it as
+        float64. Up to that many rows are therefore materialized at once,
+        which is faster and needs less memory; more rows are read in batches
+        of `batch_size` rows, so that the memory used does not grow with the
+        number of rows.
+
+        The sample is drawn with the `data_random_seed` in `params`, which is
+        shared by all boosters trained on the dataset; unlike datasets of
+        arrays, datasets read in batches do not derive it from `seed`.
+        '''
+        params = {} if params is None else params
+        if len(rows) <= params.get('bin_construct_sample_cnt', 200000):
+            data = self.take(rows)
+        else:
+            data = _Rows(self, rows, batch_size)
+
+        # LightGBM replaces whitespace in feature names with underscores; do
+        # it here, as it warns about it for datasets read in batches regardless
+        # of `verbosity`
+        feature_name = [re.sub(r'\s', '_', c) for c in self.feat_names]
+        # the raw data is kept, as `lgb.train` cannot reuse a dataset with
+        # categorical features otherwise
+        return lgb.Dataset(data, label=self.y[rows], feature_name=feature_name,
+                           categorical_feature=self.categorical_features,
+                           params=params, free_raw_data=False)
+
+
+class _Rows(lgb.Sequence):
+    '''Features of rows of a design matrix, as read by LightGBM'''
+    def __init__(self, dm, rows, batch_size):
+        self.dm = dm
+        self.rows = rows
+        self.batch_size = batch_size
+
+
+    def __getitem__(self, idx):
+        # LightGBM reads float64 values, one row or a slice of rows at a time
+        if isinstance(idx, slice):
+            return self.dm.take(self.rows[idx]).astype(np.float64)
+        return self.dm.take(self.rows[[idx]])[0].astype(np.float64)
+
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def _column_values(series, dtype):
+    # float values of a column, with codes of categorical columns and NaN for
+    # missing values
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        return np.where(codes < 0, np.nan, codes).astype(dtype)
+    return series.to_numpy(dtype=dtype, na_value=np.nan)
@@ -0,0 +1,284 @@
+'''
+Vectorized computation of the windowed features used by the gbq models.
+
+`featurize_data` takes the same feature specifications as
+`timeseriesutils.featurize.featurize_data` and returns the same columns, but
+rather than applying a function to each group of rows it orders the rows by
+group once, computes every feature on the resulting contiguous arrays, and
+adds all new columns to the data frame at once. Windowed features are dot
+products of each trailing window with a fixed weight vector, e.g. the rows of
+the least-squares projection matrix of a polynomial fit, accumulated over the
+positions in the window for all windows of all groups at once; windows that
+cross the start of a group are masked.
+
+Supported features:
+- `windowed_taylor_coefs`: coefficients of a polynomial fit to a trailing
+  window, parameterized as a Taylor expansion at the last point of the window,
+  so that coefficient `c{k}` estimates the k-th derivative of the series per
+  row at that point. As in timeseriesutils, the first `window_size` rows of
+  each group are missing when `fill_edges` is False.
+- `rollmean`: trailing rolling means
+- `lag`: values from earlier rows of the same group
+- `horizon_targets`: values from later rows of the same group, as forecast
+  targets. By default the data frame is replicated once per horizon, with a
+  `horizon` column; with `expand_rows` False, each row instead gets one target
+  column per horizon, which avoids copying every feature once per horizon
+  (see `design_matrix.py`). This must be the last feature.
+'''
+
+import functools
+import math
+
+import numpy as np
+import pandas as pd
+
+
+class _Groups():
+    def __init__(self, df, group_columns):
+        '''
+        Order of the rows of `df` by group, keeping the order of the rows
+        within each group, and the position of each ordered row in its group
+        '''
+        codes = df.groupby(group_columns, sort=False, observed=True).ngroup().to_numpy()
+        n = len(codes)
+        self.order = np.argsort(codes, kind='stable')
+        self.inverse = np.empty(n, dtype=np.intp)
+        self.inverse[self.order] = np.arange(n)
+
+        sorted_codes = codes[self.order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if n > 0 \
+            else np.zeros(0, dtype=np.intp)
+        sizes = np.diff(np.r_[starts, n])
+        # position of each row from the start and from the end of its group
+        self.position = np.arange(n) - np.repeat(starts, sizes)
+        self.remaining = np.repeat(sizes, sizes) - 1 - self.position
+        # rows with missing group keys are not in any group
+        self.missing_key = sorted_codes < 0
+
+
+    def to_sorted(self, values):
+        return values[self.order]
+
+
+    def from_sorted(self, values):
+        return values[self.inverse]
+
+
+    def windowed(self, values, weights, min_position):
+        '''
+        Dot products of the trailing windows of the sorted `values` with each
+        row of `weights`, an array of shape (number of results, window size).
+        Results for rows at positions below `min_position` in their group,
+        which must be at least the window size minus one, are NaN, as are
+        results for windows containing NaN.
+
+        Returns
+        -------
+        array of shape (number of rows, number of results), in sorted order
+        '''
+        n, window_size = len(values), weights.shape[1]
+        result = np.full((n, weights.shape[0]), np.nan)
+        if n >= window_size:
+            # windows ending at the rows from `window_size - 1` on, as slices;
+            # the products are summed in the same order for every row, unlike
+            # in a matrix product, and NaN values propagate through the sums,
+            # even with zero weights
+            sums = result[window_size - 1:]
+            sums[:] = 0.0
+            for j in range(window_size):
+                sums += values[j:n - window_size + 1 + j, None] * weights[:, j]
+        result[(self.position < min_position) | self.missing_key] = np.nan
+        return result
+
+
+    def shift(self, values, periods):
+        '''
+        Sorted `values` shifted within each group, by `periods` rows forward
+        (positive) or backward (negative), with NaN where there is no row
+        '''
+        result = np.full_like(values, np.nan)
+        if periods > 0:
+            result[periods:] = values[:-periods]
+            result[self.position < periods] = np.nan
+        elif periods < 0:
+            result[:periods] = values[-periods:]
+            result[self.remaining < -periods] = np.nan
+        else:
+            result[:] = values
+        result[self.missing_key] = np.nan
+        return result
+
+
+@functools.lru_cache(maxsize=None)
+def taylor_projection(taylor_degree, window_size):
+    '''
+    Least-squares projection matrix for fitting the polynomial
+    `sum_k c_k * x**k / k!` to a trailing window, where `x` runs from
+    `-(window_size - 1)` at the first row of the window to 0 at the last.
+
+    Returns
+    -------
+    read-only array of shape (taylor_degree + 1, window_size); row k holds the
+    weights of the window values in the estimate of `c_k`
+    '''
+    if window_size <= taylor_degree:
+        raise ValueError('window_size must be larger than taylor_degree.')
+
+    x = np.arange(window_size, dtype=np.float64) - (window_size - 1)
+    design = np.stack([x**k / math.factorial(k) for k in range(taylor_degree + 1)], axis=1)
+    projection = np.linalg.solve(design.T @ design, design.T)
+    projection.flags.writeable = False
+    return projection
+
+
+def _as_list(values):
+    return [values] if isinstance(values, (str, int)) else list(values)
+
+
+def _float_values(series):
+    # float columns keep their dtype, as they do in pandas shifts
+    dtype = series.dtype if isinstance(series.dtype, np.dtype) and series.dtype.kind == 'f' \
+        else np.float64
+    return series.to_numpy(dtype=dtype, na_value=np.nan)
+
+
+def _new_columns(feature):
+    # tuples (input column, new column, window size or lag, coefficient) for
+    # the columns created by a feature, in the order of timeseriesutils
+    fun, args = feature['fun'], feature['args']
+    if fun == 'horizon_targets':
+        return [(None, 'horizon', None, None)]
+
+    result = []
+    for c in _as_list(args['columns']):
+        if fun == 'windowed_taylor_coefs':
+            window_align = args.get('window_align', 'trailing')
+            ew_span = args.get('ew_span', None)
+            if window_align != 'trailing' or ew_span is not None or args.get('fill_edges', False):
+                raise NotImplementedError(
+                    'Only trailing windows with uniform weights and fill_edges=False are supported.')
+            degree = args['taylor_degree']
+            result += [(c, f'{c}_taylor_d{degree}_c{k}_w{w}{window_align[0]}_s{ew_span}', w, k)
+                       for w in _as_list(args['window_size']) for k in range(degree + 1)]
+        elif fun == 'rollmean':
+            result += [(c, f'{c}_rollmean_w{w}', w, None) for w in _as_list(args['window_size'])]
+        elif fun == 'lag':
+            result += [(c, f'{c}_lag{lag}', lag, None) for lag in _as_list(args['lags'])]
+        else:
+            raise ValueError(f'Unsupported feature function: {fun}')
+    return result
+
+
+def feature_names(feature):
+    '''
+    Names of the feature columns that `featurize_data` creates for one
+    feature specification
+    '''
+    return [name for _, name, _, _ in _new_columns(feature)]
+
+
+def _compute(fun, args, grps, values, size):
+    # values of the features with window size or lag `size` of the sorted
+    # `values`, in sorted order
+    if fun == 'lag':
+        return grps.shift(values, size)
+    values = values.astype(np.float64, copy=False)
+    if fun == 'rollmean':
+        return grps.windowed(values, np.ones((1, size)), size - 1)[:, 0] / size
+    return grps.windowed(values, taylor_projection(args['taylor_degree'], size), size)
+
+
+def featurize_data(df, group_columns, features):
+    '''
+    Compute features within groups of rows of a data frame
+
+    Parameters
+    ----------
+    df: pandas data frame; within each group, rows are in time order
+    group_columns: list of names of columns defining the groups; each feature
+      may override it with a `group_columns` entry in its `args`
+    features: list of dictionaries with entries `fun`, the name of a feature
+      function, and `args`, a dictionary of its arguments:
+      - `windowed_taylor_coefs`: `columns`, `taylor_degree`, `window_size` (one
+        or a list of sizes), `window_align` ('trailing'), `ew_span` (None) and
+        `fill_edges` (False)
+      - `rollmean`: `columns` and `window_size`
+      - `lag`: `columns` and `lags`
+      - `horizon_targets`: `columns`, `horizons`, and `expand_rows` (True)
+      `columns` may name columns created by earlier features.
+
+    Returns
+    -------
+    tuple with the augmented data frame and the list of names of new feature
+    columns. Targets are in columns named `{column}_target`, or
+    `{column}_target_h{horizon}` if rows are not expanded by horizon, which
+    are not included in the feature names.
+    '''
+    horizon_targets = None
+    for i, feature in enumerate(features):
+        if feature['fun'] == 'horizon_targets':
+            if i != len(features) - 1:
+                raise ValueError('horizon_targets must be the last feature.')
+            horizon_targets = feature['args']
+    expand_rows = horizon_targets is not None and horizon_targets.get('expand_rows', True)
+
+    groups = {}
+    def get_groups(args):
+        key = tuple(_as_list(args.get('group_columns', group_columns)))
+        if key not in groups:
+            groups[key] = _Groups(df, list(key))
+        return groups[key]
+
+    new_columns = {}
+    sorted_values = {}
+    def get_sorted(column, grps):
+        key = (column, id(grps))
+        if key not in sorted_values:
+            values = new_columns[column] if column in new_columns else _float_values(df[column])
+            sorted_values[key] = grps.to_sorted(values)
+        return sorted_values[key]
+
+    feat_names = []
+    for feature in features:
+        fun, args = feature['fun'], feature['args']
+        if fun == 'horizon_targets':
+            if expand_rows:
+                feat_names.append('horizon')
+            continue
+
+        grps = get_groups(args)
+        for c, name, size, k in _new_columns(feature):
+            if k is None or k == 0:
+                # all coefficients of a polynomial fit are computed together
+                computed = grps.from_sorted(_compute(fun, args, grps, get_sorted(c, grps), size))
+            new_columns[name] = computed if k is None else computed[:, k]
+            feat_names.append(name)
+
+    targets = {}
+    if horizon_targets is not None:
+        grps = get_groups(horizon_targets)
+        horizons = _as_list(horizon_targets['horizons'])
+        for c in _as_list(horizon_targets['columns']):
+            values = get_sorted(c, grps)
+            blocks = [grps.from_sorted(grps.shift(values, -h)) for h in horizons]
+            # one block of rows per horizon, or one column per horizon
+            if expand_rows:
+                targets[f'{c}_target'] = np.concatenate(blocks)
+            else:
+                new_columns.update({f'{c}_target_h{h}': block for h, block in zip(horizons, blocks)})
+
+    # add all columns at once rather than one at a time
+    replaced = [c for c in new_columns if c in df.columns]
+    if len(replaced) > 0:
+        df = df.drop(columns=replaced)
+    df = pd.concat([df, pd.DataFrame(new_columns, index=df.index)], axis=1)
+
+    if expand_rows:
+        # one copy of the rows per horizon, keeping the index of the rows
+        n = len(df)
+        df = df.take(np.tile(np.arange(n), len(horizons)))
+        for c, values in targets.items():
+            df[c] = values
+        df['horizon'] = np.repeat(np.array(horizons, dtype=np.int64), n)
+
+    return df, feat_names
@@ -0,0 +1,245 @@
+'''
+Content-addressed store for the output of `create_features_and_targets`.
+
+Entries are keyed by a fingerprint of the input data and the feature
+specification (the feature definitions, `max_horizon`, `incl_level_feats`,
+and the existing feature names), so re-running a reference date with the same
+data vintage and feature settings reads the featurized data instead of
+computing it again. Each entry is a directory holding the feature frame as an
+uncompressed Arrow file, which is memory-mapped when read, and a json file
+with the feature names and a description of the entry.
+
+The store can be managed from the command line, with `code/gbq` as the working
+directory:
+python feature_store.py ../../feature-store list
+python feature_store.py ../../feature-store inspect <key>
+python feature_store.py ../../feature-store gc --max_age_days 30 --max_size_gb 20
+'''
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.feather as feather
+
+
+_DATA_FILE = 'features.arrow'
+_INFO_FILE = 'info.json'
+
+
+def fingerprint_data(df):
+    '''
+    Hash of the values, index, column names, and dtypes of a data frame
+
+    Returns
+    -------
+    hexadecimal string
+    '''
+    h = hashlib.sha256()
+    h.update(repr([(c, str(dtype)) for c, dtype in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+class FeatureStore():
+    def __init__(self, root):
+        '''
+        Parameters
+        ----------
+        root: path to the directory holding the store; created when the first
+          entry is stored
+        '''
+        self.root = Path(root)
+
+
+    def key(self, df, spec):
+        '''
+        Key of the entry for featurizing `df` with the settings in `spec`
+
+        Parameters
+        ----------
+        df: data frame that is the input to featurization
+        spec: dictionary with json-serializable values describing the feature
+          settings
+
+        Returns
+        -------
+        hexadecimal string
+        '''
+        spec_json = json.dumps(spec, sort_keys=True, default=str)
+        return hashlib.sha256((fingerprint_data(df) + spec_json).encode()).hexdigest()[:32]
+
+
+    def get(self, key):
+        '''
+        Read an entry
+
+        Returns
+        -------
+        tuple of the feature data frame and the list of feature names, or None
+        if there is no entry with the given key
+        '''
+        entry = self.root / key
+        try:
+            with open(entry / _INFO_FILE) as f:
+                info = json.load(f)
+            df = feather.read_table(entry / _DATA_FILE, memory_map=True).to_pandas()
+        except FileNotFoundError:
+            return None
+
+        # the modification time of the data file records the last use, for gc
+        os.utime(entry / _DATA_FILE)
+        return df, info['feat_names']
+
+
+    def put(self, key, df, feat_names, spec=None):
+        '''
+        Store an entry. The entry is written to a temporary directory and moved
+        into place, so concurrent readers never see a partial entry; if
+        another process stored the same key first, its entry is kept.
+        '''
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(dir=self.root, prefix='.tmp-'))
+        try:
+            feather.write_feather(df, tmp_dir / _DATA_FILE, compression='uncompressed')
+            info = {
+                'key': key,
+                'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                'n_rows': len(df),
+                'n_columns': len(df.columns),
+                'feat_names': list(feat_names),
+                'spec': spec
+            }
+            with open(tmp_dir / _INFO_FILE, 'w') as f:
+                json.dump(info, f, indent=2, default=str)
+
+            try:
+                os.replace(tmp_dir, self.root / key)
+            except OSError:
+                # the entry exists already
+                pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+    def entries(self):
+        '''
+        Summary of the entries in the store
+
+        Returns
+        -------
+        Pandas DataFrame with one row per entry and columns `key`, `created`,
+        `last_used`, `n_rows`, `n_columns`, and `size_mb`, sorted by last use
+        '''
+        records = []
+        for entry in self._entry_dirs():
+            if not self._is_complete(entry):
+                continue
+            with open(entry / _INFO_FILE) as f:
+                info = json.load(f)
+            records.append({
+                'key': entry.name,
+                'created': info['created'],
+                'last_used': datetime.datetime.fromtimestamp((entry / _DATA_FILE).stat().st_mtime) \
+                    .isoformat(timespec='seconds'),
+                'n_rows': info['n_rows'],
+                'n_columns': info['n_columns'],
+                'size_mb': sum(f.stat().st_size for f in entry.iterdir()) / 2**20
+            })
+
+        columns = ['key', 'created', 'last_used', 'n_rows', 'n_columns', 'size_mb']
+        return pd.DataFrame.from_records(records, columns=columns) \
+            .sort_values('last_used', ascending=False, ignore_index=True)
+
+
+    def _entry_dirs(self):
+        # directories of entries, excluding temporary directories of writes
+        return [p for p in self.root.glob('*') if p.is_dir() and not p.name.startswith('.')]
+
+
+    def _is_complete(self, entry):
+        return (entry / _INFO_FILE).exists() and (entry / _DATA_FILE).exists()
+
+
+    def info(self, key):
+        '''Contents of the json file describing an entry'''
+        with open(self.root / key / _INFO_FILE) as f:
+            return json.load(f)
+
+
+    def gc(self, max_age_days=None, max_size_gb=None, dry_run=False):
+        '''
+        Remove entries that have not been used in `max_age_days` days, then the
+        least recently used entries until the store is at most `max_size_gb`
+        gigabytes. Incomplete entries, and temporary directories left by writes
+        that were interrupted more than a day ago, are always removed.
+
+        Returns
+        -------
+        list of the keys of removed entries
+        '''
+        if not self.root.exists():
+            return []
+
+        now = time.time()
+        entries = self.entries()
+        remove = [p.name for p in self._entry_dirs() if not self._is_complete(p)]
+        if max_age_days is not None:
+            age = pd.Timestamp.fromtimestamp(now) - pd.to_datetime(entries['last_used'])
+            remove += list(entries.loc[age > pd.Timedelta(days=max_age_days), 'key'])
+        if max_size_gb is not None:
+            kept = entries.loc[~entries['key'].isin(remove)]
+            # entries are sorted by decreasing last use
+            over = kept['size_mb'].cumsum() > max_size_gb * 2**10
+            remove += list(kept.loc[over, 'key'])
+
+        if not dry_run:
+            for key in remove:
+                shutil.rmtree(self.root / key, ignore_errors=True)
+            for path in self.root.glob('.tmp-*'):
+                # leave temporary directories of writes that may be in progress
+                if now - path.stat().st_mtime > 86400:
+                    shutil.rmtree(path, ignore_errors=True)
+
+        return remove
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage a store of featurized data for gbq models')
+    parser.add_argument('root', help='Path to the directory holding the store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='List entries, most recently used first')
+    inspect_parser = subparsers.add_parser('inspect', help='Show the description of an entry')
+    inspect_parser.add_argument('key')
+    gc_parser = subparsers.add_parser('gc', help='Remove old entries')
+    gc_parser.add_argument('--max_age_days', type=float, default=None,
+                           help='Remove entries not used in this many days')
+    gc_parser.add_argument('--max_size_gb', type=float, default=None,
+                           help='Remove least recently used entries until the store is at most this size')
+    gc_parser.add_argument('--dry_run', action='store_true',
+                           help='Print the entries that would be removed without removing them')
+    args = parser.parse_args()
+
+    store = FeatureStore(args.root)
+    if args.command == 'list':
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(store.entries().to_string(index=False))
+    elif args.command == 'inspect':
+        print(json.dumps(store.info(args.key), indent=2))
+    else:
+        removed = store.gc(max_age_days=args.max_age_days, max_size_gb=args.max_size_gb,
+                           dry_run=args.dry_run)
+        print(f'{"would remove" if args.dry_run else "removed"} {len(removed)} entries')
+        for key in removed:
+            print(key)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,55 @@
 import fnmatch
 
+import numpy as np
 import pandas as pd
 
-from timeseriesutils import featurize
 from data_pipeline.utils import get_holidays
+import feature_engine
 
 
-def create_features_and_targets(df, incl_level_feats, max_horizon, curr_feat_names = []):
+# bump this whenever a change to create_features_and_targets alters its output,
+# so that entries in feature stores written by older code are not reused
+FEATURES_VERSION = 3
+
+# features summarizing data within each combination of source and location;
+# lags of `inc_trans_cs` and these features are added as well
+WINDOW_FEATURES = [
+    {
+        'fun': 'windowed_taylor_coefs',
+        'args': {
+            'columns': 'inc_trans_cs',
+            'taylor_degree': 2,
+            'window_align': 'trailing',
+            'window_size': [4, 6],
+            'fill_edges': False
+        }
+    },
+    {
+        'fun': 'windowed_taylor_coefs',
+        'args': {
+            'columns': 'inc_trans_cs',
+            'taylor_degree': 1,
+            'window_align': 'trailing',
+            'window_size': [3, 5],
+            'fill_edges': False
+        }
+    },
+    {
+        'fun': 'rollmean',
+        'args': {
+            'columns': 'inc_trans_cs',
+            'group_columns': ['location'],
+            'window_size': [2, 4]
+        }
+    }
+]
+
+LAGS = [1, 2]
+
+
+def create_features_and_targets(df, incl_level_feats, max_horizon, curr_feat_names = [],
+                                categorical_encoding = 'one_hot', feature_store = None,
+                                expand_horizons = True):
     '''
     Create features and targets for prediction
     
@@ -20,23 +63,69 @@ def create_features_and_targets(df, incl_level_feats, max_horizon, curr_feat_nam
       maximum forecast horizon
     curr_feat_names: list of strings
       list of names of columns in `df` containing existing features
+    categorical_encoding: string
+      how data source, agg_level, and location are represented as features:
+      'one_hot' adds a 0/1 column for each of their values; 'categorical'
+      uses the columns themselves, with a categorical dtype, which LightGBM
+      handles as categorical features without the extra columns
+    feature_store: `feature_store.FeatureStore` or None
+      if provided, the result is read from the store if it holds an entry for
+      the same `df` and feature settings, and is stored in it otherwise
+    expand_horizons: boolean
+      if True, the data frame has one copy of each row per horizon, with a
+      `horizon` column and targets in `inc_trans_cs_target` and
+      `delta_target`. If False, it has each row once, with targets for horizon
+      `h` in `inc_trans_cs_target_h{h}` and `delta_target_h{h}`; `horizon` is
+      still included in the feature names, and is set for each pair of a row
+      and a horizon by `design_matrix.DesignMatrix.from_frame`.
     
     Returns
     -------
     tuple with:
     - the input data frame, augmented with additional columns with feature and
       target values
-    - a list of all feature names, columns in the data frame
+    - a list of all feature names, columns in the data frame except for
+      `horizon` if `expand_horizons` is False
+    
+    If `df` uses the compact dtypes returned by `load_data(compact=True)`, they
+    are kept: `delta_xmas` has the dtype of `season_week`, and new feature and
+    target columns are float32.
     '''
+    if feature_store is not None:
+        spec = {
+            'version': FEATURES_VERSION,
+            'window_features': WINDOW_FEATURES,
+            'lags': LAGS,
+            'max_horizon': max_horizon,
+            'incl_level_feats': incl_level_feats,
+            'curr_feat_names': list(curr_feat_names),
+            'categorical_encoding': categorical_encoding,
+            'expand_horizons': expand_horizons
+        }
+        key = feature_store.key(df, spec)
+        result = feature_store.get(key)
+        if result is None:
+            result = create_features_and_targets(df, incl_level_feats, max_horizon, curr_feat_names,
+                                                 categorical_encoding, expand_horizons=expand_horizons)
+            feature_store.put(key, *result, spec=spec)
+        return result
     
     # current features; will be updated
     feat_names = curr_feat_names
+    input_dtypes = df.dtypes
     
-    # one-hot encodings of data source, agg_level, and location
-    for c in ['source', 'agg_level', 'location']:
-        ohe = pd.get_dummies(df[c], prefix=c)
-        df = pd.concat([df, ohe], axis=1)
-        feat_names = feat_names + list(ohe.columns)
+    # encodings of data source, agg_level, and location
+    if categorical_encoding == 'one_hot':
+        for c in ['source', 'agg_level', 'location']:
+            ohe = pd.get_dummies(df[c], prefix=c)
+            df = pd.concat([df, ohe], axis=1)
+            feat_names = feat_names + list(ohe.columns)
+    elif categorical_encoding == 'categorical':
+        df = df.astype({c: 'category' for c in ['source', 'agg_level', 'location']
+                        if not isinstance(df[c].dtype, pd.CategoricalDtype)})
+        feat_names = feat_names + ['source', 'agg_level', 'location']
+    else:
+        raise ValueError("categorical_encoding must be 'one_hot' or 'categorical'.")
     
     # season week relative to christmas
     df = df.merge(
@@ -47,74 +136,47 @@ def create_features_and_targets(df, incl_level_feats, max_horizon, curr_feat_nam
             how='left',
             on='season') \
         .assign(delta_xmas = lambda x: x['season_week'] - x['xmas_week'])
+    if pd.api.types.is_extension_array_dtype(input_dtypes['season_week']):
+        df['delta_xmas'] = df['delta_xmas'].astype(input_dtypes['season_week'])
+    df['season'] = df['season'].astype(input_dtypes['season'])
     
     feat_names = feat_names + ['delta_xmas']
     
-    # features summarizing data within each combination of source and location
-    df, new_feat_names = featurize.featurize_data(
+    # features summarizing data within each combination of source and location,
+    # their lags, and forecast targets, computed in one pass over the data
+    window_feat_names = [name for feature in WINDOW_FEATURES
+                         for name in feature_engine.feature_names(feature)]
+    horizons = [(i + 1) for i in range(max_horizon)]
+    df, new_feat_names = feature_engine.featurize_data(
         df, group_columns=['source', 'location'],
-        features = [
-            {
-                'fun': 'windowed_taylor_coefs',
-                'args': {
-                    'columns': 'inc_trans_cs',
-                    'taylor_degree': 2,
-                    'window_align': 'trailing',
-                    'window_size': [4, 6],
-                    'fill_edges': False
-                }
-            },
-            {
-                'fun': 'windowed_taylor_coefs',
-                'args': {
-                    'columns': 'inc_trans_cs',
-                    'taylor_degree': 1,
-                    'window_align': 'trailing',
-                    'window_size': [3, 5],
-                    'fill_edges': False
-                }
-            },
-            {
-                'fun': 'rollmean',
-                'args': {
-                    'columns': 'inc_trans_cs',
-                    'group_columns': ['location'],
-                    'window_size': [2, 4]
-                }
-            }
-        ])
-    feat_names = feat_names + new_feat_names
-    
-    df, new_feat_names = featurize.featurize_data(
-        df, group_columns=['source', 'location'],
-        features = [
+        features = WINDOW_FEATURES + [
             {
                 'fun': 'lag',
                 'args': {
-                    'columns': ['inc_trans_cs'] + new_feat_names,
-                    'lags': [1, 2]
+                    'columns': ['inc_trans_cs'] + window_feat_names,
+                    'lags': LAGS
                 }
-            }
-        ])
-    feat_names = feat_names + new_feat_names
-    
-    # add forecast targets
-    df, new_feat_names = featurize.featurize_data(
-        df, group_columns=['source', 'location'],
-        features = [
+            },
             {
                 'fun': 'horizon_targets',
                 'args': {
                     'columns': 'inc_trans_cs',
-                    'horizons': [(i + 1) for i in range(max_horizon)]
+                    'horizons': horizons,
+                    'expand_rows': expand_horizons
                 }
             }
         ])
+    target_suffixes = [''] if expand_horizons else [f'_h{h}' for h in horizons]
+    df = _keep_float_dtype(df, new_feat_names + [f'inc_trans_cs_target{s}' for s in target_suffixes],
+                           input_dtypes['inc_trans_cs'])
     feat_names = feat_names + new_feat_names
+    if not expand_horizons:
+        feat_names = feat_names + ['horizon']
     
     # we will model the differences between the prediction target and the most
     # recent observed value
-    df['delta_target'] = df['inc_trans_cs_target'] - df['inc_trans_cs']
+    for s in target_suffixes:
+        df[f'delta_target{s}'] = df[f'inc_trans_cs_target{s}'] - df['inc_trans_cs']
     
     # if requested, drop features that involve absolute level
     if not incl_level_feats:
@@ -123,6 +185,19 @@ def create_features_and_targets(df, incl_level_feats, max_horizon, curr_feat_nam
     return df, feat_names
 
 
+def _keep_float_dtype(df, columns, dtype):
+    '''
+    Cast float columns in `columns` to `dtype` if it is float32, so that
+    features computed from compact data do not upcast to float64
+    '''
+    if dtype != np.float32:
+        return df
+    
+    columns = [c for c in dict.fromkeys(columns)
+               if c in df.columns and df[c].dtype == np.float64]
+    return df.astype({c: np.float32 for c in columns})
+
+
 def _drop_level_feats(feat_names):
     level_feats = ['inc_trans_cs', 'inc_trans_cs_lag1', 'inc_trans_cs_lag2'] + \
                   fnmatch.filter(feat_names, '*taylor_d?_c0*') + \
@@ -7,6 +7,8 @@ import pandas as pd
 import lightgbm as lgb
 
 from data_pipeline.loader import FluDataLoader
+from design_matrix import DesignMatrix
+from feature_store import FeatureStore
 from preprocess import create_features_and_targets
 
 
@@ -28,41 +30,60 @@ def run_gbq_flu_model(model_config, run_config):
         flusurvnet_kwargs = {'burden_adj': False}
     
     fdl = FluDataLoader('../../data-raw')
-    df = fdl.load_data(hhs_kwargs={'as_of': run_config.ref_date},
-                       ilinet_kwargs=ilinet_kwargs,
-                       flusurvnet_kwargs=flusurvnet_kwargs,
-                       sources=model_config.sources,
-                       power_transform=model_config.power_transform)
+    df, normalization = fdl.load_data(hhs_kwargs={'as_of': run_config.ref_date},
+                                      ilinet_kwargs=ilinet_kwargs,
+                                      flusurvnet_kwargs=flusurvnet_kwargs,
+                                      sources=model_config.sources,
+                                      power_transform=model_config.power_transform,
+                                      compact=run_config.compact,
+                                      return_normalization=True)
+    if run_config.compact:
+        _report_memory_usage(df)
     
     # augment data with features and target values
+    feature_store = None if run_config.feature_store_root is None \
+        else FeatureStore(run_config.feature_store_root)
     df, feat_names = create_features_and_targets(
         df = df,
         incl_level_feats=model_config.incl_level_feats,
         max_horizon=run_config.max_horizon,
-        curr_feat_names=['inc_trans_cs', 'season_week', 'log_pop'])
-    
-    # keep only rows that are in-season
-    df = df.query("season_week >= 5 and season_week <= 45")
-    
-    # "test set" df used to generate look-ahead predictions
-    df_test = df.loc[df.wk_end_date == df.wk_end_date.max()] \
-        .copy()
-    
-    # "train set" df for model fitting; target value non-missing
-    df_train = df.loc[~df['delta_target'].isna().values]
+        curr_feat_names=['inc_trans_cs', 'season_week', 'log_pop'],
+        categorical_encoding=model_config.categorical_encoding,
+        feature_store=feature_store,
+        expand_horizons=False)
+    
+    # keep only rows that are in-season, as a matrix of features with the
+    # target and the columns needed to format predictions; the data frame is
+    # not needed afterwards. The features of each row are stored once, and
+    # the matrix has a row for each combination of a row and a horizon
+    in_season = df.eval("season_week >= 5 and season_week <= 45")
+    dm = DesignMatrix.from_frame(
+        df, feat_names,
+        target='delta_target',
+        metadata_columns=['source', 'location', 'wk_end_date', 'pop', 'inc_trans_cs'],
+        rows=np.flatnonzero(in_season.to_numpy(dtype=bool, na_value=False)),
+        horizons=[(i + 1) for i in range(run_config.max_horizon)])
+    del df, in_season
+    
+    # "test set" rows used to generate look-ahead predictions
+    wk_end_date = dm.metadata['wk_end_date']
+    test_rows = np.flatnonzero((wk_end_date == wk_end_date.max()).to_numpy()[dm.base_rows])
+    
+    # "train set" rows for model fitting; target value non-missing
+    train_rows = np.flatnonzero(~np.isnan(dm.y))
     
     # train model and obtain test set predictinos
     if model_config.fit_locations_separately:
-        locations = df_test['location'].unique()
+        locations = dm.row_metadata(test_rows)['location'].unique()
         preds_df = [
             _train_gbq_and_predict(model_config, run_config,
-                                   df_train, df_test, feat_names, location) \
+                                   dm, train_rows, test_rows, normalization, location) \
             for location in locations
         ]
         preds_df = pd.concat(preds_df, axis=0)
     else:
         preds_df = _train_gbq_and_predict(model_config, run_config,
-                                          df_train, df_test, feat_names)
+                                          dm, train_rows, test_rows, normalization)
     
     # save
     save_path = _build_save_path(
@@ -73,8 +94,26 @@ def run_gbq_flu_model(model_config, run_config):
     preds_df.to_csv(save_path, index=False)
 
 
+def _report_memory_usage(df):
+    '''
+    Print the memory used by a data frame with compact dtypes, and by the same
+    data with the default object and 64-bit dtypes. Columns are converted one
+    at a time, so the comparison needs little additional memory.
+    '''
+    mem_compact = df.memory_usage(deep=True, index=False).sum()
+    mem_default = 0
+    for c, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            mem_default += df[c].astype(object).memory_usage(deep=True, index=False)
+        else:
+            mem_default += len(df) * max(dtype.itemsize, 8)
+    
+    print(f'data with compact dtypes: {mem_compact / 2**20:.1f} MB; ' +
+          f'with default dtypes: {mem_default / 2**20:.1f} MB')
+
+
 def _train_gbq_and_predict(model_config, run_config,
-                           df_train, df_test, feat_names, location = None):
+                           dm, train_rows, test_rows, normalization, location = None):
     '''
     Train gbq model and get predictions on the original target scale,
     formatted in the FluSight hub format.
@@ -83,9 +122,11 @@ def _train_gbq_and_predict(model_config, run_config,
     ----------
     model_config: configuration object with settings for the model
     run_config: configuration object with settings for the run
-    df_train: data frame with training data
-    df_test: data frame with test data
-    feat_names: list of names of columns with features
+    dm: `design_matrix.DesignMatrix` with features, targets, and metadata
+    train_rows: integer array with the rows of `dm` used for training
+    test_rows: integer array with the rows of `dm` to predict
+    normalization: `data_pipeline.normalization.Normalization` with the scale
+        and center factors used to transform the data
     location: optional string of location to fit to. Default, None, fits to all locations
     
     Returns
@@ -94,30 +135,25 @@ def _train_gbq_and_predict(model_config, run_config,
     '''
     # filter to location if necessary
     if location is not None:
-        df_test = df_test.query(f'location == "{location}"')
-        df_train = df_train.query(f'location == "{location}"')
-    
-    # get x and y
-    x_test = df_test[feat_names]
-    x_train = df_train[feat_names]
-    y_train = df_train['delta_target']
+        locations = dm.metadata['location'].to_numpy()
+        train_rows = train_rows[locations[dm.base_rows[train_rows]] == location]
+        test_rows = test_rows[locations[dm.base_rows[test_rows]] == location]
     
     # test set predictions:
-    # same number of rows as df_test, one column per quantile level
+    # same number of rows as test_rows, one column per quantile level
     test_pred_qs_df = _get_test_quantile_predictions(
         model_config, run_config,
-        df_train, x_train, y_train, x_test
+        dm, train_rows, test_rows
     )
     
-    # add predictions to original test df
-    df_test.reset_index(drop=True, inplace=True)
+    # add predictions to test set metadata
+    df_test = dm.row_metadata(test_rows)
     df_test_w_preds = pd.concat([df_test, test_pred_qs_df], axis=1)
     
     # melt to get columns into rows, keeping only the things we need to invert data
     # transforms later on
     cols_to_keep = ['source', 'location', 'wk_end_date', 'pop',
-                    'inc_trans_cs', 'horizon',
-                    'inc_trans_center_factor', 'inc_trans_scale_factor']
+                    'inc_trans_cs', 'horizon']
     preds_df = df_test_w_preds[cols_to_keep + run_config.q_labels]
     preds_df = preds_df.loc[(preds_df['source'] == 'hhs')]
     preds_df = pd.melt(preds_df,
@@ -127,15 +163,7 @@ def _train_gbq_and_predict(model_config, run_config,
     
     # build data frame with predictions on the original scale
     preds_df['inc_trans_cs_target_hat'] = preds_df['inc_trans_cs'] + preds_df['delta_hat']
-    preds_df['inc_trans_target_hat'] = (preds_df['inc_trans_cs_target_hat'] + preds_df['inc_trans_center_factor']) * (preds_df['inc_trans_scale_factor'] + 0.01)
-    if model_config.power_transform == '4rt':
-        inv_power = 4
-    elif model_config.power_transform is None:
-        inv_power = 1
-    else:
-        raise ValueError('unsupported power_transform: must be "4rt" or None')
-    
-    preds_df['value'] = (np.maximum(preds_df['inc_trans_target_hat'], 0.0) ** inv_power - 0.01 - 0.75**4) * preds_df['pop'] / 100000
+    preds_df['value'] = (normalization.inverse(preds_df, preds_df['inc_trans_cs_target_hat']) - 0.75**4) * preds_df['pop'] / 100000
     preds_df['value'] = np.maximum(preds_df['value'], 0.0)
     
     # get predictions into the format needed for FluSight hub submission
@@ -152,7 +180,7 @@ def _train_gbq_and_predict(model_config, run_config,
 
 
 def _get_test_quantile_predictions(model_config, run_config,
-                                   df_train, x_train, y_train, x_test):
+                                   dm, train_rows, test_rows):
     '''
     Train the model on bagged subsets of the training data and obtain
     quantile predictions. This is the heart of the method.
@@ -161,15 +189,14 @@ def _get_test_quantile_predictions(model_config, run_config,
     ----------
     model_config: configuration object with settings for the model
     run_config: configuration object with settings for the run
-    df_train: Pandas data frame with training data
-    x_train: numpy array with training instances in rows, features in columns
-    y_train: numpy array with target values
-    x_test: numpy array with test instances in rows, features in columns
+    dm: `design_matrix.DesignMatrix` with features and targets
+    train_rows: integer array with the rows of `dm` used for training
+    test_rows: integer array with the rows of `dm` to predict
     
     Returns
     -------
     Pandas data frame with test set predictions. The number of rows matches
-    the number of rows of `x_test`. The number of columns matches the number
+    the length of `test_rows`. The number of columns matches the number
     of quantile levels for predictions as specified in the `run_config`.
     Column names are given by `run_config.q_labels`.
     '''
@@ -180,40 +207,52 @@ def _get_test_quantile_predictions(model_config, run_config,
     lgb_seeds = rng.integers(1e8, size=(model_config.num_bags, len(run_config.q_levels)))
     
     # training loop over bags
+    x_test = dm.take(test_rows)
     test_preds_by_bag = np.empty((x_test.shape[0], model_config.num_bags, len(run_config.q_levels)))
     
-    train_seasons = df_train['season'].unique()
+    # seasons in order of appearance in the training data
+    train_season_codes = dm.season_codes[train_rows]
+    train_seasons = pd.unique(train_season_codes)
     
     feat_importance = list()
     
     for b in tqdm(range(model_config.num_bags), 'Bag number'):
-        # get indices of observations that are in bag
+        # get indices of observations that are in bag; one LightGBM dataset
+        # of the bag's rows is used for all quantile levels. Bags with more
+        # rows than LightGBM samples to find the bins of the features share
+        # the sample, drawn with a seed of the bag
         bag_seasons = rng.choice(
             train_seasons,
             size = int(len(train_seasons) * model_config.bag_frac_samples),
             replace=False)
-        bag_obs_inds = df_train['season'].isin(bag_seasons)
+        bag_rows = train_rows[np.isin(train_season_codes, bag_seasons)]
+        bag_dataset = dm.lgb_dataset(
+            bag_rows,
+            params={'verbosity': -1, 'data_random_seed': int(lgb_seeds[b, 0])})
         
         for q_ind, q_level in enumerate(run_config.q_levels):
-            # fit to bag
-            model = lgb.LGBMRegressor(
-                verbosity=-1,
-                objective='quantile',
-                alpha=q_level,
-                random_state=lgb_seeds[b, q_ind])
-            model.fit(X=x_train.loc[bag_obs_inds, :], y=y_train.loc[bag_obs_inds])
+            # fit to bag, with the default settings of `lgb.LGBMRegressor`
+            model = lgb.train(
+                params={
+                    'verbosity': -1,
+                    'objective': 'quantile',
+                    'alpha': q_level,
+                    'seed': int(lgb_seeds[b, q_ind])
+                },
+                train_set=bag_dataset,
+                num_boost_round=100)
 
             feat_importance.append(
                 pd.DataFrame({
-                    'feat': x_train.columns,
-                    'importance': model.feature_importances_,
+                    'feat': dm.feat_names,
+                    'importance': model.feature_importance(),
                     'b': b,
                     'q_level': q_level
                 })
             )
             
             # test set predictions
-            test_preds_by_bag[:, b, q_ind] = model.predict(X=x_test)
+            test_preds_by_bag[:, b, q_ind] = model.predict(x_test)
     
     # combine and save feature importance scores
     if run_config.save_feat_importance:
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from preprocess import create_features_and_targets
+
+
+@pytest.fixture
+def df():
+    dates = pd.date_range('2023-10-07', periods=20, freq='7D')
+    df = pd.DataFrame([
+        {'source': source, 'agg_level': agg_level, 'location': location,
+         'season': '2023/24', 'season_week': i + 10, 'wk_end_date': date}
+        for source in ['hhs', 'ilinet']
+        for agg_level, location in [('state', '25'), ('national', 'US')]
+        for i, date in enumerate(dates)
+    ])
+    df['inc_trans_cs'] = np.random.default_rng(1).normal(size=len(df))
+    df['log_pop'] = 15.0
+    return df
+
+
+def test_categorical_encoding(df):
+    curr_feat_names = ['inc_trans_cs', 'season_week', 'log_pop']
+    df_ohe, feat_names_ohe = create_features_and_targets(df, True, 2, curr_feat_names)
+    df_cat, feat_names_cat = create_features_and_targets(
+        df, True, 2, curr_feat_names, categorical_encoding='categorical')
+
+    ohe_columns = ['source_hhs', 'source_ilinet', 'agg_level_national', 'agg_level_state',
+                   'location_25', 'location_US']
+    assert feat_names_ohe[3:9] == ohe_columns
+    assert feat_names_cat == feat_names_ohe[:3] + ['source', 'agg_level', 'location'] + \
+        feat_names_ohe[9:]
+    for c in ['source', 'agg_level', 'location']:
+        assert isinstance(df_cat[c].dtype, pd.CategoricalDtype)
+        pd.testing.assert_series_equal(df_cat[c].astype(object), df_ohe[c])
+
+    # the remaining features do not depend on the encoding
+    other = [c for c in feat_names_ohe if c not in ohe_columns] + ['delta_target']
+    pd.testing.assert_frame_equal(df_cat[other], df_ohe[other])
+
+    with pytest.raises(ValueError):
+        create_features_and_targets(df, True, 2, curr_feat_names, categorical_encoding='sparse')
@@ -0,0 +1,104 @@
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pytest
+from design_matrix import DesignMatrix
+from preprocess import create_features_and_targets
+
+
+def test_from_frame():
+    df = pd.DataFrame({
+        'inc_trans_cs': [0.1, np.nan, 1.5, 2.0],
+        'season_week': pd.array([10, 11, pd.NA, 13], dtype='Int16'),
+        'location_US': np.array([1, 0, 1, 0], dtype=np.uint8),
+        'location': pd.Categorical(['US', '25', 'US', None]),
+        'season': ['2023/24', '2022/23', '2023/24', '2023/24'],
+        'delta_target': [0.1, 0.2, np.nan, 0.4],
+        'horizon': [1, 1, 2, 2]
+    }, index=[5, 6, 5, 6])
+    feat_names = ['inc_trans_cs', 'season_week', 'location_US', 'location']
+    dm = DesignMatrix.from_frame(df, feat_names, target='delta_target',
+                                 metadata_columns=['location', 'horizon'], rows=np.array([3, 0, 1]))
+
+    # float64 features are kept as they are
+    assert dm.x.dtype == np.float64 and dm.x.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(dm.x, np.array([
+        [2.0, 13, 0, np.nan],
+        [0.1, 10, 1, 1],
+        [np.nan, 11, 0, 0]
+    ]))
+    assert dm.categorical_features == [3]
+    np.testing.assert_array_equal(dm.y, np.array([0.4, 0.1, 0.2], dtype=np.float32))
+    assert list(dm.seasons[dm.season_codes]) == ['2023/24', '2023/24', '2022/23']
+    pd.testing.assert_frame_equal(dm.metadata, df[['location', 'horizon']].iloc[[3, 0, 1]]
+                                  .reset_index(drop=True))
+    assert len(dm) == 3
+
+    # with compact dtypes, all float features are float32
+    df['inc_trans_cs'] = df['inc_trans_cs'].astype(np.float32)
+    dm = DesignMatrix.from_frame(df, feat_names, target='delta_target', rows=np.array([3, 0, 1]))
+    assert dm.x.dtype == np.float32
+    assert dm.x[1, 0] == np.float32(0.1)
+
+
+@pytest.fixture
+def featurized():
+    dates = pd.date_range('2022-10-08', periods=40, freq='7D')
+    df = pd.DataFrame([
+        {'source': source, 'agg_level': agg_level, 'location': location,
+         'season': '2022/23' if i < 30 else '2023/24', 'season_week': i % 30 + 5,
+         'wk_end_date': date}
+        for source in ['hhs', 'ilinet']
+        for agg_level, location in [('state', '25'), ('national', 'US')]
+        for i, date in enumerate(dates)
+    ])
+    df['inc_trans_cs'] = np.random.default_rng(1).normal(size=len(df))
+    df['log_pop'] = 15.0
+    args = {'incl_level_feats': True, 'max_horizon': 3,
+            'curr_feat_names': ['inc_trans_cs', 'season_week', 'log_pop'],
+            'categorical_encoding': 'categorical'}
+    expanded, feat_names = create_features_and_targets(df, **args)
+    df, feat_names_h = create_features_and_targets(df, expand_horizons=False, **args)
+    assert feat_names_h == feat_names
+    return expanded, df, feat_names
+
+
+def test_from_frame_with_horizons(featurized):
+    expanded, df, feat_names = featurized
+    dm = DesignMatrix.from_frame(expanded, feat_names, target='delta_target',
+                                 metadata_columns=['location', 'horizon'],
+                                 rows=np.flatnonzero(expanded['season_week'] >= 10))
+    dm_h = DesignMatrix.from_frame(df, feat_names, target='delta_target',
+                                   metadata_columns=['location'],
+                                   rows=np.flatnonzero(df['season_week'] >= 10), horizons=[1, 2, 3])
+
+    # features are stored once per row of `df`
+    assert len(dm_h.x) * 3 == len(dm.x)
+    assert len(dm_h) == len(dm)
+    rows = np.arange(len(dm))
+    np.testing.assert_array_equal(dm_h.take(rows), dm.take(rows))
+    assert dm_h.take(rows).flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(dm_h.y, dm.y)
+    np.testing.assert_array_equal(dm_h.seasons[dm_h.season_codes], dm.seasons[dm.season_codes])
+    assert dm_h.categorical_features == dm.categorical_features
+    pd.testing.assert_frame_equal(dm_h.row_metadata(rows[5:]), dm.row_metadata(rows[5:]))
+
+
+def test_lgb_dataset(featurized):
+    _, df, feat_names = featurized
+    dm = DesignMatrix.from_frame(df, feat_names, target='delta_target', horizons=[1, 2, 3])
+    rows = np.flatnonzero(~np.isnan(dm.y))
+    x = dm.take(rows)
+    params = {'objective': 'quantile', 'alpha': 0.3, 'verbosity': -1}
+
+    # rows materialized at once, and read in batches, with bins from a sample
+    # drawn with the seed of the dataset
+    for dataset_params in [{}, {'bin_construct_sample_cnt': len(rows) - 10, 'data_random_seed': 3}]:
+        expected = lgb.train({**params, **dataset_params},
+                             lgb.Dataset(x, dm.y[rows], categorical_feature=dm.categorical_features),
+                             num_boost_round=10).predict(x)
+        dataset = dm.lgb_dataset(rows, dataset_params, batch_size=50)
+        # the dataset can be reused, e.g. for several quantile levels
+        for _ in range(2):
+            booster = lgb.train({**params, 'seed': 1}, dataset, num_boost_round=10)
+            np.testing.assert_array_equal(booster.predict(x), expected)
@@ -0,0 +1,141 @@
+import copy
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from feature_engine import featurize_data, feature_names, taylor_projection
+from preprocess import WINDOW_FEATURES
+
+
+@pytest.fixture
+def df():
+    # four groups of different lengths with interleaved rows and missing values
+    rng = np.random.default_rng(42)
+    n = 90
+    df = pd.DataFrame({
+        'source': rng.choice(['hhs', 'ilinet'], size=n),
+        'location': rng.choice(['US', '25'], size=n, p=[0.7, 0.3]),
+        'inc_trans_cs': rng.normal(size=n)
+    })
+    df.loc[[10, 50], 'inc_trans_cs'] = np.nan
+    df.index = df.index + 100
+    return df
+
+
+def _taylor_reference(x, taylor_degree, window_size):
+    # least-squares fit of each trailing window, missing for the first
+    # `window_size` rows as in timeseriesutils
+    design = np.stack([(np.arange(window_size) - window_size + 1.0)**k / math.factorial(k)
+                       for k in range(taylor_degree + 1)], axis=1)
+    result = np.full((len(x), taylor_degree + 1), np.nan)
+    for t in range(window_size, len(x)):
+        window = x[t - window_size + 1:t + 1]
+        if not np.isnan(window).any():
+            result[t] = np.linalg.lstsq(design, window, rcond=None)[0]
+    return result
+
+
+def test_taylor_projection():
+    # coefficients of a quadratic are recovered exactly: value, first and
+    # second derivatives at the last point of the window
+    x = np.arange(6) - 5.0
+    y = 1.5 - 0.5 * x + 0.25 * x**2
+    np.testing.assert_allclose(taylor_projection(2, 6) @ y, [1.5, -0.5, 0.5], atol=1e-12)
+    np.testing.assert_allclose(taylor_projection(1, 3) @ np.array([1.0, 2.0, 4.0]), [23 / 6, 1.5])
+
+    with pytest.raises(ValueError):
+        taylor_projection(2, 2)
+
+
+def test_windowed_features(df):
+    result, feat_names = featurize_data(df, group_columns=['source', 'location'],
+                                        features=WINDOW_FEATURES)
+    assert feat_names == [name for feature in WINDOW_FEATURES for name in feature_names(feature)]
+    assert list(result.columns) == list(df.columns) + feat_names
+    pd.testing.assert_index_equal(result.index, df.index)
+
+    for _, grp in df.groupby(['source', 'location']):
+        x = grp['inc_trans_cs'].to_numpy()
+        for taylor_degree, window_size in [(2, 4), (2, 6), (1, 3), (1, 5)]:
+            expected = _taylor_reference(x, taylor_degree, window_size)
+            for k in range(taylor_degree + 1):
+                name = f'inc_trans_cs_taylor_d{taylor_degree}_c{k}_w{window_size}t_sNone'
+                np.testing.assert_allclose(result.loc[grp.index, name], expected[:, k], atol=1e-12)
+
+    # rolling means are grouped by location only, as specified in WINDOW_FEATURES
+    for w in [2, 4]:
+        expected = df.groupby('location')['inc_trans_cs'].rolling(w).mean() \
+            .reset_index(level=0, drop=True)
+        np.testing.assert_allclose(result[f'inc_trans_cs_rollmean_w{w}'], expected.loc[df.index],
+                                   atol=1e-12)
+
+
+def test_lags_and_horizon_targets(df):
+    df['inc_trans_cs'] = df['inc_trans_cs'].astype(np.float32)
+    result, feat_names = featurize_data(
+        df, group_columns=['source', 'location'],
+        features=[
+            {'fun': 'rollmean', 'args': {'columns': 'inc_trans_cs', 'window_size': [2]}},
+            {'fun': 'lag', 'args': {'columns': ['inc_trans_cs', 'inc_trans_cs_rollmean_w2'],
+                                    'lags': [1, 2]}},
+            {'fun': 'horizon_targets', 'args': {'columns': 'inc_trans_cs', 'horizons': [1, 2, 3]}}
+        ])
+
+    assert feat_names == ['inc_trans_cs_rollmean_w2', 'inc_trans_cs_lag1', 'inc_trans_cs_lag2',
+                          'inc_trans_cs_rollmean_w2_lag1', 'inc_trans_cs_rollmean_w2_lag2', 'horizon']
+    assert list(result.columns[-2:]) == ['inc_trans_cs_target', 'horizon']
+    assert result['horizon'].dtype == np.int64
+    # one block of rows per horizon, with the index of the input
+    pd.testing.assert_index_equal(result.index, df.index.append([df.index, df.index]))
+    assert result['inc_trans_cs_lag1'].dtype == np.float32
+
+    g = df.assign(rm=result.loc[result['horizon'] == 1, 'inc_trans_cs_rollmean_w2']) \
+        .groupby(['source', 'location'])
+    for h in [1, 2, 3]:
+        block = result.loc[result['horizon'] == h]
+        pd.testing.assert_series_equal(block['inc_trans_cs_lag2'], g['inc_trans_cs'].shift(2),
+                                       check_names=False)
+        pd.testing.assert_series_equal(block['inc_trans_cs_rollmean_w2_lag1'], g['rm'].shift(1),
+                                       check_names=False)
+        pd.testing.assert_series_equal(block['inc_trans_cs_target'], g['inc_trans_cs'].shift(-h),
+                                       check_names=False)
+
+    with pytest.raises(ValueError):
+        featurize_data(df, ['location'], [
+            {'fun': 'horizon_targets', 'args': {'columns': 'inc_trans_cs', 'horizons': [1]}},
+            {'fun': 'lag', 'args': {'columns': 'inc_trans_cs', 'lags': [1]}}])
+
+
+def test_horizon_targets_without_expanding_rows(df):
+    features = [
+        {'fun': 'lag', 'args': {'columns': 'inc_trans_cs', 'lags': [1]}},
+        {'fun': 'horizon_targets', 'args': {'columns': 'inc_trans_cs', 'horizons': [1, 3]}}
+    ]
+    expanded, expanded_names = featurize_data(df, ['source', 'location'], features)
+    features[-1]['args']['expand_rows'] = False
+    result, feat_names = featurize_data(df, ['source', 'location'], features)
+
+    assert feat_names == ['inc_trans_cs_lag1']
+    assert list(result.columns) == list(df.columns) + feat_names + \
+        ['inc_trans_cs_target_h1', 'inc_trans_cs_target_h3']
+    pd.testing.assert_index_equal(result.index, df.index)
+    for h in [1, 3]:
+        block = expanded.loc[expanded['horizon'] == h]
+        pd.testing.assert_frame_equal(result[feat_names], block[feat_names])
+        pd.testing.assert_series_equal(result[f'inc_trans_cs_target_h{h}'],
+                                       block['inc_trans_cs_target'], check_names=False)
+
+
+def test_matches_timeseriesutils(df):
+    featurize = pytest.importorskip('timeseriesutils.featurize')
+    features = WINDOW_FEATURES + [
+        {'fun': 'lag', 'args': {'columns': ['inc_trans_cs'], 'lags': [1, 2]}},
+        {'fun': 'horizon_targets', 'args': {'columns': 'inc_trans_cs', 'horizons': [1, 2, 3]}}
+    ]
+    expected, expected_names = featurize.featurize_data(
+        df.copy(), group_columns=['source', 'location'], features=copy.deepcopy(features))
+    result, names = featurize_data(df, group_columns=['source', 'location'], features=features)
+
+    assert names == expected_names
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, atol=1e-10)
@@ -0,0 +1,68 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from feature_store import FeatureStore
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'location': ['US', 'US', '25', '25'],
+        'wk_end_date': pd.to_datetime(['2024-01-06', '2024-01-13'] * 2),
+        'inc_trans_cs': [0.1, 0.2, np.nan, 0.4],
+        'horizon': [1, 1, 1, 1]
+    })
+
+
+def test_put_get_round_trip(tmp_path, df):
+    store = FeatureStore(tmp_path / 'store')
+    spec = {'max_horizon': 5}
+    key = store.key(df, spec)
+    assert store.get(key) is None
+
+    store.put(key, df, ['inc_trans_cs', 'horizon'], spec=spec)
+    result, feat_names = store.get(key)
+    pd.testing.assert_frame_equal(result, df, check_exact=True)
+    assert feat_names == ['inc_trans_cs', 'horizon']
+    assert store.info(key)['spec'] == spec
+
+    # storing a key again keeps the first entry
+    store.put(key, df.head(1), ['horizon'])
+    assert store.get(key)[1] == ['inc_trans_cs', 'horizon']
+    assert list(store.entries()['key']) == [key]
+
+
+def test_key_depends_on_data_and_spec(tmp_path, df):
+    store = FeatureStore(tmp_path)
+    key = store.key(df, {'max_horizon': 5})
+    assert store.key(df.copy(), {'max_horizon': 5}) == key
+    assert store.key(df, {'max_horizon': 4}) != key
+
+    changed = df.copy()
+    changed.loc[3, 'inc_trans_cs'] = 0.5
+    assert store.key(changed, {'max_horizon': 5}) != key
+    assert store.key(df.astype({'horizon': 'float64'}), {'max_horizon': 5}) != key
+
+
+def test_gc(tmp_path, df):
+    store = FeatureStore(tmp_path)
+    keys = [store.key(df, {'i': i}) for i in range(3)]
+    for i, key in enumerate(keys):
+        store.put(key, df, ['inc_trans_cs'])
+        # last used 10, 5, and 0 days ago
+        used = time.time() - (10 - 5 * i) * 86400
+        os.utime(tmp_path / key / 'features.arrow', (used, used))
+
+    assert store.gc(max_age_days=7, dry_run=True) == [keys[0]]
+    assert len(store.entries()) == 3
+
+    assert store.gc(max_age_days=7) == [keys[0]]
+    assert set(store.entries()['key']) == set(keys[1:])
+
+    # a size limit of one entry keeps the most recently used entry
+    size_gb = store.entries()['size_mb'].iloc[0] / 2**10
+    assert store.gc(max_size_gb=size_gb * 1.5) == [keys[1]]
+    assert list(store.entries()['key']) == [keys[2]]
@@ -21,6 +21,9 @@ def parse_args():
             last observed data
         - `q_levels`: list of floats with quantile levels for predictions
         - `q_labels`: list of strings with names for the quantile levels
+        - `compact`: boolean, whether to load data with compact dtypes
+        - `feature_store_root`: `pathlib.Path` object with the root directory of
+            a `feature_store.FeatureStore` for featurized data, or None
     '''
     parser = _make_parser()
     args = parser.parse_args()
@@ -34,7 +37,9 @@ def parse_args():
         ref_date=ref_date,
         output_root=args.output_root,
         artifact_store_root=args.artifact_store_root,
-        save_feat_importance=args.save_feat_importance
+        save_feat_importance=args.save_feat_importance,
+        compact=args.compact,
+        feature_store_root=args.feature_store_root
     )
     
     if args.short_run:
@@ -88,6 +93,15 @@ def _make_parser():
     parser.add_argument('--save_feat_importance',
                         help='Flag to save feature importances',
                         action='store_true')
+    parser.add_argument('--compact',
+                        help='Flag to load data with categorical and float32 dtypes to reduce memory use; ' +
+                             'predictions may differ slightly from a default run',
+                        action='store_true')
+    parser.add_argument('--feature_store_root',
+                        help='Path to a directory in which featurized data are stored and reused ' +
+                             'by later runs with the same data and feature settings',
+                        type=lambda s: Path(s),
+                        default=None)
     
     return parser
 
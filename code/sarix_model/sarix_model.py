@@ -8,10 +8,9 @@ import datetime
 import math
 import numpy as np
 import pandas as pd
-from pandas.tseries.holiday import USFederalHolidayCalendar
 
-import datetime
-import pymmwr
+from data_pipeline import mmwr, normalization, panel, schemas
+from data_pipeline.utils import get_holidays
 
 from sarix import sarix
 
@@ -41,64 +40,13 @@ transforms = ['sqrt', '4rt']
 
 
 
-def date_to_ew_str(row, date_col_name='wk_end_date'):
-    ew = pymmwr.date_to_epiweek(datetime.date.fromisoformat(row[date_col_name]))
-    # ew_str = pd.Series(str(ew.year) + str(ew.week))
-    ew_str = str(ew.year) + str(ew.week)
-    return ew_str
-
-
-
-# convert epi week to season week
-def convert_epiweek_to_season_week(epiweek):
-  """Convert season and epiweek to season and season week.
-  Args:
-      epiweek in format 'yyyyww'
-  Return:
-      season_week: integer between 1 and 52
-  """
-  epiweek_year = epiweek.str[:4].astype(int)
-  epiweek_week = epiweek.str[4:].astype(int)
-  
-  season_week = epiweek_week - 30
-
-  update_inds = (season_week <= 0)
-  season_week[update_inds] = season_week[update_inds] + \
-    [pymmwr.epiweeks_in_year(int(epiweek_year[update_inds].values[i]) - 1) for i in range(np.sum(update_inds))]
-  
-  return season_week
-
-
-
-def convert_epiweek_to_season(epiweek):
-  """Convert season and epiweek to season and season week.
-  Args:
-      epiweek in format 'yyyyww'
-  Return:
-      season: string in format '2018/19'
-  """
-  epiweek_year = epiweek.str[:4].astype(int)
-  epiweek_week = epiweek.str[4:].astype(int)
-  
-  update_inds = (epiweek_week <= 30)
-  epiweek_year = epiweek_year - update_inds
-  season = epiweek_year.astype(str)
-  season = season + '/' + (season.str[-2:].astype(int) + 1).astype(str)
-  
-  return season
-
-
-
 def load_fips_mappings():
-  return pd.read_csv('../../data-raw/fips-mappings/fips_mappings.csv')
+  return schemas.FIPS_MAPPINGS.read('../../data-raw/fips-mappings/fips_mappings.csv')
 
 
 
 def load_flusurv_rates_2022_23():
-  dat = pd.read_csv('../../data-raw/influenza-flusurv/flusurv-rates/flusurv-rates-2022-23.csv',
-                    encoding='ISO-8859-1',
-                    engine='python')
-  dat.columns = dat.columns.str.lower()
+  dat = schemas.FLUSURV_RATES_2022_23.read('../../data-raw/influenza-flusurv/flusurv-rates/flusurv-rates-2022-23.csv')
   
   dat = dat.loc[(dat['age category'] == 'Overall') &
                 (dat['sex category'] == 'Overall') &
@@ -110,15 +58,8 @@ def load_flusurv_rates_2022_23():
   dat['location'] = dat['catchment']
   dat['agg_level'] = np.where(dat['location'] == 'Entire Network', 'national', 'site')
   dat['season'] = dat['year'].str.replace('-', '/')
-  epiweek = dat['mmwr-year'].astype(str) + dat['mmwr-week'].astype(str)
-  dat['season_week'] = convert_epiweek_to_season_week(epiweek)
-  dat['wk_end_date'] = dat.apply(
-    lambda x: pymmwr.epiweek_to_date(pymmwr.Epiweek(year=x['mmwr-year'],
-                                                    week=x['mmwr-week'],
-                                                    day=7))
-                                    .strftime("%Y-%m-%d"),
-      axis=1)
-  dat['wk_end_date'] = pd.to_datetime(dat['wk_end_date'])
+  dat['season_week'] = mmwr.epiweek_to_season_week(dat['mmwr-year'], dat['mmwr-week'])
+  dat['wk_end_date'] = pd.to_datetime(mmwr.epiweek_to_date(dat['mmwr-year'], dat['mmwr-week']))
   dat['inc'] = dat['weekly rate ']
   dat = dat[['agg_level', 'location', 'season', 'season_week', 'wk_end_date', 'inc']]
   
@@ -134,10 +75,7 @@ def load_flusurv_rates_base(seasons=None,
                             age_labels=['0-4 yr', '5-17 yr', '18-49 yr', '50-64 yr', '65+ yr', 'Overall']
                             ):
   # read flusurv data and do some minimal preprocessing
-  dat = pd.read_csv('../../data-raw/influenza-flusurv/flusurv-rates/old-flusurv-rates.csv',
-                    encoding='ISO-8859-1',
-                    engine='python')
-  dat.columns = dat.columns.str.lower()
+  dat = schemas.OLD_FLUSURV_RATES.read('../../data-raw/influenza-flusurv/flusurv-rates/old-flusurv-rates.csv')
   dat['season'] = dat.sea_label.str.replace('-', '/')
   dat['inc'] = dat.weeklyrate
   dat['location'] = dat['region']
@@ -162,7 +100,7 @@ def load_flusurv_rates_base(seasons=None,
 
 
 def load_one_us_census_file(f):
-  dat = pd.read_csv(f, engine='python', dtype={'STATE': str})
+  dat = schemas.US_CENSUS.read(f)
   dat = dat.loc[(dat['NAME'] == 'United States') | (dat['STATE'] != '00'),
                 (dat.columns == 'STATE') | (dat.columns.str.startswith('POPESTIMATE'))]
   dat = dat.melt(id_vars = 'STATE', var_name='season', value_name='pop')
@@ -180,7 +118,7 @@ def load_us_census(fillna = True):
     '../../data-raw/us-census/NST-EST2022-ALLDATA.csv']
   us_pops = pd.concat([load_one_us_census_file(f) for f in files], axis=0)
   
-  fips_mappings = pd.read_csv('../../data-raw/fips-mappings/fips_mappings.csv')
+  fips_mappings = load_fips_mappings()
   
   hhs_pops = us_pops.query("location != 'US'") \
     .merge(
@@ -214,9 +152,8 @@ def load_us_census(fillna = True):
 
 
 def load_hosp_burden():
-  burden_estimates = pd.read_csv(
-    '../../data-raw/burden-estimates/burden-estimates.csv',
-    engine='python')
+  burden_estimates = schemas.BURDEN_ESTIMATES.read(
+    '../../data-raw/burden-estimates/burden-estimates.csv')
 
   burden_estimates.columns = ['season', 'hosp_burden']
 
@@ -292,9 +229,7 @@ def load_flusurv_rates(burden_adj=True,
 
 
 def load_who_nrevss_positive():
-  dat = pd.read_csv('../../data-raw/influenza-who-nrevss/who-nrevss.csv',
-                    encoding='ISO-8859-1',
-                    engine='python')
+  dat = schemas.WHO_NREVSS.read('../../data-raw/influenza-who-nrevss/who-nrevss.csv')
   dat = dat[['region_type', 'region', 'year', 'week', 'season', 'season_week', 'percent_positive']]
   
   dat.rename(columns={'region_type': 'agg_level', 'region': 'location'},
@@ -314,7 +249,7 @@ def load_ilinet(response_type='rate',
            '../../data-raw/influenza-ilinet/ilinet_hhs.csv',
            '../../data-raw/influenza-ilinet/ilinet_state.csv']
   dat = pd.concat(
-    [ pd.read_csv(f, encoding='ISO-8859-1', engine='python') for f in files ],
+    [ schemas.ILINET.read(f) for f in files ],
     axis = 0)
   
   if response_type == 'rate':
@@ -374,12 +309,12 @@ def load_ilinet(response_type='rate',
 
 
 def load_hhs(rates=True):
-  dat = pd.read_csv("../../data-raw/influenza-hhs/hhs.csv")
+  dat = schemas.HHS.read("../../data-raw/influenza-hhs/hhs.csv")
   dat.rename(columns={'date': 'wk_end_date'}, inplace=True)
 
-  ew_str = dat.apply(date_to_ew_str, axis=1)
-  dat['season'] = convert_epiweek_to_season(ew_str)
-  dat['season_week'] = convert_epiweek_to_season_week(ew_str)
+  ew_year, ew_week = mmwr.date_to_epiweek(dat['wk_end_date'])
+  dat['season'] = mmwr.epiweek_to_season(ew_year, ew_week)
+  dat['season_week'] = mmwr.epiweek_to_season_week(ew_year, ew_week)
   dat = dat.sort_values(by=['season', 'season_week'])
   
   if rates:
@@ -396,42 +331,9 @@ def load_hhs(rates=True):
 
 
 
-def get_season_hol(start_year):
-  holiday_cal = USFederalHolidayCalendar()
-  hol = holiday_cal.holidays(
-    start=datetime.datetime(year=start_year, month=7, day=1),
-    end=datetime.datetime(year=start_year+1, month=6, day=1),
-    return_name=True)
-    
-  hol = hol.reset_index()
-  hol.columns = ['date', 'holiday']
-  hol = hol.loc[hol['holiday'].isin(['Thanksgiving', 'Christmas'])]
-  
-  hol['season'] = str(start_year) + '/' + str(start_year + 1)[-2:]
-  
-  return hol
-
-
-
-def convert_datetime_to_season_week(row, date_col_name):
-  ew = pymmwr.date_to_epiweek(row[date_col_name].date())
-  ew_str = pd.Series(str(ew.year) + str(ew.week))
-  return convert_epiweek_to_season_week(ew_str)
-
-
-
-def get_holidays():
-  hol = pd.concat([get_season_hol(sy) for sy in range(1997, 2024)],
-                  ignore_index=True)
-  hol['season_week'] = hol.apply(convert_datetime_to_season_week, axis=1, date_col_name='date')
-  
-  return hol[['season', 'holiday', 'date', 'season_week']]
-
-
-
 def load_data(transform):
   us_census = load_us_census()
-  fips_mappings = pd.read_csv('../../data-raw/fips-mappings/fips_mappings.csv')
+  fips_mappings = load_fips_mappings()
   
   df_hhs = load_hhs()
   df_hhs['inc'] = df_hhs['inc'] + 0.75**4
@@ -515,38 +417,22 @@ def load_data(transform):
   # - divide by location- and source- specific 95th percentile
   # - center relative to location- and source- specific mean
   #   (note non-standard order of center/scale)
-  if transform == '4rt':
-    df['inc_4rt'] = (df['inc'] + 0.01)**0.25
-  elif transform == 'sqrt':
-    df['inc_4rt'] = np.sqrt(df['inc'] + 0.01)
-  
-  df['inc_4rt_scale_factor'] = df \
-    .assign(inc_4rt_in_season = lambda x: np.where((x['season_week'] < 10) | (x['season_week'] > 45),
-                                                   np.nan,
-                                                   x['inc_4rt'])) \
-    .groupby(['source', 'location'])['inc_4rt_in_season'] \
-    .transform(lambda x: x.quantile(0.95))
+  norm = normalization.Normalization.fit(df, power_transform=transform)
+  df_trans = norm.transform(df, prefix='inc_4rt')
+  for c in df_trans.columns:
+    df[c] = df_trans[c].values
   
-  df['inc_4rt_cs'] = df['inc_4rt'] / (df['inc_4rt_scale_factor'] + 0.01)
-  df['inc_4rt_center_factor'] = df \
-    .assign(inc_4rt_cs_in_season = lambda x: np.where((x['season_week'] < 10) | (x['season_week'] > 45),
-                                                   np.nan,
-                                                   x['inc_4rt_cs'])) \
-    .groupby(['source', 'location'])['inc_4rt_cs_in_season'] \
-    .transform(lambda x: x.mean())
-  df['inc_4rt_cs'] = df['inc_4rt_cs'] - df['inc_4rt_center_factor']
-  
-  return(df)
+  return df, norm
 
 
 
 def get_sarix_preds(transform):
-  df = load_data(transform)
+  df, norm = load_data(transform)
   
   # season week relative to christmas
   df = df.merge(
       get_holidays() \
-        .query("holiday == 'Christmas'") \
+        .query("holiday == 'Christmas Day'") \
         .drop(columns=['holiday', 'date']) \
         .rename(columns={'season_week': 'xmas_week'}),
       how='left',
@@ -556,7 +442,11 @@ def get_sarix_preds(transform):
   
   df_hhs = df.loc[df['source'] == 'hhs']
 
-  batched_xy = df_hhs[["inc_4rt_cs", "xmas_spike"]].values.reshape(len(df_hhs['location'].unique()), -1, 2)
+  # array of shape (location, time, 2); SARIX cannot fit to missing values, so
+  # every location must be observed in every week
+  hhs_panel = panel.Panel.from_frame(df_hhs, features=["inc_4rt_cs", "xmas_spike"])
+  hhs_panel.check_complete()
+  batched_xy = hhs_panel.sel(source='hhs')
 
   sarix_fit_all_locs_theta_pooled = sarix.SARIX(
     xy = batched_xy,
@@ -576,7 +466,10 @@ def get_sarix_preds(transform):
   pred_qs = np.percentile(sarix_fit_all_locs_theta_pooled.predictions[..., :, :, 0],
                         np.array(q_levels) * 100, axis=0)
   
-  df_hhs_last_obs = df_hhs.groupby(['location']).tail(1)
+  df_hhs_last_obs = df_hhs.groupby(['location']).tail(1) \
+    .set_index('location') \
+    .loc[hhs_panel.locations] \
+    .reset_index()
   
   preds_df = pd.concat([
     pd.DataFrame(pred_qs[i, :, :]) \
@@ -589,13 +482,7 @@ def get_sarix_preds(transform):
     .merge(df_hhs_last_obs, on='location', how='left')
   
   # build data frame with predictions on the original scale
-  preds_df['value'] = (preds_df['value'] + preds_df['inc_4rt_center_factor']) * preds_df['inc_4rt_scale_factor']
-  if transform == '4rt':
-    preds_df['value'] = np.maximum(preds_df['value'], 0.0) ** 4
-  else:
-    preds_df['value'] = np.maximum(preds_df['value'], 0.0) ** 2
-  
-  preds_df['value'] = (preds_df['value'] - 0.01 - 0.75**4) * preds_df['pop'] / 100000
+  preds_df['value'] = (norm.inverse(preds_df, preds_df['value']) - 0.75**4) * preds_df['pop'] / 100000
   preds_df['value'] = np.maximum(preds_df['value'], 0.0)
 
   # keep just required columns and rename to match hub format